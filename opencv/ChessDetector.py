@@ -1,8 +1,26 @@
 import pretreatment
 import cv2
 import numpy as np
+import os
+import sys
 import time
+import threading
+import argparse
 import serial_test
+import camera
+import profiler
+import debounce
+import motion
+import tracker
+import hsv_frame
+import color_lut
+import calibration
+import background
+
+# 三子棋的规则、完美对弈引擎和开局库位于仓库的 "三子棋测试" 目录中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "三子棋测试", "三子棋测试"))
+import opening_book
+from pretreatment import DEBUG_OFF, DEBUG_RESULT, DEBUG_VERBOSE
 
 # --- 状态常量定义 ---
 # 用于表示棋盘格子的状态
@@ -11,6 +29,27 @@ OCCUPIED = 1  # 非空格子 (有棋子，但颜色未知)
 HUMAN = 2  # 人类棋子 (白色)
 ROBOT = 3  # 机器人棋子 (黑色)
 
+# --- 红色掩码去噪方式 ---
+# "median_chain": 5次5x5中值滤波 + 2次3x3开运算，原有的做法，作为精度基准
+# "median": 一次较大核的中值滤波
+# "box": 均值滤波后重新二值化。对二值掩码来说等价于邻域内多数表决 (即中值)，但比中值滤波快得多
+# "components": 连通域面积过滤，去掉面积很小的红色噪点，并填上面积很小的空洞
+DENOISE_MODES = ("median_chain", "median", "box", "components")
+# 棋盘ROI在格子边界框并集的基础上向外扩展的像素数，
+# 保证ROI边缘的格子像素看到的邻域与在整帧上滤波时相同 (5次5x5中值 + 2次3x3开运算的影响半径为14)
+ROI_MARGIN = 16
+
+# --- 格子几何的坐标系 ---
+# "roi": 在裁剪后图像的棋盘ROI上按格子轮廓统计 (原有的做法)
+# "rectified": 先用预先计算好的映射表把棋盘透视校正为 RECTIFIED_SIZE x RECTIFIED_SIZE 的标准图像，
+#              九个格子在标准图像中是固定的切片，需要处理的像素数也远少于ROI
+GEOMETRY_MODES = ("roi", "rectified")
+
+# 格子内红色像素比例高于该值时认为格子为空
+EMPTY_RATIO_THRESHOLD = 0.7
+# 背景模型估计的光照 (任一颜色通道) 与标定时相差超过该比例时，识别棋子颜色前先做亮度补偿
+LIGHTING_TOLERANCE = 0.1
+
 class ChessDetector:
     """
     一个集成了棋盘检测、棋子识别、状态更新和串口通信的综合类。
@@ -20,12 +59,21 @@ class ChessDetector:
     - 判断棋子的移动和新落子。
     - 通过串口与下位机（如单片机）通信，发送指令和接收状态。
     """
-    def __init__(self, cap):
+    def __init__(self, cap, debug=DEBUG_VERBOSE, use_serial=True, profile=True, calibration_store=None):
         """
         初始化棋盘检测器。
-        :param cap: cv2.VideoCapture 对象，用于从摄像头读取帧。
+        :param cap: 画面源，cv2.VideoCapture 或 camera.py 中的画面源对象。
+        :param debug: 调试等级。DEBUG_OFF 为生产模式，不做任何调试绘制和窗口显示；
+                      DEBUG_RESULT 只显示空格子检测结果；DEBUG_VERBOSE 额外显示各个中间掩码。
+        :param use_serial: 是否连接下位机。离线回放录像时为 False，不打开任何串口。
+        :param profile: 是否统计流水线各个阶段的耗时，结果保存在 self.profiler 中。
+        :param calibration_store: 可选，calibration.CalibrationStore。标定文件中的阈值覆盖下面的默认阈值，
+                                  文件变化后自动重新读取，无需重启程序或重新初始化棋盘。
         """
         self.cap = cap
+        self.debug = debug
+        # 分阶段耗时统计，关闭时计时器为空操作
+        self.profiler = profiler.StageProfiler(enabled=profile)
         # 棋盘状态数组，记录每个格子的状态
         # 状态数组：prev_state为上一帧状态，current_state为当前帧状态
         # 初始化状态数组
@@ -39,32 +87,165 @@ class ChessDetector:
         # 轮廓坐标
         self.grid_rois = [None] * 9
 
+        # --- 棋盘ROI ---
+        # 棋盘初始化完成后位置就固定了，每一帧只需对棋盘所在的窗口做颜色转换、阈值和滤波。
+        # ROI为九个格子边界框的并集向外扩展 ROI_MARGIN 像素，在 build_cell_cache 中计算
+        # ROI在裁剪后图像中的切片 (slice_y, slice_x)，未初始化时为 None，表示使用整张图像
+        self.roi_slice = None
+        # ROI左上角在裁剪后图像中的坐标 (x, y)
+        self.roi_offset = (0, 0)
+        # 平移到ROI坐标系下的格子轮廓
+        self.roi_grid_rois = [None] * 9
+
+        # --- 透视校正 ---
+        # 格子几何的坐标系，见 GEOMETRY_MODES
+        self.geometry_mode = "roi"
+        # 当前的棋盘四个顶点 (裁剪后图像坐标)，用于计算透视校正映射表
+        self.board_corners = None
+        # 上一次构建几何缓存时的 编号图坐标 -> 裁剪后图像坐标 矩阵和棋盘对应点，
+        # 棋盘移动后用来把背景模型变换到新的坐标系，见 move_background()
+        self._view_to_crop = None
+        self._geometry_points = None
+        # 格子几何缓存当前是否使用标准图像坐标系 (找不到棋盘顶点时退回ROI坐标系)
+        self.rectified = False
+
+        # --- 每帧的HSV缓存 ---
+        # 棋盘图像只转换一次HSV，空格子检测和颜色识别共用转换结果和各个阈值的掩码，见 board_hsv()
+        self.frame_hsv = hsv_frame.HSVFrame()
+        # frame_hsv 当前对应的裁剪后图像
+        self._frame_hsv_source = None
+
+        # --- 格子几何缓存 ---
+        # 棋盘初始化完成后，格子的轮廓就不再变化，因此在 init() 中一次性计算好，
+        # 每一帧只需在小切片上求和，无需再分配整帧大小的掩码。
+        # 以下切片和编号图都使用 board_view() 返回的图像的坐标系 (ROI或透视校正后的标准图像)
+        # 每个格子边界框对应的切片 (slice_y, slice_x)
+        self.cell_slices = [None] * 9
+        # 裁剪到边界框大小的布尔掩码，True 表示属于该格子
+        self.cell_masks = [None] * 9
+        # 每个格子的轮廓面积
+        self.cell_areas = [0.0] * 9
+        # 九个格子边界框的并集所对应的切片，即棋盘所在的窗口
+        self.board_slice = None
+        # 格子编号图：与棋盘窗口同尺寸，0 表示背景，1..9 表示对应的格子
+        self.cell_label_map = None
+
+        # --- 占用率计算模式 ---
+        # "batched": 用格子编号图对整张红色掩码做一次 np.bincount，同时得到九个格子的计数
+        # "per_cell": 逐个格子在各自的边界框切片上计数
+        self.occupancy_mode = "batched"
+
+        # --- 红色掩码去噪 ---
+        # 去噪方式，见 DENOISE_MODES。可以用 denoise_benchmark.py 在录像上比较各种方式的耗时和准确度
+        self.denoise_mode = "median_chain"
+        # "median" 和 "box" 方式的滤波核大小 (奇数)
+        self.denoise_kernel = 9
+        # "components" 方式中，面积小于该值 (像素) 的红色连通域和空洞被视为噪声
+        self.denoise_min_area = 60
+
         self.pretreatment = None
         self.grids = None
 
         # --- 颜色阈值定义 ---
         # HSV颜色空间中的阈值，格式为 (H_min, S_min, V_min, H_max, S_max, V_max)
         # 这些值可能需要根据实际的光照条件和摄像头参数进行调整。
-        # 可以使用项目中的 hsv_tuner.py 工具来辅助标定。
+        # 可以使用项目中的 hsv_tuner.py 工具来辅助标定，并直接写入标定文件 (见 calibration.py)。
+        # 识别棋盘轮廓的阈值 (传给 Pretreatment 的 black_threshold)
+        self.board_threshold = (143, 105, 159, 179, 255, 255)
         # 红色棋盘背景阈值
         self.red_board_threshold = (143, 105, 159, 179, 255, 255)
         # 白色棋子HSV阈值 (低饱和度, 高亮度)
         self.white_piece_threshold = (24, 0, 224, 160, 255, 255)
         # 黑色棋子HSV阈值 (低亮度)
         self.black_piece_threshold = (4, 12, 49, 162, 44, 209)
+        # 由以上三个阈值生成的 BGR -> 颜色类别 查找表，一次查表同时得到红色、白色和黑色像素。
+        # 通过 color_classifier() 获取，阈值改变后会自动重建
+        self.color_lut = color_lut.ColorLUT()
+        # 标定文件变化后在后台线程中重建的查找表: (线程, 新的查找表)，没有正在重建的表时为 None。
+        # 建表约需0.3秒，在主循环中同步重建会卡住画面，建好之前继续使用原来的表
+        self._lut_build = None
+
+        # --- 标定文件 ---
+        # 以上阈值作为默认值保存下来，标定文件中删除某一项后恢复为默认值
+        self.default_thresholds = {key: getattr(self, f"{key}_threshold") for key in calibration.THRESHOLD_KEYS}
+        # 为 None 时只使用上面的默认阈值
+        self.calibration = calibration_store
+        if self.calibration is not None:
+            try:
+                self.apply_calibration(self.calibration.load())
+            except (ValueError, OSError) as e:
+                print(f"警告: 标定文件读取失败，使用默认阈值: {e}")
+
+        # --- 时间滤波 (去抖动) ---
+        # 每个格子最近 5 帧中至少 4 帧一致，并且保持 0.3 秒后才认为状态发生了变化，
+        # 手从棋盘上方经过时不会产生虚假的落子/移动事件。设为 None 则关闭滤波，逐帧比较
+        self.debouncer = debounce.CellDebouncer(num_cells=9, window=5, votes=4, stable_time=0.3)
+
+        # --- 跳帧 ---
+        # 棋盘ROI与上一次处理的帧相比几乎没有变化时，跳过整条识别流水线。设为 None 则每一帧都处理
+        self.motion_gate = motion.MotionGate(scale=8, pixel_threshold=25, area_ratio=0.005)
+
+        # --- 自适应背景 ---
+        # 空格子判断优先与每个格子的滑动背景模型比较 (跟随光照的缓慢变化，并补偿整体亮度变化)，
+        # 还没有背景的格子 (例如初始化后一直有棋子) 仍使用红色阈值。设为 None 则只使用红色阈值
+        self.background = background.CellBackground(alpha=0.02, match_sigma=3.0)
+
+        # --- 棋盘跟踪 ---
+        # 初始化之后用光流跟踪棋盘，棋盘被碰歪时通过单应矩阵更新格子几何信息，
+        # 跟踪丢失时才重新调用 get_grid。设为 None 则初始化后格子位置固定不变
+        self.tracker = tracker.BoardTracker()
+        # 跟踪丢失后，每隔多少帧尝试一次 get_grid 重新定位 (手挡住棋盘时 get_grid 也会失败，不必每帧都试)
+        self.relocate_interval = 15
+        self._frames_since_relocate = 0
 
         # 上一回合落子方
         self.last_move_color = None
+        # 棋盘上每个位置的棋子颜色 (EMPTY / HUMAN / ROBOT)，在识别到新落子时更新
+        # current_state 每一帧都会被空格检测覆盖为 EMPTY / OCCUPIED，无法记录颜色。
+        # 按棋盘位置从左上到右下逐行编号 (与开局库相同)，不是格子索引，见 board_order
+        self.board_colors = [EMPTY] * 9
+        # 棋盘位置 -> 格子索引。格子索引是 get_grid 找到轮廓的顺序，与棋盘上的位置无关，
+        # 在 set_grid_geometry 中按格子中心点重新计算
+        self.board_order = list(range(9))
+
+        # 机器人决策用的开局库: 按8种对称归并后的最佳着法表，启动时 mmap 映射，每步只查表
+        self.opening_book = opening_book.OpeningBook.load_or_build()
 
         # 等待机器人移动完成的标志位
         self.waiting_for_robot_move = False
+        # 机器人指令队列，多步动作依次发送，同时在途的指令数由 robot_command_window 决定。
+        # 目前的固件不会把指令排队 (执行期间收到的指令会被丢掉)，所以为1，见 serial_test.CommandPipeline
+        self.robot_commands = None
+        self.robot_command_window = 1
+        # 已提交、尚未完成的机器人指令序号。只有这些指令全部完成，机器人才真正空闲，
+        # 不会因为另一组指令先完成就提前恢复识别。由串口后台线程和主线程共同访问，用锁保护
+        self._robot_outstanding = set()
+        self._robot_lock = threading.Lock()
 
         # 初始化串口通信
+        self.communicator = None
+        if use_serial:
+            self.init_serial()
+        else:
+            print("\n--- 离线模式: 不连接串口，机器人指令只打印不发送 ---")
+
+    def init_serial(self):
+        """连接下位机，并启动异步收发和机器人指令队列。"""
         try:
             print("\n--- 初始化串口通信 ---")
             self.communicator = serial_test.SerialCommunicator()
             if not self.communicator.ser:
                 print("警告: 串口未连接，将无法发送数据。")
+            else:
+                # 启动异步收发，下位机的返回数据一到达就按协议解析，每解析出一帧
+                # 就调用 on_serial_frame，不再依赖主循环每帧轮询一次
+                self.communicator.start_async(on_frame=self.on_serial_frame)
+                # 确认帧由指令队列负责匹配，全部指令完成后在 on_robot_command_done 中恢复识别
+                self.robot_commands = serial_test.CommandPipeline(
+                    self.communicator,
+                    window=self.robot_command_window,
+                    on_done=self.on_robot_command_done
+                )
         except Exception as e:
             print(f"初始化串口失败: {e}")
             self.communicator = None
@@ -83,7 +264,8 @@ class ChessDetector:
             self.pretreatment = pretreatment.Pretreatment(
                 x_ratio=0.5, 
                 y_ratio=1,
-                black_threshold=(143, 105, 159, 179, 255, 255)
+                black_threshold=self.board_threshold,
+                debug=self.debug
             )
 
         # --- 步骤2: 识别棋盘格子 ---
@@ -97,31 +279,463 @@ class ChessDetector:
             return False
         else:
             # --- 步骤4: 计算并存储格子信息 ---
-            # 如果成功识别到九个格子，则进行后续处理
-            # 将获取到的格子轮廓存储到类的属性中
-            self.grid_rois = self.grids
-            # 遍历这九个格子的轮廓
-            for i in range(9):
-                # --- 计算每个格子的中心点 ---
-                # 使用cv2.moments计算轮廓的"矩"，这是一种分析物体几何特征的方法
-                M = cv2.moments(self.grid_rois[i])
-                # 通过矩来计算轮廓的质心（中心点）
-                # 为了防止除以零的错误，先检查 m00 (面积) 是否不为零
-                if M["m00"] != 0:
-                    # 如果面积不为零，则通过公式计算质心的 x, y 坐标
-                    cX = int(M["m10"] / M["m00"])
-                    cY = int(M["m01"] / M["m00"])
-                    # 将计算出的中心点坐标存储起来
-                    self.grid_centers[i] = (cX, cY)
-                else:
-                    # 如果轮廓面积为零，无法计算质心，则采用备用方案
-                    # 获取轮廓的边界框（能包围轮廓的最小正矩形）
-                    x, y, w, h = cv2.boundingRect(self.grid_rois[i])
-                    # 使用边界框的几何中心作为格子的中心点
-                    self.grid_centers[i] = (x + w // 2, y + h // 2)
+            # 格子轮廓是在裁剪后的图像坐标系中得到的，所以按裁剪后的图像来构建缓存
+            cropped_frame = self.pretreatment.crop(frame, self.pretreatment.x_ratio, self.pretreatment.y_ratio)
+            # 重新初始化时不沿用之前的棋盘位置，背景模型也重新建立
+            self._geometry_points = None
+            self.set_grid_geometry(self.grids, cropped_frame.shape, self.pretreatment.board_corners)
+
+            # --- 步骤5: 以当前画面为参考开始跟踪棋盘 ---
+            self.start_tracking(cropped_frame)
+
+            # --- 步骤6: 提前建好颜色查找表，避免第一帧检测时卡顿 ---
+            self.color_classifier()
             # 所有信息处理完毕，初始化成功，返回 True
             return True
+
+    # 设置格子的几何信息
+    def set_grid_geometry(self, contours, cropped_shape, corners=None):
+        """
+        保存九个格子的轮廓，计算每个格子的中心点，并重建格子几何缓存。
+        初始化时和棋盘跟踪更新格子位置时都会调用。
+        :param contours: 九个格子的轮廓 (裁剪后图像坐标)。
+        :param cropped_shape: 裁剪后图像的尺寸。
+        :param corners: 棋盘的四个顶点 (裁剪后图像坐标)，用于透视校正。为 None 时沿用原来的顶点。
+        """
+        if corners is not None:
+            self.board_corners = corners
+        # 将获取到的格子轮廓存储到类的属性中
+        self.grid_rois = list(contours)
+        # 遍历这九个格子的轮廓
+        for i in range(9):
+            # --- 计算每个格子的中心点 ---
+            # 使用cv2.moments计算轮廓的"矩"，这是一种分析物体几何特征的方法
+            M = cv2.moments(self.grid_rois[i])
+            # 通过矩来计算轮廓的质心（中心点）
+            # 为了防止除以零的错误，先检查 m00 (面积) 是否不为零
+            if M["m00"] != 0:
+                # 如果面积不为零，则通过公式计算质心的 x, y 坐标
+                cX = int(M["m10"] / M["m00"])
+                cY = int(M["m01"] / M["m00"])
+                # 将计算出的中心点坐标存储起来
+                self.grid_centers[i] = (cX, cY)
+            else:
+                # 如果轮廓面积为零，无法计算质心，则采用备用方案
+                # 获取轮廓的边界框（能包围轮廓的最小正矩形）
+                x, y, w, h = cv2.boundingRect(self.grid_rois[i])
+                # 使用边界框的几何中心作为格子的中心点
+                self.grid_centers[i] = (x + w // 2, y + h // 2)
+
+        # --- 棋盘位置与格子索引的对应关系 ---
+        # 按中心点的 y 坐标分成三行，每行内再按 x 坐标排序
+        by_row = sorted(range(9), key=lambda i: self.grid_centers[i][1])
+        self.board_order = [i for row in range(3)
+                            for i in sorted(by_row[row * 3:row * 3 + 3], key=lambda i: self.grid_centers[i][0])]
+
+        # --- 构建格子几何缓存 ---
+        self.build_cell_cache(cropped_shape[:2])
+
+    # --- 棋盘跟踪 ---
+    def start_tracking(self, cropped_frame):
+        """以当前画面和格子位置为参考，开始跟踪棋盘。"""
+        if self.tracker is None or self.pretreatment.board_corners is None:
+            return
+        if not self.tracker.start(cropped_frame, self.pretreatment.board_corners, self.grid_rois):
+            print("警告: 棋盘上可跟踪的特征点太少，棋盘被移动后将无法自动跟踪。")
+        self._frames_since_relocate = 0
+
+    def track_board(self, cropped_frame):
+        """
+        跟踪棋盘位置。棋盘移动时用单应矩阵更新格子几何信息；
+        跟踪丢失时按 relocate_interval 的间隔调用 get_grid 重新定位。
+        """
+        if self.tracker is None or not self.tracker.active:
+            return
+        with self.profiler.stage("track_board"):
+            status = self.tracker.update(cropped_frame)
+
+        if status == tracker.TRACK_MOVED:
+            self.set_grid_geometry(self.tracker.cell_contours(), cropped_frame.shape, self.tracker.corners())
+            # 棋盘可能还在移动，下一帧不跳过，继续跟踪直到稳定
+            if self.motion_gate is not None:
+                self.motion_gate.reset()
+            print(f"棋盘位置已更新 (跟踪置信度 {self.tracker.confidence:.2f})")
+        elif self.tracker.moving and self.motion_gate is not None:
+            # 棋盘疑似被移动，还需要后面几帧确认，下一帧不跳过
+            self.motion_gate.reset()
+        elif status == tracker.TRACK_LOST:
+            self._frames_since_relocate += 1
+            if self._frames_since_relocate >= self.relocate_interval:
+                self._frames_since_relocate = 0
+                self.relocate_board(cropped_frame)
+
+    def relocate_board(self, cropped_frame):
+        """
+        跟踪丢失时重新调用 get_grid 定位棋盘。
+        新找到的格子按中心点与原来的格子一一对应，保持格子编号不变。
+        :return: 重新定位成功时返回 True。
+        """
+        # get_grid 会覆盖 board_corners，定位失败时要恢复原来的顶点，继续用于下一次跟踪和透视校正
+        old_corners = self.pretreatment.board_corners
+        with self.profiler.stage("relocate_board"):
+            grids = self.pretreatment.get_grid(cropped_frame, draw_visuals=False, precropped=True)
+        if grids is None or len(grids) != 9:
+            self.pretreatment.board_corners = old_corners
+            return False
+
+        # 把新轮廓按中心点就近分配给原来的格子编号
+        centers = []
+        for contour in grids:
+            x, y, w, h = cv2.boundingRect(contour)
+            centers.append((x + w / 2, y + h / 2))
+        ordered = [None] * 9
+        remaining = list(range(9))
+        for i in range(9):
+            old = self.grid_centers[i]
+            j = min(remaining, key=lambda k: (centers[k][0] - old[0]) ** 2 + (centers[k][1] - old[1]) ** 2)
+            remaining.remove(j)
+            ordered[i] = grids[j]
+
+        self.grids = ordered
+        self.set_grid_geometry(ordered, cropped_frame.shape, self.pretreatment.board_corners)
+        self.start_tracking(cropped_frame)
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        print("棋盘跟踪丢失，已重新定位棋盘。")
+        return True
+
+    # 构建格子几何缓存
+    def build_cell_cache(self, frame_shape):
+        """
+        根据 grid_rois 计算棋盘ROI，并预先计算每个格子在 board_view() 坐标系下的边界框切片、
+        裁剪后的布尔掩码和面积。
+        geometry_mode 为 "rectified" 时同时计算透视校正映射表，格子几何使用标准图像坐标系。
+        只需在 init() 成功后调用一次，之后每一帧都直接复用这些结果。
+        :param frame_shape: 裁剪后图像的 (高, 宽)，用于把边界框限制在图像范围内。
+        """
+        frame_h, frame_w = frame_shape[:2]
+        # --- 步骤1: 棋盘ROI ---
+        # 每个格子的边界框 (裁剪后图像坐标)，限制在图像范围内
+        boxes = []
+        for contour in self.grid_rois:
+            x, y, w, h = cv2.boundingRect(contour)
+            boxes.append((max(x, 0), max(y, 0), min(x + w, frame_w), min(y + h, frame_h)))
+        # 九个边界框的并集向外扩展 ROI_MARGIN 像素
+        rx0 = max(min(b[0] for b in boxes) - ROI_MARGIN, 0)
+        ry0 = max(min(b[1] for b in boxes) - ROI_MARGIN, 0)
+        rx1 = min(max(b[2] for b in boxes) + ROI_MARGIN, frame_w)
+        ry1 = min(max(b[3] for b in boxes) + ROI_MARGIN, frame_h)
+        self.roi_slice = (slice(ry0, ry1), slice(rx0, rx1))
+        self.roi_offset = (rx0, ry0)
+        for i in range(9):
+            # 轮廓平移到ROI坐标系
+            self.roi_grid_rois[i] = self.grid_rois[i] - np.array([rx0, ry0], dtype=self.grid_rois[i].dtype)
+
+        # --- 步骤1.5: 选择格子几何的坐标系 ---
+        # 透视校正模式下，把格子轮廓用单应矩阵变换到标准图像中；
+        # 找不到棋盘顶点时退回ROI坐标系
+        H = None
+        if self.geometry_mode == "rectified" and self.pretreatment is not None:
+            H = self.pretreatment.build_rectify_maps(self.board_corners)
+        self.rectified = H is not None
+        # 几何变化后，已经缓存的棋盘图像不再对应新的坐标系
+        self._frame_hsv_source = None
+        if self.rectified:
+            view_h = view_w = self.pretreatment.rectified_size
+            view_contours = [np.round(cv2.perspectiveTransform(
+                                 contour.reshape(-1, 1, 2).astype(np.float32), H)).astype(np.int32).reshape(-1, 2)
+                             for contour in self.grid_rois]
+            view_boxes = []
+            for contour in view_contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                view_boxes.append((max(x, 0), max(y, 0), min(x + w, view_w), min(y + h, view_h)))
+        else:
+            view_contours = self.roi_grid_rois
+            view_boxes = [(x0 - rx0, y0 - ry0, x1 - rx0, y1 - ry0) for x0, y0, x1, y1 in boxes]
+
+        # --- 步骤2: 每个格子在 board_view() 坐标系下的几何信息 ---
+        for i in range(9):
+            contour = view_contours[i]
+            x0, y0, x1, y1 = view_boxes[i]
+            self.cell_slices[i] = (slice(y0, y1), slice(x0, x1))
+
+            # 只在边界框大小的画布上填充轮廓，轮廓坐标需要平移到边界框坐标系
+            mask = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=np.uint8)
+            cv2.drawContours(mask, [contour], -1, 255, -1, offset=(-x0, -y0))
+            self.cell_masks[i] = mask > 0
+
+            # 轮廓面积，用于计算红色像素比例
+            self.cell_areas[i] = cv2.contourArea(contour)
+
+        # --- 步骤3: 格子编号图，供批量模式一次性统计九个格子 ---
+        # 编号图只覆盖九个格子边界框的并集，ROI边缘的扩展部分不参与统计
+        by0 = min(sl[0].start for sl in self.cell_slices)
+        by1 = max(sl[0].stop for sl in self.cell_slices)
+        bx0 = min(sl[1].start for sl in self.cell_slices)
+        bx1 = max(sl[1].stop for sl in self.cell_slices)
+        self.board_slice = (slice(by0, by1), slice(bx0, bx1))
+        self.cell_label_map = np.zeros((by1 - by0, bx1 - bx0), dtype=np.uint8)
+        for i in range(9):
+            sy, sx = self.cell_slices[i]
+            local = (slice(sy.start - by0, sy.stop - by0), slice(sx.start - bx0, sx.stop - bx0))
+            self.cell_label_map[local][self.cell_masks[i]] = i + 1
+
+        # --- 步骤4: 背景模型与格子编号图使用同一坐标系 ---
+        # 编号图坐标 -> 裁剪后图像坐标
+        window = np.array([[1, 0, bx0], [0, 1, by0], [0, 0, 1]], dtype=np.float64)
+        if self.rectified:
+            view_to_crop = np.linalg.inv(H) @ window
+        else:
+            view_to_crop = np.array([[1, 0, rx0], [0, 1, ry0], [0, 0, 1]], dtype=np.float64) @ window
+        if self.background is not None:
+            self.move_background(view_to_crop)
+        self._view_to_crop = view_to_crop
+        self._geometry_points = self.geometry_points()
+
+    def geometry_points(self):
+        """
+        返回用于估计棋盘移动的对应点 (裁剪后图像坐标，float32，形状为 (N, 2)):
+        有棋盘顶点时为按固定顺序排列的四个顶点，否则为九个格子的中心点。
+        """
+        if self.board_corners is not None and len(self.board_corners) == 4 and self.pretreatment is not None:
+            return self.pretreatment.order_corners(self.board_corners)
+        return np.array(self.grid_centers, dtype=np.float32)
+
+    def move_background(self, view_to_crop):
+        """
+        格子几何变化后更新背景模型的坐标系。
+        第一次 (init) 时建立新的模型；之后 (棋盘跟踪更新位置、重新定位) 用新旧几何的对应点估计棋盘的移动，
+        把已有的背景变换到新的编号图坐标系。不能重新播种: 光照变化以后，播种依赖的红色阈值已经不可靠。
+        :param view_to_crop: 新的编号图坐标 -> 裁剪后图像坐标 的 3x3 矩阵。
+        """
+        points = self.geometry_points()
+        old = self._geometry_points
+        if self.background.label_map is None or old is None or old.shape != points.shape:
+            self.background.configure(self.cell_label_map)
+            return
+        # 棋盘在裁剪后图像中的移动 (旧位置 -> 新位置)
+        motion, _ = cv2.findHomography(old, points, 0)
+        if motion is None:
+            self.background.configure(self.cell_label_map)
+            return
+        transform = np.linalg.inv(view_to_crop) @ motion @ self._view_to_crop
+        self.background.remap(self.cell_label_map, transform)
+
+    # 获取格子几何缓存所使用的棋盘图像
+    def board_view(self, cropped_frame, interpolation=cv2.INTER_LINEAR):
+        """
+        返回与 cell_slices、cell_masks 等几何缓存同一坐标系的棋盘图像:
+        透视校正模式下为校正后的标准图像 (一次 cv2.remap)，否则为 crop_roi 截取的棋盘ROI。
+        :param cropped_frame: 裁剪后的图像，也可以是与之同尺寸的单通道掩码。
+        :param interpolation: 透视校正时的插值方式，二值掩码请用 cv2.INTER_NEAREST。
+        """
+        if self.rectified:
+            with self.profiler.stage("rectify"):
+                return self.pretreatment.rectify(cropped_frame, interpolation)
+        return self.crop_roi(cropped_frame)
+
+    # 获取这一帧棋盘图像的HSV缓存
+    def board_hsv(self, cropped_frame):
+        """
+        返回这一帧棋盘图像 (board_view) 对应的 HSVFrame。
+        同一帧只截取 (或透视校正) 和转换一次，空格子检测和颜色识别共用HSV图像和阈值掩码。
+        以对象是否相同判断是否为同一帧，主循环每一帧都会得到新的裁剪图像对象。
+        """
+        if self._frame_hsv_source is not cropped_frame:
+            self.frame_hsv.reset(self.board_view(cropped_frame))
+            self._frame_hsv_source = cropped_frame
+        return self.frame_hsv
+
+    # 截取棋盘ROI
+    def crop_roi(self, cropped_frame):
+        """
+        从裁剪后的图像中截取棋盘ROI (不复制数据)。棋盘未初始化时返回整张图像。
+        不使用透视校正时，cell_slices、cell_masks 等几何缓存都以返回的图像为坐标系。
+        """
+        if self.roi_slice is None:
+            return cropped_frame
+        return cropped_frame[self.roi_slice]
+
+    # 统计九个格子内的红色像素比例
+    def compute_occupancy_ratios(self, red_mask):
+        """
+        计算每个格子内红色像素占格子面积的比例。
+        :param red_mask: 棋盘图像上的红色二值掩码 (与 board_view 返回的图像同尺寸)。
+        :return: 长度为9的 numpy 数组，第 i 个元素为第 i 个格子的红色像素比例。
+        """
+        if self.occupancy_mode == "batched":
+            # 只取红色像素所在位置的格子编号，一次 bincount 即可得到全部格子的计数
+            # 下标 0 是背景，丢弃
+            board_red = red_mask[self.board_slice]
+            counts = np.bincount(self.cell_label_map[board_red > 0], minlength=10)[1:10]
+        else:
+            counts = np.array([np.count_nonzero(red_mask[self.cell_slices[i]][self.cell_masks[i]])
+                               for i in range(9)])
+
+        areas = np.asarray(self.cell_areas, dtype=np.float64)
+        ratios = np.zeros(9, dtype=np.float64)
+        # 面积为0的格子比例保持为0
+        np.divide(counts, areas, out=ratios, where=areas > 0)
+        return ratios
         
+    # 计算红色背景掩码
+    def compute_red_mask(self, frame):
+        """
+        按 red_board_threshold (HSV阈值) 提取红色棋盘背景的二值掩码。
+        通过颜色查找表直接从BGR图像得到结果，与先转换到HSV再 inRange 完全一致。
+        :param frame: 要处理的图像 (通常为 board_view 返回的棋盘图像)，或 board_hsv 返回的 HSVFrame。
+        :return: 与 frame 同尺寸的掩码，红色像素为255，其余为0。
+        """
+        if not isinstance(frame, hsv_frame.HSVFrame):
+            frame = hsv_frame.HSVFrame(frame)
+        lut = self.color_classifier()
+        # 一次查表同时得到红色、白色、黑色三个类别的标签图，同一帧的颜色识别直接复用
+        with self.profiler.stage("classify"):
+            labels = frame.labels(lut)
+
+        # 从标签图中取出红色类别，红色像素为白色(255)，其余为黑色(0)
+        with self.profiler.stage("red_mask"):
+            return lut.mask(labels, "red")
+
+    # --- 阈值标定 ---
+    def apply_calibration(self, thresholds):
+        """
+        使用标定文件中的阈值。文件中没有的项恢复为默认阈值 (default_thresholds)。
+        :param thresholds: 字典，项名 (calibration.THRESHOLD_KEYS) -> 阈值，对应属性 "<项名>_threshold"。
+        """
+        for key, threshold in dict(self.default_thresholds, **thresholds).items():
+            setattr(self, f"{key}_threshold", tuple(threshold))
+        if self.pretreatment is not None:
+            self.pretreatment.set_black_threshold(self.board_threshold)
+
+    def reload_calibration(self):
+        """
+        检查标定文件，文件变化时重新读取阈值，并在后台线程中重建颜色查找表。
+        查找表建好之前颜色检测继续使用原来的表，建好后在下一次调用时换上新表。
+        已经识别到的棋盘位置保持不变，不需要重新 init()。
+        :return: 阈值发生变化时返回 True。
+        """
+        if self.calibration is None:
+            return False
+        self.finish_lut_build()
+        thresholds = self.calibration.poll()
+        if thresholds is None:
+            return False
+        self.apply_calibration(thresholds)
+        self.start_lut_build()
+        # 棋盘轮廓阈值已经生效，画面即使没有变化也要重新检测一次
+        self._frame_hsv_source = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        print(f"已重新读取标定文件: {', '.join(sorted(thresholds))}")
+        return True
+
+    def color_classes(self):
+        """返回颜色查找表的类别和阈值: 红色棋盘 "red"、白色棋子 "white"、黑色棋子 "black"。"""
+        return [("red", self.red_board_threshold),
+                ("white", self.white_piece_threshold),
+                ("black", self.black_piece_threshold)]
+
+    def start_lut_build(self):
+        """在后台线程中按当前阈值建一张新的颜色查找表，建好后由 finish_lut_build() 换上。"""
+        lut = color_lut.ColorLUT()
+        thread = threading.Thread(target=lut.configure, args=(self.color_classes(),),
+                                  name="ColorLUTBuild", daemon=True)
+        # 之前还没建好的表直接丢弃，只使用最新的阈值
+        self._lut_build = (thread, lut)
+        thread.start()
+
+    def finish_lut_build(self, wait=False):
+        """
+        后台建好的查找表换上使用。
+        :param wait: 为 True 时等待正在建的表完成。
+        :return: 换上了新表时返回 True。
+        """
+        if self._lut_build is None:
+            return False
+        thread, lut = self._lut_build
+        if wait:
+            thread.join()
+        if thread.is_alive():
+            return False
+        self._lut_build = None
+        # 建表出错 (例如阈值个数超出限制) 时线程已经打印了异常，继续使用原来的表
+        if lut.key is None:
+            return False
+        self.color_lut = lut
+        # 新表要从这一帧开始使用
+        self._frame_hsv_source = None
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        print("颜色查找表已按新的阈值重建。")
+        return True
+
+    # 颜色查找表
+    def color_classifier(self):
+        """
+        返回按当前颜色阈值建好的查找表 (红色棋盘 "red"、白色棋子 "white"、黑色棋子 "black")。
+        阈值没有变化时直接返回；运行中修改了 red_board_threshold 等阈值时会自动重建。
+        后台线程正在按标定文件重建查找表时 (见 reload_calibration)，返回原来的表，不在这里同步重建。
+        """
+        if self._lut_build is None:
+            self.color_lut.configure(self.color_classes())
+        return self.color_lut
+
+    # 红色掩码去噪
+    def denoise_red_mask(self, red_mask, mode=None):
+        """
+        按 denoise_mode 对红色掩码去噪。
+        :param red_mask: compute_red_mask 得到的二值掩码。
+        :param mode: 去噪方式，默认使用 self.denoise_mode。
+        :return: 去噪后的新掩码。
+        """
+        mode = mode or self.denoise_mode
+        mask = red_mask
+        if mode == "median_chain":
+            # 步骤1: 中值滤波，有效去除椒盐噪声（孤立的黑白像素点），对边缘影响较小。
+            # 使用5x5的核进行多次滤波，可以平滑图像，处理更明显的噪点。
+            with self.profiler.stage("medianBlur x5"):
+                mask = cv2.medianBlur(mask, 5)
+                mask = cv2.medianBlur(mask, 5)
+                mask = cv2.medianBlur(mask, 5)
+                mask = cv2.medianBlur(mask, 5)
+                mask = cv2.medianBlur(mask, 5)
+            # 步骤2: 开运算（先腐蚀后膨胀），主要用于去除小的白色噪点区域，并平滑物体边界。
+            # 使用较小的3x3核进行两次迭代，可以精细地清理掉小的干扰区域，而不损伤主要的红色背景区域。
+            kernel = np.ones((3, 3), np.uint8)
+            with self.profiler.stage("morphologyEx"):
+                return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
+
+        if mode == "median":
+            return cv2.medianBlur(mask, self.denoise_kernel)
+
+        if mode == "box":
+            # 均值大于127说明邻域内超过一半是红色像素
+            mean = cv2.blur(mask, (self.denoise_kernel, self.denoise_kernel))
+            _, mask = cv2.threshold(mean, 127, 255, cv2.THRESH_BINARY)
+            return mask
+
+        if mode == "components":
+            # 先去掉小的红色连通域 (噪点)，再把小的非红色连通域 (空洞) 填成红色
+            mask = self._drop_small_components(mask, 0)
+            return self._drop_small_components(mask, 255)
+
+        raise ValueError(f"未知的去噪方式: {mode}，可选: {DENOISE_MODES}")
+
+    def _drop_small_components(self, mask, fill):
+        """
+        (内部方法) 把值不等于 fill 的像素中面积小于 denoise_min_area 的连通域填成 fill。
+        fill 为 0 时去掉小的白色噪点，为 255 时填上小的黑色空洞。
+        """
+        target = mask if fill == 0 else cv2.bitwise_not(mask)
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(target, connectivity=8)
+        small = stats[:, cv2.CC_STAT_AREA] < self.denoise_min_area
+        # 标签0是背景，不处理
+        small[0] = False
+        out = mask.copy()
+        out[small[labels]] = fill
+        return out
+
     # 检测空格子
     def detect_empty_grids(self, cropped_frame):
         """
@@ -135,87 +749,78 @@ class ChessDetector:
             return
 
         # 创建一个原始帧的副本，用于后续绘制调试信息，避免在原图上操作
-        debug_frame = cropped_frame.copy()
+        # 生产模式下不需要绘制调试信息，也就不创建副本
+        debug_frame = cropped_frame.copy() if self.debug >= DEBUG_RESULT else None
         
-        # --- 红色背景检测 ---
-        # 将图像从BGR色彩空间转换到HSV色彩空间，对光照变化有更好的鲁棒性
-        hsv_frame = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2HSV)
-
-        # 根据类中定义的红色阈值，定义红色的下限和上限
-        lower_red = np.array(self.red_board_threshold[:3])
-        upper_red = np.array(self.red_board_threshold[3:])
-        # 创建一个二值化掩码，图像中在红色阈值范围内的像素点将变为白色(255)，其余为黑色(0)
-        red_mask = cv2.inRange(hsv_frame, lower_red, upper_red)
-        # 显示原始的红色掩码，用于调试
-        cv2.imshow("原始红色掩码", red_mask)
-
-        # --- 形态学预处理：去噪和增强 ---
-        # 对掩码进行一系列形态学操作，以去除噪声，使棋盘的红色背景区域更加清晰、完整。
-        # 步骤1: 中值滤波，有效去除椒盐噪声（孤立的黑白像素点），对边缘影响较小。
-        # 使用5x5的核进行多次滤波，可以平滑图像，处理更明显的噪点。
-        red_mask = cv2.medianBlur(red_mask, 5)
-        red_mask = cv2.medianBlur(red_mask, 5)
-        red_mask = cv2.medianBlur(red_mask, 5)
-        red_mask = cv2.medianBlur(red_mask, 5)
-        red_mask = cv2.medianBlur(red_mask, 5)
-        # 显示中值滤波后的效果
-        cv2.imshow("1. 中值滤波后", red_mask)
-
-        # 步骤2: 开运算（先腐蚀后膨胀），主要用于去除小的白色噪点区域，并平滑物体边界。
-        # 使用较小的3x3核进行两次迭代，可以精细地清理掉小的干扰区域，而不损伤主要的红色背景区域。
-        kernel = np.ones((3, 3), np.uint8)
-        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel, iterations=2)
-        # 显示开运算后的效果
-        cv2.imshow("2. 开运算后", red_mask)
+        # 只处理棋盘ROI (或透视校正后的标准图像)，与格子几何缓存使用同一坐标系
+        board = self.board_hsv(cropped_frame)
+        if self.rectified and self.debug >= DEBUG_VERBOSE:
+            cv2.imshow("透视校正后的棋盘", board.bgr)
+
+        # --- 与自适应背景比较 ---
+        # 得到每个格子内与背景一致的像素比例，含义与红色像素比例相同；还没有背景的格子为 NaN
+        background_ratios = None
+        if self.background is not None:
+            with self.profiler.stage("background"):
+                background_ratios = self.background.match_ratios(board.bgr[self.board_slice])
+
+        if background_ratios is not None and not np.isnan(background_ratios).any():
+            # 所有格子都有背景，不需要红色阈值检测
+            ratios = background_ratios
+        else:
+            # --- 红色背景检测 ---
+            red_mask = self.compute_red_mask(board)
+            # 显示原始的红色掩码，用于调试
+            if self.debug >= DEBUG_VERBOSE:
+                cv2.imshow("原始红色掩码", red_mask)
+
+            # --- 去噪：去除噪声，使棋盘的红色背景区域更加清晰、完整 ---
+            with self.profiler.stage("denoise"):
+                red_mask = self.denoise_red_mask(red_mask)
+            # 显示去噪后的效果
+            if self.debug >= DEBUG_VERBOSE:
+                cv2.imshow("去噪后", red_mask)
+
+            # --- 计算所有格子的红色像素比例 ---
+            with self.profiler.stage("occupancy_ratios"):
+                ratios = self.compute_occupancy_ratios(red_mask)
+            # 已经有背景的格子仍以背景比较的结果为准
+            if background_ratios is not None:
+                seeded = ~np.isnan(background_ratios)
+                ratios[seeded] = background_ratios[seeded]
 
         # --- 遍历所有格子进行状态判断 ---
-        for i in range(9):
-            # 获取当前格子的轮廓信息
-            contour = self.grid_rois[i]
-            
-            # --- 计算格子内的红色像素比例 ---
-            # 创建一个用于当前格子的、全黑的临时掩码
-            grid_mask = np.zeros(cropped_frame.shape[:2], dtype=np.uint8)
-            # 在这个临时掩码上，将当前格子的轮廓填充为白色
-            cv2.drawContours(grid_mask, [contour], -1, 255, -1)
-
-            # 使用位与操作，结合处理后的红色掩码和当前格子的掩码
-            # 结果是只保留当前格子内部的红色像素
-            red_in_grid = cv2.bitwise_and(red_mask, grid_mask)
-            # 计算该区域中非零（白色）像素的数量，即红色像素的数量
-            red_pixels = cv2.countNonZero(red_in_grid)
-            
-            # 计算当前格子的面积，用于后续计算比例
-            grid_area = cv2.contourArea(contour)
-            
-            # 计算红色像素占格子总面积的比例
-            ratio = 0.0
-            if grid_area > 0:
-                ratio = red_pixels / grid_area
-
-            # --- 调试信息绘制 ---
-            # 获取格子的中心点坐标
-            center = self.grid_centers[i]
-            # 准备要显示的文本（红色像素比例）
-            text = f"R:{ratio:.2f}"
-            # 在调试用的图像副本上，将比例文本绘制在格子中心
-            cv2.putText(debug_frame, text, (center[0] - 25, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-            # 在调试用的图像副本上，用绿色框出当前正在被检测的格子
-            cv2.drawContours(debug_frame, [contour], -1, (0, 255, 0), 1)
-
-            # --- 更新状态 ---
-            # 如果红色像素占格子面积的比例大于设定的阈值，则认为格子是空的
-            # 这个0.7是个经验值，是判断格子是否为空的关键参数。
-            # 如果在实际场景中误判（如有棋子但识别为空），可以适当调低此值。
-            # 如果空格子被识别为有棋子，可以适当调高此值。
-            if ratio > 0.7:
-                self.current_state[i] = EMPTY
-            else:
-                # 否则，认为格子被棋子占据，先标记为通用的"被占据"状态
-                self.current_state[i] = OCCUPIED
+        with self.profiler.stage("cell_loop"):
+            for i in range(9):
+                # 获取当前格子的轮廓信息和红色像素比例
+                contour = self.grid_rois[i]
+                ratio = ratios[i]
+
+                # --- 调试信息绘制 ---
+                if debug_frame is not None:
+                    # 获取格子的中心点坐标
+                    center = self.grid_centers[i]
+                    # 准备要显示的文本（红色像素比例）
+                    text = f"R:{ratio:.2f}"
+                    # 在调试用的图像副本上，将比例文本绘制在格子中心
+                    cv2.putText(debug_frame, text, (center[0] - 25, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+                    # 在调试用的图像副本上，用绿色框出当前正在被检测的格子
+                    cv2.drawContours(debug_frame, [contour], -1, (0, 255, 0), 1)
+
+                # --- 更新状态 ---
+                # 如果红色像素占格子面积的比例大于设定的阈值，则认为格子是空的
+                # 这个0.7是个经验值，是判断格子是否为空的关键参数。
+                # 如果在实际场景中误判（如有棋子但识别为空），可以适当调低此值。
+                # 如果空格子被识别为有棋子，可以适当调高此值。
+                if ratio > EMPTY_RATIO_THRESHOLD:
+                    self.current_state[i] = EMPTY
+                else:
+                    # 否则，认为格子被棋子占据，先标记为通用的"被占据"状态
+                    self.current_state[i] = OCCUPIED
 
         # 显示带有所有调试信息的最终窗口
-        cv2.imshow("空格子检测调试", debug_frame)
+        if debug_frame is not None:
+            cv2.imshow("空格子检测调试", debug_frame)
             
 
     # 颜色识别，判断是人类棋子还是机器人棋子
@@ -234,52 +839,37 @@ class ChessDetector:
         if contour is None:
             return OCCUPIED
 
-        # --- 创建掩码与ROI提取 ---
-        # 创建一个与输入帧同样大小的黑色背景图像，作为掩码
-        mask = np.zeros(cropped_frame.shape[:2], dtype="uint8")
-        # 在黑色背景上，将当前格子的轮廓填充为白色，生成一个精确的格子掩码
-        cv2.drawContours(mask, [contour], -1, 255, -1)
-
-        # 获取刚好能包围轮廓的最小矩形（边界框），用于提取感兴趣区域(ROI)
-        x, y, w, h = cv2.boundingRect(contour)
-        # 为防止ROI超出图像边界，计算安全的结束坐标
-        roi_y_end = min(y + h, cropped_frame.shape[0])
-        roi_x_end = min(x + w, cropped_frame.shape[1])
-        # 从原图中截取ROI图像
-        roi = cropped_frame[y:roi_y_end, x:roi_x_end]
-        # 从掩码中也截取相同区域的掩码ROI
-        roi_mask = mask[y:roi_y_end, x:roi_x_end]
+        # --- ROI提取 ---
+        # 直接使用 init() 中缓存的边界框切片和格子掩码 (board_view 坐标系)
+        cell_slice = self.cell_slices[grid_idx]
+        cell_mask = self.cell_masks[grid_idx]
+        # 这一帧的棋盘图像已经在空格子检测时处理过，这里直接复用
+        board = self.board_hsv(cropped_frame)
+        h, w = cell_mask.shape
 
         # --- 颜色检测 ---
-        # 确保ROI和掩码ROI的尺寸完全一致，以避免bitwise_and操作出错
-        if roi.shape[:2] != roi_mask.shape[:2]:
-            # 如果尺寸不同（通常发生在轮廓在图像边缘时），则进行裁剪对齐
-            h_roi, w_roi = roi.shape[:2]
-            roi_mask = roi_mask[:h_roi, :w_roi]
+        # 格子外的像素不参与统计，下面计数时只取掩码内部的像素
 
-        # 使用掩码ROI，将ROI图像中不属于格子的部分变黑，只保留格子内部的像素
-        masked_roi = cv2.bitwise_and(roi, roi, mask=roi_mask)
+        # 取出格子内像素的颜色类别标签 (空格子检测时已经对整个棋盘图像查过表，这里直接复用)
+        lut = self.color_classifier()
+        cell_labels = board.labels(lut)[cell_slice][cell_mask]
 
-        # 将处理后的ROI图像从BGR色彩空间转换到HSV色彩空间，便于颜色检测
-        hsv_roi = cv2.cvtColor(masked_roi, cv2.COLOR_BGR2HSV)
+        # 光照与标定阈值时相比明显变化 (例如天色变暗) 时，先把格子图像按背景模型估计的亮度比例
+        # 换算回标定时的亮度再查表，棋子颜色阈值才能继续使用
+        if self.background is not None:
+            gain = self.background.lighting_gain(board.bgr[self.board_slice])
+            if np.any(np.abs(gain - 1.0) > LIGHTING_TOLERANCE):
+                scale = tuple(float(1.0 / g) for g in gain) + (0.0,)
+                cell_bgr = cv2.multiply(board.bgr[cell_slice], scale)
+                cell_labels = lut.classify(cell_bgr)[cell_mask]
 
         # --- 白色棋子像素统计 ---
-        # 定义白色棋子的HSV阈值范围
-        lower_white = np.array(self.white_piece_threshold[:3])
-        upper_white = np.array(self.white_piece_threshold[3:])
-        # 在HSV图像上创建白色区域的掩码
-        white_mask = cv2.inRange(hsv_roi, lower_white, upper_white)
-        # 计算掩码中非零像素（即白色像素）的数量
-        white_pixels = cv2.countNonZero(white_mask)
+        # 计算格子内属于白色棋子阈值的像素数量
+        white_pixels = lut.count(cell_labels, "white")
 
         # --- 黑色棋子像素统计 ---
-        # 定义黑色棋子的HSV阈值范围
-        lower_black = np.array(self.black_piece_threshold[:3])
-        upper_black = np.array(self.black_piece_threshold[3:])
-        # 在HSV图像上创建黑色区域的掩码
-        black_mask = cv2.inRange(hsv_roi, lower_black, upper_black)
-        # 计算掩码中非零像素（即黑色像素）的数量
-        black_pixels = cv2.countNonZero(black_mask)
+        # 计算格子内属于黑色棋子阈值的像素数量
+        black_pixels = lut.count(cell_labels, "black")
         
         # --- 决策逻辑 ---
         # 为了避免噪声干扰，设置一个像素数量阈值
@@ -347,6 +937,23 @@ class ChessDetector:
         return None, None
 
     def update_board_state(self, cropped_frame):
+        # --- 标定文件热更新 ---
+        with self.profiler.stage("calibration"):
+            self.reload_calibration()
+
+        # --- 步骤0: 跳帧判断 ---
+        # 画面没有变化，并且时间滤波的历史记录也已经全部稳定时，这一帧不会带来任何新信息，直接跳过
+        if self.motion_gate is not None:
+            with self.profiler.stage("motion_gate"):
+                force = self.debouncer is not None and not self.debouncer.quiet()
+                process = self.motion_gate.should_process(self.crop_roi(cropped_frame), force=force)
+            if not process:
+                return
+
+        # --- 步骤0.5: 棋盘跟踪 ---
+        # 画面有变化时检查棋盘是否被移动，必要时更新格子几何信息
+        self.track_board(cropped_frame)
+
         # --- 步骤1: 状态更新准备 ---
         # 在检测新一帧之前，先将当前的状态保存为"上一帧状态"，用于后续比较
         for i in range(9):
@@ -355,6 +962,32 @@ class ChessDetector:
         # --- 步骤2: 检测基本状态 ---
         # 调用函数，检测当前帧每个格子的"空"或"非空"状态，结果会直接更新到 self.current_state
         self.detect_empty_grids(cropped_frame)
+        # 这一帧的原始检测结果，用于决定哪些格子可以更新背景
+        raw_empty = [state == EMPTY for state in self.current_state]
+
+        # --- 步骤2.5: 时间滤波 ---
+        # 用滤波后的稳定状态代替这一帧的原始检测结果。只要还有格子没有稳定下来
+        # (例如手还在棋盘上方)，就保持上一帧的状态不变，不产生任何事件，也不做颜色识别
+        if self.debouncer is not None:
+            with self.profiler.stage("debounce"):
+                stable = self.debouncer.update([state != EMPTY for state in self.current_state])
+                if self.debouncer.settled():
+                    for i in range(9):
+                        self.current_state[i] = OCCUPIED if stable[i] else EMPTY
+                else:
+                    for i in range(9):
+                        self.current_state[i] = self.prev_state[i]
+
+        # --- 步骤2.6: 更新自适应背景 ---
+        # 只用稳定为空、并且这一帧也检测为空的格子更新背景，落子、手经过的格子都不会混入背景
+        if self.background is not None:
+            with self.profiler.stage("background_update"):
+                empty = [raw_empty[i] and self.current_state[i] == EMPTY for i in range(9)]
+                self.background.update(self.board_hsv(cropped_frame).bgr[self.board_slice], empty)
+
+        # --- 步骤2.7: 同步棋子颜色记录 ---
+        # 棋子被拿走的位置清除颜色记录；棋盘被清空时开始新的一局
+        self.sync_board_colors()
 
         # --- 步骤3: 检测高级行为 ---
         # 调用函数，通过比较 self.prev_state 和 self.current_state，判断是否有棋子移动或新落子
@@ -375,9 +1008,8 @@ class ChessDetector:
         elif move_to is not None and move_from is None:
             # --- B1: 识别落子颜色 ---
             # 对新落子的位置，调用颜色识别函数
-            color = self.detect_piece_color(cropped_frame, move_to)
-            # 将棋子挪回去
-            self.send_robot_move_command(move_from,move_to)
+            with self.profiler.stage("detect_piece_color"):
+                color = self.detect_piece_color(cropped_frame, move_to)
             # --- B2: 根据颜色执行操作 ---
             # 如果是人类落子（白色）
             if color == HUMAN:
@@ -388,9 +1020,7 @@ class ChessDetector:
                 #     print(f"准备通过串口发送数据: {command_array}")
                 #     self.communicator.send_data(command_array)
                 
-                # 在人类落子后，触发机器人移动
-                # 示例: 让机器人从棋框(10)取子，放到位置0
-                # TODO: 这里的 0 应该由您的游戏AI逻辑决定
+                # 在人类落子后，触发机器人移动 (见 B3，合法的落子才会触发)
                 print("触发机器人移动...")
 
             # 如果是机器人落子（黑色）
@@ -407,48 +1037,183 @@ class ChessDetector:
                     print("检测到重复落子")
                 # 如果颜色不同，则是正常的交替落子
                 else:
-                    self.send_robot_move_command(10,move_to)
-                    # 更新"上一回合落子颜色"的记录
-                    self.last_move_color = color
+                    self.accept_move(move_to, color)
             # 如果 self.last_move_color 无记录（即这是游戏开始的第一次落子）
             else:
-                # 直接记录本回合的落子颜色
-                self.last_move_color = color
+                # 直接记录本回合的落子
+                self.accept_move(move_to, color)
                 
         # 分支C: 无有效行为
         # 如果 move_from 和 move_to 都为 None，说明棋盘状态稳定，无事发生
         else:
             pass
 
+    def accept_move(self, grid_idx, color):
+        """
+        记录一次合法的落子；如果是人类落子，则查开局库决定机器人的落子并发送指令。
+        :param grid_idx: 落子的格子索引 (0-8)。
+        :param color: 落子的颜色 (HUMAN / ROBOT)，无法识别颜色时为 OCCUPIED。
+        """
+        # 更新"上一回合落子颜色"的记录
+        self.last_move_color = color
+        if color in (HUMAN, ROBOT):
+            self.board_colors[self.board_order.index(grid_idx)] = color
+        if color == HUMAN:
+            robot_move = self.choose_robot_move()
+            if robot_move is None:
+                # 开局库对不在库中的局面会现场求解，只有一方连成一线或棋盘已满时才没有着法
+                print("棋局已结束，机器人不再落子。")
+            else:
+                print(f"机器人决策落子于格子 {robot_move}")
+                # 让机器人从棋框(10)取子，放到决策的位置
+                self.send_robot_move_command(10, robot_move)
+
+    def choose_robot_move(self):
+        """
+        机器人决策: 根据当前棋盘上的棋子颜色查开局库，返回机器人的最佳落子位置。
+        开局库在启动时已经映射到内存，这里只是一次常数时间的查表。
+        有棋子但没有颜色记录的位置 (颜色识别失败或被判为重复落子) 按人类棋子处理，
+        这样机器人不会把棋子放到已经有子的格子上。
+        :return: 格子索引 (0-8)；棋局已结束时返回 None。
+        """
+        colors = list(self.board_colors)
+        for pos, idx in enumerate(self.board_order):
+            if colors[pos] == EMPTY and self.current_state[idx] != EMPTY:
+                colors[pos] = HUMAN
+        move = self.opening_book.best_move_for_state(colors, human=HUMAN, robot=ROBOT)
+        return None if move is None else self.board_order[move]
+
+    def sync_board_colors(self):
+        """
+        让棋子颜色记录与 (时间滤波后的) 格子状态保持一致: 棋子被拿走的位置清除颜色记录。
+        棋盘被完全清空时认为开始了新的一局，同时清除上一回合落子方的记录。
+        """
+        for pos, idx in enumerate(self.board_order):
+            if self.current_state[idx] == EMPTY:
+                self.board_colors[pos] = EMPTY
+        if self.last_move_color is not None and all(state == EMPTY for state in self.current_state):
+            print("棋盘已清空，开始新的一局。")
+            self.new_game()
+
+    def new_game(self):
+        """清除棋子颜色和落子方的记录，开始新的一局。"""
+        self.board_colors = [EMPTY] * 9
+        self.last_move_color = None
+
+    def on_serial_frame(self, frame):
+        """
+        串口协议帧回调，由串口的后台读线程在解析出完整的一帧时调用。
+        机器人移动完成的确认帧由 robot_commands 指令队列处理，这里只做记录。
+        :param frame: serial_test.AckFrame 或 serial_test.CommandFrame。
+        """
+        print(f"接收到单片机返回的数据帧: {frame}")
+
+        # TODO: 在此添加对下位机返回数据的其他处理逻辑
+        # 例如，可以根据 CommandFrame 的内容确认机器人是否完成某一步移动
+
+    def on_robot_command_done(self, seq, ok, latency):
+        """
+        机器人指令完成回调，由指令队列在收到确认帧或判定超时后调用。
+        本次提交的所有移动指令都完成后，解除等待状态，恢复棋盘识别。
+        """
+        if ok:
+            print(f"机器人指令 {seq} 执行完成，耗时 {latency * 1000:.0f} ms")
+        else:
+            print(f"机器人指令 {seq} 执行失败（等待确认超时）")
+        with self._robot_lock:
+            # 不是本程序的移动指令 (或已经处理过)，不影响等待状态
+            if seq not in self._robot_outstanding:
+                return
+            self._robot_outstanding.discard(seq)
+            if self._robot_outstanding:
+                return
+            print("机器人所有指令执行完成，恢复棋盘识别。")
+            self.waiting_for_robot_move = False
+
     def send_robot_move_command(self, move_from, move_to):
         """
         发送移动棋子的指令到下位机，并暂停棋盘识别。
         格式: 0xAA, move_from, move_to, 0x55
         - move_from: 起始格子索引 (0-8)。10代表从棋框拿棋子。
         - move_to: 目标格子索引 (0-8)。
+        连续调用多次时，指令会进入队列依次发送，全部完成后才恢复棋盘识别。
+        """
+        with self.profiler.stage("send_robot_move_command"):
+            self.send_robot_move_sequence([(move_from, move_to)])
+
+    def send_robot_move_sequence(self, moves):
+        """
+        一次提交多步移动指令，例如 [(被移动棋子的位置, 原位置), (10, 机器人落子位置)]。
+        指令按顺序发送，全部完成之前 (包括之前提交、尚未完成的指令) 暂停棋盘识别。
+        :param moves: 由 (move_from, move_to) 组成的列表，含义同 send_robot_move_command。
         """
-        if not (self.communicator and self.communicator.ser):
+        if not (self.communicator and self.communicator.ser and self.robot_commands):
             print("串口未连接，无法发送移动指令。")
             return
 
-        # 索引10是特殊值，不需要+1. 0-8的索引需要转换为1-9.
-        from_index = 10 if move_from == 10 else move_from + 1
-        to_index = move_to + 1
-
-        command = [0xAA, from_index, to_index, 0x55]
-        print(f"发送移动指令: {command}")
-        self.communicator.send_data(command)
-        self.waiting_for_robot_move = True
-        print("指令已发送，正在等待机器人执行完成...")
+        # 提交期间持有锁: 串口回复由后台线程处理，可能在 submit 返回之前就已到达，
+        # 完成回调要等到这一组指令的序号都记录下来之后才能判断机器人是否空闲
+        with self._robot_lock:
+            self.waiting_for_robot_move = True
+            for move_from, move_to in moves:
+                # 索引10是特殊值，不需要+1. 0-8的索引需要转换为1-9.
+                from_index = 10 if move_from == 10 else move_from + 1
+                to_index = move_to + 1
+                print(f"提交移动指令: {serial_test.encode_frame(from_index, to_index)}")
+                self._robot_outstanding.add(self.robot_commands.submit(from_index, to_index))
+        print("指令已提交，正在等待机器人执行完成...")
 
 
 if __name__ == "__main__":
     # ---------------- 主程序入口 ----------------
-    # 初始化摄像头
-    # 参数0通常代表内置摄像头，1代表外置USB摄像头。如果无法打开，请尝试更改此索引。
-    cap = cv2.VideoCapture(1)
+    # --- 命令行参数 ---
+    # --debug 0: 生产/无显示器模式，不打开任何窗口，按 Ctrl+C 退出
+    # --debug 1: 只显示检测结果窗口
+    # --debug 2: 显示所有中间过程窗口 (默认)
+    parser = argparse.ArgumentParser(description="井字棋视觉识别主程序")
+    parser.add_argument("--debug", type=int, default=DEBUG_VERBOSE,
+                        choices=[DEBUG_OFF, DEBUG_RESULT, DEBUG_VERBOSE],
+                        help="调试等级: 0=关闭(无窗口), 1=只显示结果, 2=显示所有中间过程")
+    parser.add_argument("--source", default="1",
+                        help="画面源: 摄像头索引 (默认1)、视频文件路径或图片文件夹路径。"
+                             "使用视频或图片时进入离线回放模式，不连接串口")
+    parser.add_argument("--rectified", action="store_true",
+                        help="把棋盘透视校正为固定尺寸的标准图像后再统计格子 (默认在棋盘ROI上按轮廓统计)")
+    parser.add_argument("--calibration", default=calibration.DEFAULT_CALIBRATION_PATH,
+                        help="阈值标定文件 (hsv_tuner.py 写入)，运行中修改会自动生效。文件不存在时使用默认阈值")
+    parser.add_argument("--calibration-profile", default=None,
+                        help="使用标定文件中的哪一套方案，默认为文件中 active 指定的方案")
+    parser.add_argument("--no-background", dest="background", action="store_false",
+                        help="关闭自适应背景模型，只用固定的红色阈值判断空格子")
+    parser.add_argument("--no-profile", dest="profile", action="store_false",
+                        help="关闭分阶段耗时统计 (默认开启，退出时或按 'p' 键输出)")
+    parser.add_argument("--profile-port", type=int, default=0,
+                        help="在本机该端口上提供耗时统计查询，例如 nc 127.0.0.1 <端口>，默认不开启")
+    args = parser.parse_args()
+    # 是否显示窗口。无窗口时也不能调用 cv2.waitKey，按键控制随之关闭
+    show_windows = args.debug >= DEBUG_RESULT
+
+    # 初始化画面源
+    # 摄像头: 参数0通常代表内置摄像头，1代表外置USB摄像头。如果无法打开，请尝试更改此索引。
+    # 使用后台线程采集，主循环每次读取的都是最新的一帧，不会处理积压的旧画面
+    # 视频文件或图片文件夹: 离线回放，按顺序处理每一帧，不按实时速度等待，也不连接串口
+    cap = camera.open_source(args.source)
+    replay = not cap.is_live
+    if not cap.isOpened():
+        print(f"错误: 无法打开画面源 {args.source}")
+        exit()
     # 实例化棋盘检测器
-    detector = ChessDetector(cap)
+    store = calibration.CalibrationStore(args.calibration, profile=args.calibration_profile)
+    detector = ChessDetector(cap, debug=args.debug, use_serial=not replay, profile=args.profile,
+                             calibration_store=store)
+    if args.rectified:
+        detector.geometry_mode = "rectified"
+    if not args.background:
+        detector.background = None
+    if replay:
+        # 离线回放不按实时速度处理，时间滤波改用按帧号计算的时钟 (假定录像为30帧/秒)，
+        # 这样同一段录像每次回放产生的事件完全相同
+        detector.debouncer.clock = lambda: cap.frame_count / 30.0
     
     print("正在初始化棋盘，请将棋盘完全放入摄像头视野...")
     # 初始化循环，直到成功识别到9个格子
@@ -456,6 +1221,10 @@ if __name__ == "__main__":
     while True:
         ret, frame = cap.read()
         if not ret:
+            if replay:
+                print("回放结束，未能在录像中识别到棋盘。")
+                cap.release()
+                exit()
             print("读取视频失败,正在重试，请稍后...")
             continue
         
@@ -464,88 +1233,109 @@ if __name__ == "__main__":
             break
         
         # 显示摄像头内容，方便调整
-        cv2.imshow("Initializing...", frame)
-        # 按'q'键退出初始化
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            cap.release()
-            cv2.destroyAllWindows()
-            exit()
+        if show_windows:
+            cv2.imshow("Initializing...", frame)
+            # 按'q'键退出初始化
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                cap.release()
+                cv2.destroyAllWindows()
+                exit()
     
     # 初始化成功后，进入主检测循环
     # pause_until变量用于控制检测是否暂停，实现延时功能
     # 初始化成功后，可以开始检测
     pause_until = 0
-    while True:
-        # 主循环负责：
-        # 1. 从下位机接收数据 (如果串口可用)
-        # 2. 从摄像头读取新的一帧图像
-        # 3. 在非暂停状态下，调用detector.update_board_state()更新棋盘状态
-        # 4. 显示处理后的图像和调试信息
-        # 5. 处理用户按键输入 ('q'退出, ' '暂停)
-
-        # --- 串口通信：接收下位机数据 ---
-        # 尝试从串口接收数据
-        if detector.communicator and detector.communicator.ser:
-            # 这个调用是非阻塞的，所以不会影响主循环的速度
-            received_data = detector.communicator.receive_data()
-            if received_data:
-                print(f"主循环接收到单片机返回的数据: {received_data}")
-                # 检查是否为机器人移动完成的确认信号
-                # 成功标志位: [0xAA, 10, 10, 0x55]
-                if received_data == [0xAA, 10, 10, 0x55]:
-                    if detector.waiting_for_robot_move:
-                        print("接收到机器人移动完成信号，恢复棋盘识别。")
-                        detector.waiting_for_robot_move = False
-                    else:
-                        print("接收到移动完成信号，但当前不处于等待状态。")
-
-                # TODO: 在此添加对下位机返回数据的其他处理逻辑
-                # 例如，可以根据协议解析数据，确认机器人是否完成移动
-                # if received_data == [0x02, 0x05]: 
-                #     print("机器人已在位置5落子")
+    # 统计主循环处理的帧数和用时，用于计算整条识别流水线的帧率
+    processed_frames = 0
+    loop_start = time.perf_counter()
+    # 主循环放在 try/finally 中: 无论是按 'q' 退出、回放结束、按 Ctrl+C 还是出现异常，
+    # 都会输出统计信息并释放资源
+    prof = detector.profiler
+    if args.profile_port:
+        prof.serve(args.profile_port)
+    try:
+        while True:
+            # 主循环负责：
+            # 1. 从摄像头读取新的一帧图像
+            # 2. 在非暂停状态下，调用detector.update_board_state()更新棋盘状态
+            # 3. 显示处理后的图像和调试信息
+            # 4. 处理用户按键输入 ('q'退出, ' '暂停)
 
+            # --- 串口通信：接收下位机数据 ---
+            # 下位机返回的数据由串口后台线程接收解析，并在 detector.on_serial_frame 中处理，
+            # 主循环无需轮询串口
 
-        ret, frame = cap.read()
-        if not ret:
-            print("读取视频失败,正在重试，请稍后...")
-            continue
-        # 为了匹配坐标，我们在裁剪后的图像上进行操作和显示
-        cropped_frame = detector.pretreatment.crop(frame)
-
-        # 只有在非暂停状态下且不等待机器人移动时才更新棋盘
-        if time.time() >= pause_until and not detector.waiting_for_robot_move:
-            # 更新棋盘状态，这是核心处理步骤
-            detector.update_board_state(cropped_frame)
-
-        display_frame = cropped_frame.copy()
-
-        # 如果在暂停期间，显示提示信息
-        if time.time() < pause_until:
-            remaining_time = pause_until - time.time()
-            text = f"Paused: {remaining_time:.1f}s"
-            (h, w) = display_frame.shape[:2]
-            cv2.putText(display_frame, text, (10, h - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            with prof.stage("read"):
+                ret, frame = cap.read()
+            if not ret:
+                if replay:
+                    print("回放结束。")
+                    break
+                print("读取视频失败,正在重试，请稍后...")
+                continue
+            processed_frames += 1
+            # 为了匹配坐标，我们在裁剪后的图像上进行操作和显示
+            with prof.stage("crop"):
+                cropped_frame = detector.pretreatment.crop(frame)
+
+            # 只有在非暂停状态下且不等待机器人移动时才更新棋盘
+            if time.time() >= pause_until and not detector.waiting_for_robot_move:
+                # 更新棋盘状态，这是核心处理步骤
+                with prof.stage("update_board_state"):
+                    detector.update_board_state(cropped_frame)
+
+            # 无窗口模式下跳过所有显示和按键处理，直接进入下一帧
+            if not show_windows:
+                prof.tick()
+                continue
+
+            display_frame = cropped_frame.copy()
+
+            # 如果在暂停期间，显示提示信息
+            if time.time() < pause_until:
+                remaining_time = pause_until - time.time()
+                text = f"Paused: {remaining_time:.1f}s"
+                (h, w) = display_frame.shape[:2]
+                cv2.putText(display_frame, text, (10, h - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        # 如果正在等待机器人移动，也显示提示信息
-        if detector.waiting_for_robot_move:
-            text = "Waiting for robot..."
-            (h, w) = display_frame.shape[:2]
-            cv2.putText(display_frame, text, (10, h - 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-
-        cv2.imshow("检测结果", display_frame)
-
-        # --- 按键控制 ---
-        # 刷新屏幕
-        key = cv2.waitKey(1) & 0xFF
-        # 按 'q' 键退出程序
-        if key == ord('q'):
-            break
-        # 按空格键暂停检测5秒
-        # 这个功能在调试时非常有用，可以冻结画面，方便观察当前的检测结果或调整棋盘位置。
-        elif key == ord(' '):
-            print("检测暂停5秒...")
-            pause_until = time.time() + 5
-
-    # 释放资源
-    cap.release()
-    cv2.destroyAllWindows()
\ No newline at end of file
+            # 如果正在等待机器人移动，也显示提示信息
+            if detector.waiting_for_robot_move:
+                text = "Waiting for robot..."
+                (h, w) = display_frame.shape[:2]
+                cv2.putText(display_frame, text, (10, h - 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+            cv2.imshow("检测结果", display_frame)
+
+            # --- 按键控制 ---
+            # 刷新屏幕
+            key = cv2.waitKey(1) & 0xFF
+            prof.tick()
+            # 按 'q' 键退出程序
+            if key == ord('q'):
+                break
+            # 按空格键暂停检测5秒
+            # 这个功能在调试时非常有用，可以冻结画面，方便观察当前的检测结果或调整棋盘位置。
+            elif key == ord(' '):
+                print("检测暂停5秒...")
+                pause_until = time.time() + 5
+            # 按 'p' 键打印当前的分阶段耗时统计
+            elif key == ord('p'):
+                prof.dump()
+    except KeyboardInterrupt:
+        print("\n收到 Ctrl+C，退出。")
+    finally:
+        # 释放资源
+        elapsed = time.perf_counter() - loop_start
+        print(f"共采集 {cap.frame_count} 帧，丢弃 {cap.dropped_frames} 帧")
+        if elapsed > 0:
+            print(f"主循环处理 {processed_frames} 帧，用时 {elapsed:.2f} 秒，平均 {processed_frames / elapsed:.1f} FPS")
+        if detector.motion_gate is not None:
+            gate = detector.motion_gate
+            print(f"画面无变化跳过 {gate.skipped_frames} / {gate.checked_frames} 帧，跳帧比例 {gate.skip_ratio():.1%}")
+        if detector.robot_commands:
+            print(f"机器人指令统计: {detector.robot_commands.stats()}")
+        prof.dump()
+        prof.close()
+        cap.release()
+        if show_windows:
+            cv2.destroyAllWindows()
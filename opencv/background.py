@@ -0,0 +1,240 @@
+import cv2
+import numpy as np
+
+class CellBackground:
+    """
+    格子背景的自适应模型 (逐像素的指数滑动均值和方差)。
+
+    固定的 HSV 阈值在长时间对局中会因为日光变化而失效: 天色变暗后空格子的红色达不到阈值，
+    就会被误判为有子。本类为棋盘窗口内的每个像素维护颜色的滑动均值 mean 和方差 var，
+    只用当前判断为空的格子更新 (有棋子、被手挡住的格子不参与)，因此模型会跟随缓慢的光照变化。
+
+    判断时先用空格子的像素估计整体的亮度增益 (每个颜色通道一个系数)，补偿云层、开关灯等
+    全局的快速变化，再计算每个像素与补偿后背景的归一化距离:
+        d² = Σ_c (x_c / g_c - mean_c)² / max(var_c, min_std²)
+    d² 不超过 3·match_sigma² 的像素认为与背景一致。每个格子内与背景一致的像素比例
+    与原来的红色像素比例含义相同，使用同一个阈值 (EMPTY_RATIO_THRESHOLD) 判断是否为空。
+
+    每个格子第一次被判断为空时，用当时的画面作为该格子的初始背景 ("播种")；
+    还没有播种的格子由调用方使用原来的红色阈值判断。
+    棋盘被移动后用 remap() 把已有的背景变换到新的坐标系，不重新播种:
+    光照变化之后红色阈值已经不可靠，重新播种就只能依赖它。
+
+    此外还记录播种时的画面，lighting_gain() 给出当前光照相对于播种时 (通常就是标定阈值时) 的变化，
+    颜色识别可以用它把画面换算回标定时的亮度，继续使用原来的阈值。
+
+    快速使用:
+    1. 格子几何确定后: `background.configure(cell_label_map)`；
+       之后棋盘被移动时: `background.remap(new_label_map, transform)`
+    2. 每一帧: `ratios = background.match_ratios(board_image)`，没有播种的格子为 NaN
+    3. 得到稳定的判断结果后: `background.update(board_image, empty_cells)`
+    """
+    # cv2.transform 用的系数，把三个通道相加
+    _CHANNEL_SUM = np.ones((1, 3), dtype=np.float32)
+
+    def __init__(self, alpha=0.02, match_sigma=3.0, min_std=6.0, init_std=10.0):
+        """
+        :param alpha: 滑动平均的更新速率，每处理一帧背景向当前画面靠近的比例。
+        :param match_sigma: 与背景的归一化距离 (每个通道的标准差倍数) 不超过该值的像素认为与背景一致。
+        :param min_std: 标准差的下限 (像素值)，避免噪声很小的画面上方差趋近于0导致误判。
+        :param init_std: 格子刚播种时的初始标准差 (像素值)。
+        """
+        self.alpha = alpha
+        self.match_sigma = match_sigma
+        self.min_std = min_std
+        self.init_std = init_std
+
+        # 格子编号图 (0 为背景，1..9 为格子)，模型覆盖的范围与它相同
+        self.label_map = None
+        # 每个格子的像素数
+        self.cell_pixels = np.zeros(9, dtype=np.int64)
+        # 逐像素的背景均值和方差，形状为 (高, 宽, 3) 的 float32
+        self.mean = None
+        self.var = None
+        # 1 / max(var, min_std²)，每次更新背景后重新计算，判断时直接相乘
+        self.inv_var = None
+        # 播种时的画面，用于计算相对于播种时的光照变化
+        self.reference = None
+        # 每个格子是否已经播种，以及最近一次被判断为空的格子
+        self.seeded = np.zeros(9, dtype=bool)
+        self.empty_cells = np.zeros(9, dtype=bool)
+        # 最近一次估计的各通道亮度增益 (当前画面 / 背景均值)
+        self.gain = np.ones(3, dtype=np.float32)
+        # remap() 后没有对应旧背景的像素 (255)，下一次所在格子为空时直接用当前画面补上；没有时为 None
+        self.holes = None
+        # 格子组合 -> 像素掩码 的缓存
+        self._mask_cache = {}
+
+    def configure(self, label_map):
+        """
+        格子几何变化后 (初始化、棋盘被移动) 调用，清空模型，之后重新播种。
+        :param label_map: 格子编号图 (ChessDetector.cell_label_map)。
+        """
+        self.label_map = label_map
+        self.cell_pixels = np.bincount(label_map.ravel(), minlength=10)[1:10]
+        self.mean = np.zeros(label_map.shape + (3,), dtype=np.float32)
+        self.var = np.zeros(label_map.shape + (3,), dtype=np.float32)
+        self.inv_var = np.zeros(label_map.shape + (3,), dtype=np.float32)
+        self.reference = np.zeros(label_map.shape + (3,), dtype=np.float32)
+        self._mask_cache = {}
+        self.reset()
+
+    def remap(self, label_map, transform, min_coverage=0.9):
+        """
+        格子几何变化后 (棋盘被移动)，把背景变换到新格子编号图的坐标系，保留已经学到的背景。
+        格子编号必须与原来一一对应。
+        :param label_map: 新的格子编号图。
+        :param transform: 3x3 单应矩阵，旧编号图坐标 -> 新编号图坐标。
+        :param min_coverage: 格子内有旧背景对应的像素比例低于该值时，该格子需要重新播种。
+        """
+        if self.label_map is None:
+            self.configure(label_map)
+            return
+        h, w = label_map.shape
+        old_h, old_w = self.label_map.shape
+        transform = np.asarray(transform, dtype=np.float64)
+
+        # 位移不到半个像素 (例如透视校正模式下棋盘被移动，标准图像几乎不变) 时不做插值，只换编号图
+        corners = np.array([[[0, 0]], [[old_w, 0]], [[old_w, old_h]], [[0, old_h]]], dtype=np.float64)
+        shift = np.abs(cv2.perspectiveTransform(corners, transform) - corners).max()
+        if (h, w) == (old_h, old_w) and shift < 0.5:
+            covered = self._cells_mask(self.seeded)
+        else:
+            dsize = (w, h)
+            for name in ("mean", "var", "reference"):
+                setattr(self, name, cv2.warpPerspective(getattr(self, name), transform, dsize,
+                                                        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE))
+            # 新坐标系中来自已播种格子的像素
+            covered = cv2.warpPerspective(self._cells_mask(self.seeded), transform, dsize,
+                                          flags=cv2.INTER_NEAREST, borderValue=0)
+            self.inv_var = np.empty_like(self.var)
+
+        self.label_map = label_map
+        self.cell_pixels = np.bincount(label_map.ravel(), minlength=10)[1:10]
+        self._mask_cache = {}
+        counts = np.bincount(label_map[covered > 0], minlength=10)[1:10]
+        coverage = np.divide(counts, self.cell_pixels, out=np.zeros(9), where=self.cell_pixels > 0)
+        self.seeded &= coverage >= min_coverage
+
+        # 已播种格子内没有旧背景的像素留到下一次更新时补上
+        holes = cv2.bitwise_and(cv2.bitwise_not(covered), self._cells_mask(self.seeded))
+        self.holes = holes if cv2.countNonZero(holes) else None
+        np.maximum(self.var, self.min_std ** 2, out=self.inv_var)
+        np.reciprocal(self.inv_var, out=self.inv_var)
+
+    def reset(self):
+        """清除所有格子的背景，之后重新播种。"""
+        self.seeded[:] = False
+        self.empty_cells[:] = False
+        self.gain[:] = 1.0
+        self.holes = None
+
+    def ready(self):
+        """所有格子都已经播种时返回 True。"""
+        return bool(self.seeded.all())
+
+    def _cells_mask(self, cells):
+        """(内部方法) 返回属于 cells (长度为9的布尔数组) 中格子的 uint8 像素掩码，按格子组合缓存。"""
+        key = np.packbits(cells).tobytes()
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            lut = np.zeros(256, dtype=np.uint8)
+            lut[1:10][np.asarray(cells, dtype=bool)] = 255
+            mask = self._mask_cache[key] = cv2.LUT(self.label_map, lut)
+        return mask
+
+    @staticmethod
+    def _channel_ratio(image, base, mask):
+        """(内部方法) 掩码内 image 与 base 各通道均值之比。"""
+        num = np.array(cv2.mean(image, mask)[:3], dtype=np.float32)
+        den = np.array(cv2.mean(base, mask)[:3], dtype=np.float32)
+        ratio = np.ones(3, dtype=np.float32)
+        np.divide(num, den, out=ratio, where=den > 0)
+        return ratio
+
+    def lighting_gain(self, image):
+        """
+        返回当前画面相对于播种时的各通道亮度比例，用空格子估计；没有可用的空格子时返回全1。
+        :param image: 与格子编号图同尺寸的 BGR 图像。
+        """
+        cells = self.empty_cells & self.seeded
+        if self.label_map is None or not cells.any():
+            return np.ones(3, dtype=np.float32)
+        return self._channel_ratio(image, self.reference, self._cells_mask(cells))
+
+    def match_ratios(self, image):
+        """
+        计算每个格子内与背景一致的像素比例。
+        :param image: 与格子编号图同尺寸的 BGR 图像。
+        :return: 长度为9的数组，没有播种的格子为 NaN。
+        """
+        ratios = np.full(9, np.nan)
+        if self.label_map is None or not self.seeded.any():
+            return ratios
+
+        # --- 全局亮度补偿 ---
+        # 用上一次判断为空的格子估计每个通道的亮度变化 (当前画面 / 背景均值)
+        cells = self.empty_cells & self.seeded
+        if cells.any():
+            self.gain = self._channel_ratio(image, self.mean, self._cells_mask(cells))
+        else:
+            self.gain[:] = 1.0
+
+        # --- 归一化距离 ---
+        # 画面先除以增益换算到背景的亮度，全部用 cv2 的逐元素运算，避免 numpy 的广播和临时数组
+        scale = tuple(float(1.0 / g) if g > 0 else 1.0 for g in self.gain) + (0.0,)
+        diff = cv2.subtract(cv2.multiply(image, scale, dtype=cv2.CV_32F), self.mean)
+        d2 = cv2.multiply(cv2.multiply(diff, diff), self.inv_var)
+        # 三个通道求和
+        d2 = cv2.transform(d2, self._CHANNEL_SUM)
+        match = d2 <= 3 * self.match_sigma ** 2
+
+        counts = np.bincount(self.label_map[match], minlength=10)[1:10]
+        valid = self.seeded & (self.cell_pixels > 0)
+        ratios[valid] = counts[valid] / self.cell_pixels[valid]
+        return ratios
+
+    def update(self, image, empty_cells):
+        """
+        用判断为空的格子更新背景。
+        :param image: 与格子编号图同尺寸的 BGR 图像。
+        :param empty_cells: 长度为9的布尔序列，True 表示该格子当前 (稳定地) 为空。
+        """
+        if self.label_map is None:
+            return
+        empty_cells = np.asarray(empty_cells, dtype=bool)
+        self.empty_cells[:] = empty_cells
+        x = image.astype(np.float32)
+
+        # 已经播种的空格子: 指数滑动更新方差和均值 (方差要用更新前的均值)
+        # accumulateWeighted: dst = (1 - a) * dst + a * src，只更新掩码内的像素
+        update = empty_cells & self.seeded
+        if update.any():
+            mask = self._cells_mask(update)
+            a = self.alpha
+            diff = cv2.subtract(x, self.mean)
+            cv2.accumulateWeighted(cv2.multiply(diff, diff, scale=1 - a), self.var, a, mask=mask)
+            cv2.accumulateWeighted(x, self.mean, a, mask=mask)
+
+            # remap() 留下的空洞: 直接用当前画面作为背景
+            if self.holes is not None:
+                fill = cv2.bitwise_and(self.holes, mask)
+                if cv2.countNonZero(fill):
+                    cv2.copyTo(x, fill, self.mean)
+                    self.var[fill > 0] = self.init_std ** 2
+                    self.holes[fill > 0] = 0
+                    if not cv2.countNonZero(self.holes):
+                        self.holes = None
+
+        # 新近为空、还没有播种的格子: 直接用当前画面作为初始背景
+        fresh = empty_cells & ~self.seeded
+        if fresh.any():
+            mask = self._cells_mask(fresh)
+            cv2.copyTo(x, mask, self.mean)
+            cv2.copyTo(x, mask, self.reference)
+            self.var[mask > 0] = self.init_std ** 2
+            self.seeded |= fresh
+
+        if update.any() or fresh.any():
+            np.maximum(self.var, self.min_std ** 2, out=self.inv_var)
+            np.reciprocal(self.inv_var, out=self.inv_var)
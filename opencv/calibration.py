@@ -0,0 +1,158 @@
+import json
+import os
+import time
+
+# 默认的标定文件，与本模块放在同一目录
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+# 默认使用的标定方案名
+DEFAULT_PROFILE = "default"
+
+# --- 标定文件中的阈值项 ---
+# 每一项对应 ChessDetector 中名为 "<项名>_threshold" 的属性，格式均为 (H_min, S_min, V_min, H_max, S_max, V_max)
+# "board": 识别棋盘轮廓的阈值 (传给 Pretreatment 的 black_threshold)
+# "red_board": 红色棋盘背景阈值，用于空格子检测
+# "white_piece": 白色棋子阈值 (人类)
+# "black_piece": 黑色棋子阈值 (机器人)
+THRESHOLD_KEYS = ("board", "red_board", "white_piece", "black_piece")
+
+# 阈值各分量的取值上限 (OpenCV 中 H 为 0-179，S 和 V 为 0-255)
+_THRESHOLD_LIMITS = (179, 255, 255, 179, 255, 255)
+
+
+def validate_threshold(value):
+    """
+    检查并规范化一个阈值，返回6个整数组成的元组。
+    :raise ValueError: 格式不正确或数值超出范围。
+    """
+    if not isinstance(value, (list, tuple)) or len(value) != 6:
+        raise ValueError(f"阈值必须是6个整数 (H_min, S_min, V_min, H_max, S_max, V_max)，实际为: {value!r}")
+    threshold = tuple(int(v) for v in value)
+    for v, limit in zip(threshold, _THRESHOLD_LIMITS):
+        if not 0 <= v <= limit:
+            raise ValueError(f"阈值 {threshold} 中的 {v} 超出范围 0-{limit}")
+    return threshold
+
+
+class CalibrationStore:
+    """
+    HSV 阈值标定文件的读写和变更检测。
+
+    标定文件为 JSON 格式，可以保存多套方案 (例如白天、台灯下)，由 "active" 指定当前使用哪一套:
+        {
+          "active": "default",
+          "profiles": {
+            "default": {"red_board": [143, 105, 159, 179, 255, 255], "white_piece": [...], ...}
+          }
+        }
+    hsv_tuner.py 调好阈值后直接写入这个文件；识别程序运行时定期检查文件的修改时间，
+    文件变化后重新读取，光照变化后无需重启程序，也无需重新初始化棋盘。
+
+    写入时先写临时文件再整体替换，读取方不会读到写了一半的文件。
+
+    快速使用:
+    1. 创建实例: `store = CalibrationStore("calibration.json")`
+    2. 读取当前方案: `thresholds = store.load()`，例如 `thresholds["red_board"]`
+    3. 每一帧调用: `changed = store.poll()`，文件没有变化时返回 None，变化时返回新的阈值字典
+    4. 写入阈值: `store.save_threshold("red_board", (143, 105, 159, 179, 255, 255))`
+    """
+    def __init__(self, path=DEFAULT_CALIBRATION_PATH, profile=None, check_interval=0.5, clock=time.monotonic):
+        """
+        :param path: 标定文件路径。文件不存在时读取结果为空，创建文件后会被 poll() 发现。
+        :param profile: 使用的方案名，默认使用文件中 "active" 指定的方案。
+        :param check_interval: poll() 两次检查文件之间的最小间隔 (秒)，避免每一帧都访问文件系统。
+        :param clock: 获取当前时间 (秒) 的函数。
+        """
+        self.path = path
+        self.profile = profile
+        self.check_interval = check_interval
+        self.clock = clock
+        # 上一次读取时文件的 (修改时间, 大小)，文件不存在时为 None
+        self._signature = None
+        self._last_check = None
+        # 最近一次成功读取的阈值
+        self.thresholds = {}
+
+    def _stat_signature(self):
+        """(内部方法) 返回标定文件的 (修改时间, 大小)，文件不存在时返回 None。"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_file(self):
+        """(内部方法) 读取整个标定文件，文件不存在时返回空的结构。"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {"active": DEFAULT_PROFILE, "profiles": {}}
+        if not isinstance(data, dict) or not isinstance(data.get("profiles", {}), dict):
+            raise ValueError(f"标定文件 {self.path} 格式不正确")
+        data.setdefault("active", DEFAULT_PROFILE)
+        data.setdefault("profiles", {})
+        return data
+
+    def active_profile(self, data):
+        """返回实际使用的方案名: 创建时指定的方案优先，其次为文件中的 "active"。"""
+        return self.profile or data.get("active") or DEFAULT_PROFILE
+
+    def load(self):
+        """
+        读取当前方案的阈值。
+        :return: 字典，项名 (THRESHOLD_KEYS 中的一个) -> 阈值元组。文件中没有的项不出现在字典中。
+        :raise ValueError: 文件内容不正确。
+        """
+        signature = self._stat_signature()
+        data = self._read_file()
+        profile = data["profiles"].get(self.active_profile(data), {})
+        thresholds = {key: validate_threshold(profile[key]) for key in THRESHOLD_KEYS if key in profile}
+        self._signature = signature
+        self.thresholds = thresholds
+        return thresholds
+
+    def poll(self):
+        """
+        检查标定文件是否变化 (按 check_interval 限制检查频率)。
+        :return: 文件变化并且读取成功时返回新的阈值字典，否则返回 None。
+                 读取失败 (例如格式错误) 时打印警告并继续使用原来的阈值。
+        """
+        now = self.clock()
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return None
+        self._last_check = now
+
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return None
+        previous = self.thresholds
+        try:
+            thresholds = self.load()
+        except (ValueError, OSError) as e:
+            # 记下这次的文件状态，文件再次变化之前不再重复报错
+            self._signature = signature
+            print(f"警告: 标定文件读取失败，继续使用原来的阈值: {e}")
+            return None
+        # 文件被重新保存但当前方案的阈值没有变化 (例如只修改了其他方案) 时不算变化
+        return thresholds if thresholds != previous else None
+
+    def save_threshold(self, key, threshold, profile=None):
+        """
+        把一个阈值写入标定文件 (其余内容保持不变)。
+        :param key: THRESHOLD_KEYS 中的一个。
+        :param threshold: (H_min, S_min, V_min, H_max, S_max, V_max)。
+        :param profile: 写入的方案名，默认为当前使用的方案。
+        """
+        if key not in THRESHOLD_KEYS:
+            raise ValueError(f"未知的阈值项: {key}，可选: {THRESHOLD_KEYS}")
+        threshold = validate_threshold(threshold)
+        data = self._read_file()
+        name = profile or self.active_profile(data)
+        data["profiles"].setdefault(name, {})[key] = list(threshold)
+
+        # 先写临时文件再整体替换，正在运行的识别程序不会读到写了一半的内容
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,294 @@
+import cv2
+import glob
+import os
+import threading
+import time
+
+class ThreadedCapture:
+    """
+    在后台线程中持续读取摄像头画面的采集类。
+
+    主循环按顺序执行串口、检测和显示，任何一步变慢，摄像头驱动缓冲区里的画面
+    就会越积越多，检测到的始终是"过时"的画面。本类把 cv2.VideoCapture 放到
+    后台线程中不停地读取，写入一个预先分配好的小环形缓冲区，主循环每次读取时
+    总能拿到最新的一帧。
+
+    功能特性:
+    - 后台线程持续采集，主循环读取时总是返回最新帧。
+    - 环形缓冲区中的图像内存在第一帧之后复用，不会每帧重新分配。
+    - 记录每一帧的采集时间戳 (time.monotonic) 和帧编号。
+    - 统计被丢弃（没有被主循环读取就被覆盖）的帧数。
+    - read() 的返回值与 cv2.VideoCapture.read() 相同，可以直接替换。
+
+    快速使用:
+    1. 创建实例: `cap = ThreadedCapture(1)` (自动开始采集)
+    2. 读取最新帧: `ret, frame = cap.read()`
+    3. 结束时释放: `cap.release()`
+
+    注意: read() 返回的图像直接引用缓冲区，在下一次调用 read() 之前都是有效的，
+    如果需要长期保存，请自行 copy()。
+    """
+    # 实时画面源: 读取失败时应当重试，而不是认为画面已经结束
+    is_live = True
+
+    def __init__(self, source=1, buffer_size=3):
+        """
+        打开摄像头并启动后台采集线程。
+
+        :param source: 摄像头索引或视频地址，与 cv2.VideoCapture 的参数相同。
+        :param buffer_size: 环形缓冲区的槽位数量，至少为3
+                            (一个给主循环持有，一个存放最新帧，一个给采集线程写入)。
+        """
+        self.cap = cv2.VideoCapture(source)
+        self.buffer_size = max(3, buffer_size)
+
+        # --- 环形缓冲区 ---
+        # 每个槽位存放一帧图像及其时间戳和帧编号
+        self._frames = [None] * self.buffer_size
+        self._timestamps = [0.0] * self.buffer_size
+        self._frame_ids = [0] * self.buffer_size
+        # 最新一帧所在的槽位，-1 表示还没有采集到任何画面
+        self._latest_slot = -1
+        # 主循环当前持有的槽位，采集线程不会覆盖这个槽位
+        self._reader_slot = -1
+        self._cond = threading.Condition()
+
+        # --- 统计信息 ---
+        # 采集线程成功读取的总帧数
+        self.frame_count = 0
+        # 没有被主循环读取就被覆盖的帧数
+        self.dropped_frames = 0
+        # 主循环最近一次读取到的帧编号和采集时间戳
+        self.last_frame_id = 0
+        self.last_timestamp = 0.0
+
+        self._running = False
+        self._thread = None
+        if self.cap.isOpened():
+            self.start()
+
+    def start(self):
+        """启动后台采集线程。"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="ThreadedCapture", daemon=True)
+        self._thread.start()
+
+    def _next_write_slot(self):
+        """(内部方法) 选择下一个可写入的槽位，跳过最新帧和主循环正在使用的槽位。"""
+        slot = self._latest_slot
+        while True:
+            slot = (slot + 1) % self.buffer_size
+            if slot != self._latest_slot and slot != self._reader_slot:
+                return slot
+
+    def _capture_loop(self):
+        """(内部方法) 后台线程: 不停地读取摄像头画面并写入环形缓冲区。"""
+        while self._running:
+            with self._cond:
+                slot = self._next_write_slot()
+            # 该槽位既不是最新帧也不被主循环持有，可以在锁外直接写入
+            buffer = self._frames[slot]
+            if buffer is not None:
+                ret, frame = self.cap.read(buffer)
+            else:
+                ret, frame = self.cap.read()
+            timestamp = time.monotonic()
+
+            if not ret:
+                # 读取失败时稍作等待，避免空转占满CPU
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                self.frame_count += 1
+                self._frames[slot] = frame
+                self._timestamps[slot] = timestamp
+                self._frame_ids[slot] = self.frame_count
+                self._latest_slot = slot
+                self._cond.notify_all()
+
+    def read(self, timeout=1.0):
+        """
+        读取最新的一帧。如果自上次读取后还没有新画面，则最多等待 timeout 秒。
+
+        :param timeout: 等待新画面的最长时间（秒）。
+        :return: (ret, frame)，与 cv2.VideoCapture.read() 相同。超时返回 (False, None)。
+        """
+        with self._cond:
+            has_new_frame = self._cond.wait_for(
+                lambda: self._latest_slot >= 0 and self._frame_ids[self._latest_slot] > self.last_frame_id,
+                timeout=timeout
+            )
+            if not has_new_frame:
+                return False, None
+
+            slot = self._latest_slot
+            frame_id = self._frame_ids[slot]
+            # 两次读取之间被覆盖的帧都算作丢帧
+            if self.last_frame_id > 0:
+                self.dropped_frames += frame_id - self.last_frame_id - 1
+            self.last_frame_id = frame_id
+            self.last_timestamp = self._timestamps[slot]
+            self._reader_slot = slot
+            return True, self._frames[slot]
+
+    def frame_age(self):
+        """返回最近一次读取到的帧从采集到现在经过的时间（秒）。"""
+        return time.monotonic() - self.last_timestamp
+
+    def isOpened(self):
+        """摄像头是否已打开，与 cv2.VideoCapture.isOpened() 相同。"""
+        return self.cap.isOpened()
+
+    def release(self):
+        """停止后台采集线程并释放摄像头。"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        self.cap.release()
+
+
+class VideoFileSource:
+    """
+    从录制好的视频文件 (如 MP4) 中按顺序读取画面，用于离线回放。
+
+    与 ThreadedCapture 不同，本类不开后台线程，也不按视频的帧率等待，
+    每次 read() 都立即解码下一帧，不会丢帧，处理速度只取决于CPU。
+    同一个视频每次回放得到的画面序列完全相同，适合做回归测试。
+
+    快速使用:
+    1. `cap = VideoFileSource("game.mp4")`
+    2. `ret, frame = cap.read()`，视频读完后返回 (False, None)
+    3. `cap.release()`
+    """
+    # 离线画面源: 读取失败表示画面已经结束
+    is_live = False
+
+    def __init__(self, path, loop=False):
+        """
+        :param path: 视频文件路径。
+        :param loop: 读到结尾后是否从头开始重新播放。
+        """
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        # 与 ThreadedCapture 相同的统计信息，离线回放不会丢帧
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.last_frame_id = 0
+        self.last_timestamp = 0.0
+
+    def read(self, timeout=None):
+        """
+        读取下一帧。timeout 参数只是为了与 ThreadedCapture.read() 保持一致，不起作用。
+        :return: (ret, frame)，视频结束时返回 (False, None)。
+        """
+        ret, frame = self.cap.read()
+        if not ret and self.loop and self.frame_count > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            return False, None
+        self.frame_count += 1
+        self.last_frame_id = self.frame_count
+        self.last_timestamp = time.monotonic()
+        return True, frame
+
+    def frame_age(self):
+        return time.monotonic() - self.last_timestamp
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageFolderSource:
+    """
+    把一个文件夹中的图片 (按文件名排序) 当作连续的画面读取，用于离线回放。
+
+    快速使用:
+    1. `cap = ImageFolderSource("recordings/game1")`
+    2. `ret, frame = cap.read()`，所有图片读完后返回 (False, None)
+    3. `cap.release()`
+    """
+    # 离线画面源: 读取失败表示画面已经结束
+    is_live = False
+
+    # 默认读取的图片类型
+    IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg", "*.bmp")
+
+    def __init__(self, path, patterns=IMAGE_PATTERNS, loop=False):
+        """
+        :param path: 图片所在的文件夹。
+        :param patterns: 要读取的文件名通配符。
+        :param loop: 读完最后一张后是否从第一张重新开始。
+        """
+        self.path = path
+        self.loop = loop
+        files = set()
+        for pattern in patterns:
+            files.update(glob.glob(os.path.join(path, pattern)))
+        # 按文件名排序，录制时请使用补零的编号 (如 frame_000123.png) 保证顺序正确
+        self.files = sorted(files)
+        self._index = 0
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.last_frame_id = 0
+        self.last_timestamp = 0.0
+
+    def read(self, timeout=None):
+        """
+        读取下一张图片。timeout 参数只是为了与 ThreadedCapture.read() 保持一致，不起作用。
+        :return: (ret, frame)，所有图片读完后返回 (False, None)。无法解码的图片会被跳过。
+        """
+        while True:
+            if self._index >= len(self.files):
+                if not (self.loop and self.files):
+                    return False, None
+                self._index = 0
+            file_path = self.files[self._index]
+            self._index += 1
+            frame = cv2.imread(file_path)
+            if frame is None:
+                print(f"警告: 无法读取图片 {file_path}，已跳过")
+                self.dropped_frames += 1
+                continue
+            self.frame_count += 1
+            self.last_frame_id = self.frame_count
+            self.last_timestamp = time.monotonic()
+            return True, frame
+
+    def frame_age(self):
+        return time.monotonic() - self.last_timestamp
+
+    def isOpened(self):
+        return len(self.files) > 0
+
+    def release(self):
+        self._index = len(self.files)
+
+
+def open_source(source, threaded=True, loop=False):
+    """
+    根据 source 的类型打开对应的画面源，各个入口脚本的 --source 参数都通过它解析。
+    - 整数或纯数字字符串: 摄像头索引，threaded 为 True 时使用 ThreadedCapture，
+      否则直接使用 cv2.VideoCapture
+    - 文件夹路径: ImageFolderSource，按文件名顺序读取其中的图片
+    - 其他路径: VideoFileSource，按顺序读取视频文件
+    :param loop: 离线画面源读到结尾后是否从头开始。
+    :return: 画面源对象，都提供 read()、isOpened() 和 release()。
+    """
+    if isinstance(source, int) or str(source).isdigit():
+        index = int(source)
+        if threaded:
+            return ThreadedCapture(index)
+        return cv2.VideoCapture(index)
+    if os.path.isdir(source):
+        return ImageFolderSource(source, loop=loop)
+    return VideoFileSource(source, loop=loop)
+
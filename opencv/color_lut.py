@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+from hsv_frame import threshold_key
+
+class ColorLUT:
+    """
+    BGR 颜色 -> 颜色类别 的查找表。
+
+    每个像素原本要先 cvtColor 转换到 HSV，再对每个类别 (红色棋盘、白色棋子、黑色棋子……)
+    各做一次 inRange。HSV 阈值只是颜色的函数，所以可以对全部 2^24 种 BGR 颜色预先算好结果，
+    存成一张 16MB 的表: 表项的第 k 位为 1 表示该颜色属于第 k 个类别 (最多8个类别，可以重叠)。
+    之后每一帧只需一次查表就能同时得到所有类别，结果与 cvtColor + inRange 完全一致。
+
+    表只在阈值改变时重建 (configure() 会比较阈值，没有变化时直接返回)。
+
+    快速使用:
+    1. 创建实例: `lut = ColorLUT([("red", red_threshold), ("white", white_threshold)])`
+    2. 每一帧分类一次: `labels = lut.classify(bgr_image)`
+    3. 取某个类别的二值掩码: `lut.mask(labels, "red")`，或直接计数: `lut.count(labels, "white")`
+    """
+    MAX_CLASSES = 8
+    # 建表时每次处理的 R 通道取值个数 (每批 16*256*256 种颜色)，用于限制建表时的内存占用
+    _BUILD_CHUNK = 16
+
+    def __init__(self, classes=None):
+        """
+        :param classes: 可选，[(类别名, 阈值或阈值列表), ...]，见 configure()。
+        """
+        self.names = []
+        self.key = None
+        # 2^24 项的查找表，下标为 R<<16 | G<<8 | B
+        self.table = None
+        # 类别名 -> 位掩码
+        self.bits = {}
+        # 类别名 -> 256项的 cv2.LUT 表，把标签图映射为 0/255 二值掩码
+        self._mask_luts = {}
+        if classes:
+            self.configure(classes)
+
+    @staticmethod
+    def _as_list(thresholds):
+        """单个阈值元组转换为只有一个元素的列表；一个类别可以由多段阈值组成 (例如红色色相跨越0度)。"""
+        if isinstance(thresholds[0], (int, np.integer)):
+            return [thresholds]
+        return list(thresholds)
+
+    def configure(self, classes):
+        """
+        设置各个类别的阈值，阈值有变化时重建查找表。
+        :param classes: [(类别名, 阈值或阈值列表), ...]，阈值格式为 (H_min, S_min, V_min, H_max, S_max, V_max)。
+        :return: 重建了查找表时返回 True。
+        """
+        key = tuple((name, tuple(threshold_key(t) for t in self._as_list(thresholds)))
+                    for name, thresholds in classes)
+        if key == self.key:
+            return False
+        if len(key) > self.MAX_CLASSES:
+            raise ValueError(f"最多支持 {self.MAX_CLASSES} 个颜色类别，实际为 {len(key)} 个")
+
+        self.table = self._build_table([ranges for _, ranges in key])
+        self.key = key
+        self.names = [name for name, _ in key]
+        self.bits = {name: 1 << k for k, name in enumerate(self.names)}
+        self._mask_luts = {}
+        for name, bit in self.bits.items():
+            lut = np.zeros(256, dtype=np.uint8)
+            lut[(np.arange(256) & bit) != 0] = 255
+            self._mask_luts[name] = lut
+        return True
+
+    def _build_table(self, class_ranges):
+        """(内部方法) 对全部 BGR 颜色执行 cvtColor + inRange，生成查找表。"""
+        table = np.zeros(1 << 24, dtype=np.uint8)
+        chunk = self._BUILD_CHUNK
+        # 一批颜色排成 (chunk*256) x 256 的图像: 列号为 B，行号为 (R - r0)*256 + G，
+        # 按行展平后的下标正好是 R<<16 | G<<8 | B 减去 r0<<16
+        image = np.empty((chunk * 256, 256, 3), dtype=np.uint8)
+        image[:, :, 0] = np.arange(256, dtype=np.uint8)[None, :]
+        image[:, :, 1] = np.tile(np.arange(256, dtype=np.uint8), chunk)[:, None]
+        scratch = np.empty(image.shape[:2], dtype=np.uint8)
+        for r0 in range(0, 256, chunk):
+            image[:, :, 2] = np.repeat(np.arange(r0, r0 + chunk, dtype=np.uint8), 256)[:, None]
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            part = table[r0 << 16:(r0 + chunk) << 16].reshape(image.shape[:2])
+            for k, ranges in enumerate(class_ranges):
+                for t in ranges:
+                    cv2.inRange(hsv, np.array(t[:3]), np.array(t[3:]), dst=scratch)
+                    part[scratch > 0] |= 1 << k
+        return table
+
+    def classify(self, bgr, out=None):
+        """
+        对图像中的每个像素查表，得到类别位掩码图。
+        :param bgr: BGR 图像。
+        :param out: 可选，用于存放结果的 uint8 数组 (与图像同高宽)，用于复用内存。
+        :return: uint8 标签图，第 k 位为 1 表示该像素属于第 k 个类别。
+        """
+        # 补一个通道后按小端 uint32 读取，得到 A<<24 | R<<16 | G<<8 | B，去掉 A 即为表的下标
+        packed = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA).view("<u4").reshape(bgr.shape[:2])
+        np.bitwise_and(packed, 0xFFFFFF, out=packed)
+        # 下标一定在表的范围内，mode="clip" 可以省去越界检查和中间缓冲
+        return np.take(self.table, packed, out=out, mode="clip")
+
+    def bit(self, name):
+        """返回类别 name 在标签图中对应的位。"""
+        return self.bits[name]
+
+    def mask(self, labels, name, out=None):
+        """从标签图中取出类别 name 的二值掩码 (属于该类别为255，其余为0)。"""
+        return cv2.LUT(labels, self._mask_luts[name], dst=out)
+
+    def count(self, labels, name):
+        """统计标签图 (或其中一部分像素) 中属于类别 name 的像素个数。"""
+        return int(np.count_nonzero(np.bitwise_and(labels, self.bits[name])))
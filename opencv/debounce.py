@@ -0,0 +1,102 @@
+import time
+import numpy as np
+
+class CellDebouncer:
+    """
+    格子状态的时间滤波器 (去抖动)。
+
+    只比较前后两帧时，手从棋盘上方经过会在短时间内产生一连串虚假的"落子"/"移动"事件。
+    本类为每个格子保存最近 window 帧的原始检测结果 (一个 NumPy 环形缓冲区)，
+    按两级规则得到稳定状态:
+    1. N-of-M 投票: 最近 window 帧中至少有 votes 帧为"有子"才投票为有子，
+       至少有 votes 帧为"空"才投票为空，票数都不够时保持上一次的投票结果 (滞回)。
+    2. 稳定时间: 投票结果与稳定状态不同，并且持续了 stable_time 秒之后，才更新稳定状态。
+
+    快速使用:
+    1. 创建实例: `debouncer = CellDebouncer(window=5, votes=4, stable_time=0.3)`
+    2. 每一帧: `stable = debouncer.update(raw_occupied)`，raw_occupied 为长度9的布尔序列
+    3. `debouncer.settled()` 为 True 时，所有格子都已稳定，可以放心地比较前后状态、识别颜色
+    """
+    def __init__(self, num_cells=9, window=5, votes=4, stable_time=0.3, clock=time.monotonic):
+        """
+        :param num_cells: 格子数量。
+        :param window: 投票窗口的帧数 M。
+        :param votes: 改变投票结果所需的最少票数 N (不超过 window)。
+        :param stable_time: 投票结果需要保持多少秒才被认为是稳定状态。
+        :param clock: 获取当前时间 (秒) 的函数。离线回放时可以换成按帧号计算的时钟，使结果可复现。
+        """
+        self.num_cells = num_cells
+        self.window = window
+        self.votes = min(votes, window)
+        self.stable_time = stable_time
+        self.clock = clock
+
+        # 环形缓冲区: 每一行是一帧的原始检测结果，True 表示有子
+        self.history = np.zeros((window, num_cells), dtype=bool)
+        # 下一帧写入的行号，以及缓冲区中已有的帧数
+        self._index = 0
+        self._filled = 0
+        # 投票结果和稳定状态
+        self.voted = np.zeros(num_cells, dtype=bool)
+        self.stable = np.zeros(num_cells, dtype=bool)
+        # 投票结果开始与稳定状态不同的时间，NaN 表示两者一致
+        self.pending_since = np.full(num_cells, np.nan)
+
+    def reset(self, state=None):
+        """
+        清空历史记录。
+        :param state: 可选，长度为 num_cells 的布尔序列，作为新的稳定状态。默认全部为空。
+        """
+        self.history[:] = False
+        self._index = 0
+        self._filled = 0
+        self.stable[:] = False if state is None else np.asarray(state, dtype=bool)
+        self.voted[:] = self.stable
+        self.pending_since[:] = np.nan
+
+    def update(self, raw_occupied, now=None):
+        """
+        加入一帧原始检测结果，返回更新后的稳定状态。
+        :param raw_occupied: 长度为 num_cells 的布尔序列，True 表示这一帧检测到有子。
+        :param now: 当前时间 (秒)，默认调用 clock()。
+        :return: 稳定状态数组 (布尔，True 表示有子)。请不要修改它。
+        """
+        if now is None:
+            now = self.clock()
+        self.history[self._index] = raw_occupied
+        self._index = (self._index + 1) % self.window
+        self._filled = min(self._filled + 1, self.window)
+
+        # --- N-of-M 投票 ---
+        occupied_votes = self.history[:self._filled].sum(axis=0)
+        empty_votes = self._filled - occupied_votes
+        self.voted[occupied_votes >= self.votes] = True
+        self.voted[empty_votes >= self.votes] = False
+
+        # --- 稳定时间 ---
+        changed = self.voted != self.stable
+        # 投票结果与稳定状态一致的格子不再等待
+        self.pending_since[~changed] = np.nan
+        # 刚开始不一致的格子从现在开始计时
+        self.pending_since[changed & np.isnan(self.pending_since)] = now
+        # 保持足够久的格子更新为稳定状态
+        ready = changed & (now - self.pending_since >= self.stable_time)
+        if ready.any():
+            self.stable[ready] = self.voted[ready]
+            self.pending_since[ready] = np.nan
+        return self.stable
+
+    def settled(self):
+        """所有格子的投票结果都与稳定状态一致，且没有正在计时的格子时返回 True。"""
+        return not np.any(self.voted != self.stable)
+
+    def quiet(self):
+        """
+        投票窗口已填满，窗口中的每一帧都与稳定状态一致，且所有格子都已稳定时返回 True。
+        此时即使跳过后续的帧，也不会漏掉任何正在形成的状态变化。
+        """
+        return self._filled == self.window and not np.any(self.history != self.stable) and self.settled()
+
+    def unsettled_cells(self):
+        """返回还没有稳定下来的格子索引列表。"""
+        return np.flatnonzero(self.voted != self.stable).tolist()
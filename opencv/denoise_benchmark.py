@@ -0,0 +1,117 @@
+import argparse
+import time
+import cv2
+import numpy as np
+import camera
+import profiler
+from ChessDetector import ChessDetector, DENOISE_MODES, EMPTY_RATIO_THRESHOLD
+from pretreatment import DEBUG_OFF
+
+# 红色掩码去噪方式的 耗时-准确度 对比测试
+#
+# 在录制好的画面上，对同一张原始红色掩码分别执行 DENOISE_MODES 中的每一种去噪方式，
+# 统计每种方式的耗时分位数，并与基准方式 (默认为原有的 median_chain) 比较:
+#   - 空/非空判断结果与基准一致的格子比例
+#   - 格子红色像素比例与基准的最大差值
+# 选择判断结果与基准完全一致、耗时最短的方式，写入 ChessDetector.denoise_mode 即可。
+#
+# 用法示例:
+#   python denoise_benchmark.py --source recordings/game1.mp4
+#   python denoise_benchmark.py --source recordings/frames --kernel 7 --min-area 80
+
+# 在整张裁剪后的画面上 (而不是只在棋盘ROI内) 执行原有去噪链的对照项，用于衡量ROI节省的耗时
+FULL_FRAME_MODE = "median_chain@full"
+
+def run_benchmark(detector, cropped_frames, modes=DENOISE_MODES, reference="median_chain"):
+    """
+    对比各种去噪方式。除 modes 外，还会加入 FULL_FRAME_MODE 对照项。
+    :param detector: 已经 init() 成功的 ChessDetector。
+    :param cropped_frames: 裁剪后的画面列表。
+    :return: 列表，每个元素为 (去噪方式, StageStats, 判断一致率, 比例最大差值)。
+    """
+    modes = (FULL_FRAME_MODE,) + tuple(modes)
+    stats = {mode: profiler.StageStats(mode) for mode in modes}
+    agree = {mode: 0 for mode in modes}
+    max_diff = {mode: 0.0 for mode in modes}
+    cells = 0
+
+    for cropped in cropped_frames:
+        raw_mask = detector.compute_red_mask(detector.board_view(cropped))
+        ref_ratios = detector.compute_occupancy_ratios(detector.denoise_red_mask(raw_mask, reference))
+        ref_empty = ref_ratios > EMPTY_RATIO_THRESHOLD
+        cells += len(ref_ratios)
+
+        for mode in modes:
+            # 每种方式都从同一张原始掩码开始，准备掩码的耗时不计入统计
+            if mode == FULL_FRAME_MODE:
+                full_mask = detector.compute_red_mask(cropped)
+                start = time.perf_counter_ns()
+                mask = detector.denoise_red_mask(full_mask, "median_chain")
+                stats[mode].record(time.perf_counter_ns() - start)
+                # 二值掩码按最近邻校正，不产生中间灰度
+                mask = detector.board_view(mask, cv2.INTER_NEAREST)
+            else:
+                start = time.perf_counter_ns()
+                mask = detector.denoise_red_mask(raw_mask, mode)
+                stats[mode].record(time.perf_counter_ns() - start)
+            ratios = detector.compute_occupancy_ratios(mask)
+            agree[mode] += int(np.count_nonzero((ratios > EMPTY_RATIO_THRESHOLD) == ref_empty))
+            max_diff[mode] = max(max_diff[mode], float(np.max(np.abs(ratios - ref_ratios))))
+
+    return [(mode, stats[mode], agree[mode] / cells if cells else 0.0, max_diff[mode]) for mode in modes]
+
+
+def print_report(rows, reference="median_chain"):
+    print(f"\n--- 去噪方式对比 (基准: {reference}) ---")
+    print(f"{'mode':<20}{'mean ms':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'agree':>10}{'max diff':>10}")
+    for mode, stats, agreement, diff in rows:
+        print(f"{mode:<20}{stats.mean():>10.3f}{stats.percentile(50):>9.3f}{stats.percentile(95):>9.3f}"
+              f"{stats.percentile(99):>9.3f}{agreement:>9.2%}{diff:>10.3f}")
+    exact = [(stats.mean(), mode) for mode, stats, agreement, _ in rows if agreement == 1.0]
+    if exact:
+        print(f"\n判断结果与基准完全一致的方式中最快的是: {min(exact)[1]}")
+    else:
+        print("\n没有与基准判断结果完全一致的方式，请调整 --kernel / --min-area 后重试。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="红色掩码去噪方式的耗时-准确度对比")
+    parser.add_argument("--source", required=True, help="录制好的视频文件或图片文件夹")
+    parser.add_argument("--reference", default="median_chain", choices=DENOISE_MODES, help="作为基准的去噪方式")
+    parser.add_argument("--kernel", type=int, default=None, help="median / box 方式的核大小 (奇数)")
+    parser.add_argument("--min-area", type=int, default=None, help="components 方式的最小连通域面积")
+    parser.add_argument("--rectified", action="store_true", help="在透视校正后的标准棋盘图像上测试")
+    parser.add_argument("--max-frames", type=int, default=0, help="最多使用的帧数，0 表示全部")
+    args = parser.parse_args()
+
+    cap = camera.open_source(args.source, threaded=False)
+    detector = ChessDetector(cap, debug=DEBUG_OFF, use_serial=False, profile=False)
+    if args.rectified:
+        detector.geometry_mode = "rectified"
+    if args.kernel:
+        detector.denoise_kernel = args.kernel
+    if args.min_area:
+        detector.denoise_min_area = args.min_area
+
+    # 先用录像中的画面初始化棋盘，之后的画面都用于测试
+    initialized = False
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if not initialized:
+            initialized = detector.init(frame)
+            continue
+        frames.append(detector.pretreatment.crop(frame))
+        if args.max_frames and len(frames) >= args.max_frames:
+            break
+    cap.release()
+
+    if not initialized:
+        print("未能在录像中识别到棋盘。")
+    elif not frames:
+        print("棋盘初始化之后没有可用于测试的画面。")
+    else:
+        print(f"共 {len(frames)} 帧用于测试")
+        print_report(run_benchmark(detector, frames, reference=args.reference), args.reference)
@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+
+def threshold_key(threshold):
+    """把 (H_min, S_min, V_min, H_max, S_max, V_max) 阈值转换为可作为字典键的整数元组。"""
+    return tuple(int(v) for v in threshold)
+
+
+class HSVFrame:
+    """
+    一帧图像的 HSV 转换、阈值掩码和颜色类别标签图的缓存。
+
+    同一帧图像会被多个环节按不同的阈值检测 (棋盘红色背景、白色棋子、黑色棋子……)，
+    如果每个环节都自己调用 cv2.cvtColor，同一帧就会被重复转换多次。
+    本类在第一次需要时才把图像转换为 HSV，之后所有环节共用这一份结果；
+    每个阈值的 inRange 掩码也只计算一次，按阈值缓存。
+    需要同时判断多个颜色类别时，用 labels() 通过查找表 (color_lut.ColorLUT) 一次得到所有类别。
+
+    调用 reset() 换成下一帧时，HSV 图像和掩码的内存会被复用 (尺寸不变时不再重新分配)。
+    因此 hsv()、mask() 和 labels() 返回的数组只在当前帧内有效，需要保留时请自行 copy()。
+
+    快速使用:
+    1. 创建实例: `frame_hsv = HSVFrame()`，每一帧: `frame_hsv.reset(bgr_image)`
+    2. 获取HSV图像: `frame_hsv.hsv()`
+    3. 获取阈值掩码: `frame_hsv.mask((143, 105, 159, 179, 255, 255))`
+    """
+    def __init__(self, bgr=None):
+        """
+        :param bgr: 可选，BGR 图像。也可以之后再调用 reset() 设置。
+        """
+        self.bgr = None
+        # HSV 图像的缓冲区，以及它是否已经对应当前帧
+        self._hsv = None
+        self._hsv_valid = False
+        # 阈值 -> 掩码缓冲区；当前帧已经计算过的阈值
+        self._masks = {}
+        self._valid_masks = set()
+        # 颜色类别标签图的缓冲区，以及当前帧是用哪个查找表 (及其阈值) 计算的
+        self._labels = None
+        self._labels_source = None
+
+        # --- 统计信息 ---
+        self.conversions = 0   # 实际执行的 cvtColor 次数
+        self.mask_requests = 0  # mask() 被调用的次数
+        self.mask_hits = 0      # 其中直接使用缓存的次数
+
+        if bgr is not None:
+            self.reset(bgr)
+
+    def reset(self, bgr):
+        """换成新的一帧图像，之前的 HSV 图像和掩码全部失效。"""
+        self.bgr = bgr
+        self._hsv_valid = False
+        self._valid_masks.clear()
+        self._labels_source = None
+
+    def hsv(self):
+        """返回当前帧的 HSV 图像，第一次调用时才进行转换。"""
+        if not self._hsv_valid:
+            if self._hsv is not None and self._hsv.shape == self.bgr.shape:
+                cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV, dst=self._hsv)
+            else:
+                self._hsv = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+            self._hsv_valid = True
+            self.conversions += 1
+        return self._hsv
+
+    def mask(self, threshold):
+        """
+        返回当前帧在阈值 threshold 下的二值掩码 (范围内为255，其余为0)。
+        :param threshold: (H_min, S_min, V_min, H_max, S_max, V_max)。
+        """
+        key = threshold_key(threshold)
+        self.mask_requests += 1
+        buffer = self._masks.get(key)
+        if key in self._valid_masks:
+            self.mask_hits += 1
+            return buffer
+
+        hsv = self.hsv()
+        lower = np.array(key[:3])
+        upper = np.array(key[3:])
+        if buffer is not None and buffer.shape == hsv.shape[:2]:
+            cv2.inRange(hsv, lower, upper, dst=buffer)
+        else:
+            buffer = self._masks[key] = cv2.inRange(hsv, lower, upper)
+        self._valid_masks.add(key)
+        return buffer
+
+    def labels(self, lut):
+        """
+        返回当前帧的颜色类别标签图，每个像素的第 k 位表示是否属于查找表中的第 k 个类别。
+        直接由 BGR 图像查表得到，不需要 HSV 转换。
+        :param lut: color_lut.ColorLUT 实例。
+        """
+        source = (id(lut), lut.key)
+        if self._labels_source != source:
+            out = self._labels if self._labels is not None and self._labels.shape == self.bgr.shape[:2] else None
+            self._labels = lut.classify(self.bgr, out=out)
+            self._labels_source = source
+        return self._labels
@@ -1,17 +1,27 @@
+import argparse
+import time
 import cv2
 import numpy as np
+import camera
+import calibration
 
 def nothing(x):
     """Callback function for trackbars. Does nothing."""
     pass
 
-def create_hsv_tuner():
+def create_hsv_tuner(source=1, target=None, store=None):
     """
     Creates a window with trackbars to tune HSV values for color segmentation.
-    Uses the webcam as video source.
+    Uses the webcam as video source by default; a recorded video file or a
+    directory of images can be given instead and is played in a loop.
+
+    If a calibration target (one of calibration.THRESHOLD_KEYS) and a
+    CalibrationStore are given, the trackbars start from the stored value
+    and 'w' writes the current threshold to the calibration file, where a
+    running detector picks it up without restarting.
     """
-    # Open the default camera
-    cap = cv2.VideoCapture(1)
+    # Open the camera, video file or image directory
+    cap = camera.open_source(source, threaded=False, loop=True)
     if not cap.isOpened():
         print("Error: Could not open video stream.")
         return
@@ -29,9 +39,23 @@ def create_hsv_tuner():
     cv2.createTrackbar('V_min', 'Trackbars', 0, 255, nothing)
     cv2.createTrackbar('V_max', 'Trackbars', 255, 255, nothing)
 
+    # Start from the stored threshold, if there is one
+    if target and store:
+        try:
+            stored = store.load().get(target)
+        except ValueError as e:
+            print(f"Warning: could not read calibration file: {e}")
+            stored = None
+        if stored:
+            for name, value in zip(('H_min', 'S_min', 'V_min', 'H_max', 'S_max', 'V_max'), stored):
+                cv2.setTrackbarPos(name, 'Trackbars', value)
+            print(f"Loaded '{target}' threshold from {store.path}: {stored}")
+
     print("\nHSV Tuner started.")
     print("Adjust the sliders to find the desired color range.")
     print("Press 's' to print the current threshold in a copy-paste format.")
+    if target and store:
+        print(f"Press 'w' to write the current threshold to {store.path} as '{target}'.")
     print("Press 'q' to quit.")
 
     while True:
@@ -79,6 +103,13 @@ def create_hsv_tuner():
             print("\n\n--- Copy-paste this line ---")
             print(f"hsv_threshold = ({h_min}, {s_min}, {v_min}, {h_max}, {s_max}, {v_max})")
             print("----------------------------\n")
+        elif key == ord('w') and target and store:
+            threshold = (h_min, s_min, v_min, h_max, s_max, v_max)
+            try:
+                store.save_threshold(target, threshold)
+                print(f"\n\nSaved '{target}' = {threshold} to {store.path}\n")
+            except (ValueError, OSError) as e:
+                print(f"\n\nError: could not save threshold: {e}\n")
 
     # Release the camera and destroy all windows
     cap.release()
@@ -86,5 +117,276 @@ def create_hsv_tuner():
     print("\nHSV Tuner closed.")
 
 
+# --- Automatic fitting ---
+# Cell labels accepted by --sample: e = empty (red board), h = human (white piece), r = robot (black piece)
+CELL_LABELS = {"e": "red_board", "h": "white_piece", "r": "black_piece"}
+# Histogram resolution used for fitting: H is 0-179, S and V are 0-255.
+# Bounds found by the fit are therefore multiples of 2 (H) or 4 (S, V).
+HSV_LIMITS = (180, 256, 256)
+HIST_BINS = (90, 64, 64)
+
+
+def parse_cell_labels(text):
+    """Parse a 9-letter labelling such as 'ehe-ere-eee' (separators are ignored) into class names."""
+    letters = [c for c in text.lower() if c.isalpha()]
+    if len(letters) != 9 or any(c not in CELL_LABELS for c in letters):
+        raise ValueError(f"expected 9 cell labels from {sorted(CELL_LABELS)}, got {text!r}")
+    return [CELL_LABELS[c] for c in letters]
+
+
+def hsv_histogram(pixels):
+    """3-D histogram (HIST_BINS) of an (N, 3) array of HSV pixels."""
+    idx = pixels.astype(np.int64) * np.array(HIST_BINS) // np.array(HSV_LIMITS)
+    flat = np.ravel_multi_index(idx.T, HIST_BINS)
+    return np.bincount(flat, minlength=int(np.prod(HIST_BINS))).reshape(HIST_BINS)
+
+
+def _cumulative(hist):
+    """Summed-volume table with a zero border, so any box sum takes 8 lookups."""
+    cum = np.zeros(tuple(n + 1 for n in hist.shape), dtype=np.int64)
+    cum[1:, 1:, 1:] = hist.cumsum(0).cumsum(1).cumsum(2)
+    return cum
+
+
+def _box_sums(cum, lo, hi):
+    """
+    Sum of the histogram inside boxes [lo, hi] (inclusive bin indices).
+    lo and hi are (K, 3) arrays, so K candidate boxes are evaluated at once.
+    """
+    lo = np.asarray(lo).reshape(-1, 3)
+    hi = np.asarray(hi).reshape(-1, 3) + 1
+    total = 0
+    for corner in range(8):
+        pick = [(corner >> axis) & 1 for axis in range(3)]
+        index = tuple(np.where(pick[axis], hi[:, axis], lo[:, axis]) for axis in range(3))
+        sign = -1 if (3 - sum(pick)) % 2 else 1
+        total = total + sign * cum[index]
+    return total
+
+
+def fit_hsv_box(positive, negative, fp_weight=4.0, coverage=0.98, max_passes=20):
+    """
+    Fit an axis-aligned HSV box that contains the positive pixels and avoids the negative ones.
+
+    Starts from the per-channel quantile box that covers `coverage` of the positives, then
+    moves one bound at a time to the position maximising
+        recall - fp_weight * false_positive_rate
+    where every candidate position of a bound is scored at once from summed-volume tables.
+
+    :param positive: (N, 3) HSV pixels of the class.
+    :param negative: (M, 3) HSV pixels of all other classes.
+    :return: (lo_bins, hi_bins, pos_cum, neg_cum) for use with box_report().
+    """
+    pos_cum = _cumulative(hsv_histogram(positive))
+    neg_cum = _cumulative(hsv_histogram(negative))
+    pos_total = max(int(pos_cum[-1, -1, -1]), 1)
+    neg_total = max(int(neg_cum[-1, -1, -1]), 1)
+
+    # Starting box: central quantiles of each channel
+    tail = (1.0 - coverage) / 2 * 100
+    lo_q = np.percentile(positive, tail, axis=0)
+    hi_q = np.percentile(positive, 100 - tail, axis=0)
+    lo = (lo_q.astype(np.int64) * np.array(HIST_BINS) // np.array(HSV_LIMITS))
+    hi = (hi_q.astype(np.int64) * np.array(HIST_BINS) // np.array(HSV_LIMITS))
+
+    def score(lo_boxes, hi_boxes):
+        recall = _box_sums(pos_cum, lo_boxes, hi_boxes) / pos_total
+        fpr = _box_sums(neg_cum, lo_boxes, hi_boxes) / neg_total
+        return recall - fp_weight * fpr
+
+    best = score(lo, hi)[0]
+    for _ in range(max_passes):
+        improved = False
+        for axis in range(3):
+            for side in ("lo", "hi"):
+                # All valid positions of this bound, with the other five bounds fixed
+                if side == "lo":
+                    values = np.arange(0, hi[axis] + 1)
+                else:
+                    values = np.arange(lo[axis], HIST_BINS[axis])
+                lo_boxes = np.repeat(lo[None, :], len(values), axis=0)
+                hi_boxes = np.repeat(hi[None, :], len(values), axis=0)
+                (lo_boxes if side == "lo" else hi_boxes)[:, axis] = values
+                scores = score(lo_boxes, hi_boxes)
+                k = int(np.argmax(scores))
+                if scores[k] > best + 1e-9:
+                    best = scores[k]
+                    (lo if side == "lo" else hi)[axis] = values[k]
+                    improved = True
+        if not improved:
+            break
+    return lo, hi, pos_cum, neg_cum
+
+
+def bins_to_threshold(lo, hi):
+    """Convert inclusive bin bounds to an (H_min, S_min, V_min, H_max, S_max, V_max) threshold."""
+    width = np.array(HSV_LIMITS) // np.array(HIST_BINS)
+    lower = lo * width
+    upper = np.minimum((hi + 1) * width - 1, np.array(HSV_LIMITS) - 1)
+    return tuple(int(v) for v in (*lower, *upper))
+
+
+def box_report(lo, hi, pos_cum, neg_cum, tolerance=0.001):
+    """
+    Quality of a fitted box.
+    :return: dict with
+        recall: fraction of the class pixels inside the box,
+        false_positive: fraction of other-class pixels inside the box,
+        margin: how far (in H/S/V units) the tightest bound can drift outwards before another
+                `tolerance` of the other-class pixels falls inside; larger is more robust.
+    """
+    pos_total = max(int(pos_cum[-1, -1, -1]), 1)
+    neg_total = max(int(neg_cum[-1, -1, -1]), 1)
+    base_neg = _box_sums(neg_cum, lo, hi)[0]
+    width = np.array(HSV_LIMITS) // np.array(HIST_BINS)
+    margin = None
+    for axis in range(3):
+        for side in ("lo", "hi"):
+            steps = np.arange(1, HIST_BINS[axis])
+            lo_boxes = np.repeat(lo[None, :], len(steps), axis=0)
+            hi_boxes = np.repeat(hi[None, :], len(steps), axis=0)
+            if side == "lo":
+                lo_boxes[:, axis] = lo[axis] - steps
+                valid = lo_boxes[:, axis] >= 0
+            else:
+                hi_boxes[:, axis] = hi[axis] + steps
+                valid = hi_boxes[:, axis] < HIST_BINS[axis]
+            if not valid.any():
+                # The bound already sits at the end of the range
+                continue
+            extra = (_box_sums(neg_cum, lo_boxes[valid], hi_boxes[valid]) - base_neg) / neg_total
+            over = np.flatnonzero(extra > tolerance)
+            slack = (over[0] if len(over) else int(valid.sum())) * int(width[axis])
+            margin = slack if margin is None else min(margin, slack)
+    return {
+        "recall": _box_sums(pos_cum, lo, hi)[0] / pos_total,
+        "false_positive": base_neg / neg_total,
+        "margin": margin if margin is not None else 0,
+    }
+
+
+def collect_labelled_pixels(detector, samples, max_frames=10):
+    """
+    Gather HSV pixels per cell label from labelled recordings.
+
+    The board is located with detector.init() on the first frame of a sample where it
+    succeeds. Pieces can hide cells from the grid search, so when a sample's board
+    cannot be located the geometry of the previous sample is reused (the camera is
+    assumed not to have moved); listing an all-empty sample first is the easy way to
+    guarantee this.
+    :param detector: ChessDetector used to locate the board.
+    :param samples: list of (source, labels) where labels is a list of 9 class names.
+    :return: dict class name -> list of (N, 3) HSV pixel arrays, one per labelled cell and frame.
+    """
+    pixels = {name: [] for name in CELL_LABELS.values()}
+    have_geometry = False
+    for source, labels in samples:
+        cap = camera.open_source(source, threaded=False)
+        frames = []
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+
+        located = any(detector.init(frame) for frame in frames)
+        if not located:
+            if not have_geometry:
+                print(f"Warning: board not found in {source}, sample skipped.")
+                continue
+            print(f"Note: board not found in {source}, using the previous board position.")
+        have_geometry = True
+
+        # detector cell indices follow the contour search order; labels are written row by row
+        order = detector.board_order
+        for frame in frames:
+            cropped = detector.pretreatment.crop(frame)
+            hsv = cv2.cvtColor(detector.board_view(cropped), cv2.COLOR_BGR2HSV)
+            for i, name in zip(order, labels):
+                pixels[name].append(hsv[detector.cell_slices[i]][detector.cell_masks[i]])
+    return pixels
+
+
+def fit_thresholds(pixels, fp_weight=4.0):
+    """
+    Fit board red, white piece and black piece thresholds from labelled cell pixels.
+
+    Empty cells are all board. A piece only covers part of its cell, so the red box
+    is first estimated from the empty cells alone and the remaining (non-red) pixels
+    of piece cells are taken as piece pixels; every class is then fitted against the
+    pixels of the other two classes.
+    :return: dict class name -> (threshold, report), only for classes that have samples.
+    """
+    stacked = {name: np.concatenate(parts) if parts else np.empty((0, 3), np.uint8)
+               for name, parts in pixels.items()}
+    if len(stacked["red_board"]) == 0:
+        raise ValueError("at least one empty cell is needed to fit the board colour")
+
+    # Rough board box from empty cells only, used to strip the board around each piece
+    lo, hi, _, _ = fit_hsv_box(stacked["red_board"], np.empty((0, 3), np.uint8), coverage=0.999, max_passes=0)
+    rough = np.array(bins_to_threshold(lo, hi))
+    for name in ("white_piece", "black_piece"):
+        p = stacked[name]
+        on_board = np.all((p >= rough[:3]) & (p <= rough[3:]), axis=1)
+        stacked[name] = p[~on_board]
+
+    results = {}
+    for name, positive in stacked.items():
+        if len(positive) == 0:
+            continue
+        negative = np.concatenate([stacked[other] for other in stacked if other != name])
+        lo, hi, pos_cum, neg_cum = fit_hsv_box(positive, negative, fp_weight=fp_weight)
+        results[name] = (bins_to_threshold(lo, hi), box_report(lo, hi, pos_cum, neg_cum))
+    return results
+
+
+def run_fit(samples, store=None, write=False, max_frames=10, fp_weight=4.0):
+    """Non-interactive mode: fit thresholds from labelled samples, print them and optionally save them."""
+    # Imported here so the interactive tuner does not depend on the detector
+    from ChessDetector import ChessDetector
+    from pretreatment import DEBUG_OFF
+
+    start = time.perf_counter()
+    detector = ChessDetector(None, debug=DEBUG_OFF, use_serial=False, profile=False, calibration_store=store)
+    pixels = collect_labelled_pixels(detector, samples, max_frames)
+    results = fit_thresholds(pixels, fp_weight)
+    elapsed = time.perf_counter() - start
+
+    print(f"\nFitted thresholds ({elapsed:.2f} s):")
+    print(f"{'class':<14}{'threshold':<34}{'recall':>9}{'false pos':>11}{'margin':>8}")
+    for name, (threshold, report) in results.items():
+        print(f"{name:<14}{str(threshold):<34}{report['recall']:>9.2%}"
+              f"{report['false_positive']:>11.3%}{report['margin']:>8}")
+    if write and store:
+        for name, (threshold, _) in results.items():
+            store.save_threshold(name, threshold)
+        print(f"Saved to {store.path}")
+    return results
+
+
 if __name__ == "__main__":
-    create_hsv_tuner() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="HSV threshold tuner")
+    parser.add_argument("--source", default="1",
+                        help="camera index (default 1), video file or image directory")
+    parser.add_argument("--target", choices=calibration.THRESHOLD_KEYS, default=None,
+                        help="threshold to calibrate; enables writing it to the calibration file with 'w'")
+    parser.add_argument("--calibration", default=calibration.DEFAULT_CALIBRATION_PATH,
+                        help="calibration file to read from and write to")
+    parser.add_argument("--profile", default=None,
+                        help="calibration profile to use (default: the file's active profile)")
+    parser.add_argument("--sample", nargs=2, action="append", metavar=("SOURCE", "LABELS"),
+                        help="non-interactive fit: a video, image or image directory of a static board and "
+                             "its 9 cell labels row by row (e=empty, h=human/white, r=robot/black), "
+                             "e.g. --sample frames/ ehe-ere-eee. May be given several times")
+    parser.add_argument("--max-frames", type=int, default=10, help="frames used per sample")
+    parser.add_argument("--write", action="store_true", help="save the fitted thresholds to the calibration file")
+    args = parser.parse_args()
+
+    if args.sample:
+        store = calibration.CalibrationStore(args.calibration, profile=args.profile)
+        samples = [(source, parse_cell_labels(labels)) for source, labels in args.sample]
+        run_fit(samples, store, write=args.write, max_frames=args.max_frames)
+    else:
+        store = calibration.CalibrationStore(args.calibration, profile=args.profile) if args.target else None
+        create_hsv_tuner(args.source, args.target, store)
\ No newline at end of file
@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    基于画面变化的跳帧判断。
+
+    对局中的绝大多数时间棋盘都是静止的，没有必要每一帧都执行完整的
+    HSV转换、形态学滤波和格子统计。本类把棋盘ROI缩小成一张很小的缩略图，
+    与上一次"被处理"的帧的缩略图做 absdiff，变化的像素足够少时就跳过这一帧。
+    缩略图保留彩色: 深色棋子与红色棋盘的灰度可能非常接近，只比较灰度会漏掉落子。
+
+    参考缩略图只在帧被处理时更新，缓慢的变化 (如光照漂移) 累积到阈值后也会触发一次处理。
+
+    快速使用:
+    1. 创建实例: `gate = MotionGate()`
+    2. 每一帧: `if gate.should_process(roi_frame): ...完整处理...`
+    3. 查看跳帧比例: `gate.skip_ratio()`
+    """
+    def __init__(self, scale=8, pixel_threshold=25, area_ratio=0.005):
+        """
+        :param scale: 缩略图的缩小倍数。
+        :param pixel_threshold: 缩略图上任一颜色通道的变化超过该值的像素被认为发生了变化。
+        :param area_ratio: 发生变化的像素占缩略图的比例超过该值时，认为画面有变化。
+        """
+        self.scale = scale
+        self.pixel_threshold = pixel_threshold
+        self.area_ratio = area_ratio
+        # 上一次被处理的帧的缩略图
+        self.reference = None
+
+        # --- 统计信息 ---
+        self.checked_frames = 0
+        self.skipped_frames = 0
+
+    def thumbnail(self, frame):
+        """
+        把图像缩小 scale 倍。
+        使用双线性插值而不是区域平均 (INTER_AREA): 后者在这个尺寸上要慢几十倍，
+        而传感器噪声远小于 pixel_threshold，偶尔的误判也只是多处理一帧。
+        """
+        h, w = frame.shape[:2]
+        size = (max(w // self.scale, 1), max(h // self.scale, 1))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+
+    def should_process(self, frame, force=False):
+        """
+        判断这一帧是否需要完整处理。需要处理时同时把它记为新的参考帧。
+        :param frame: 棋盘ROI图像。
+        :param force: 为 True 时不论画面是否变化都处理 (例如时间滤波还没有稳定下来)。
+        :return: True 表示需要处理，False 表示可以跳过。
+        """
+        self.checked_frames += 1
+        thumb = self.thumbnail(frame)
+        if not force and self.reference is not None and self.reference.shape == thumb.shape:
+            diff = cv2.absdiff(thumb, self.reference)
+            if diff.ndim == 3:
+                # 每个像素取变化最大的颜色通道
+                diff = diff.max(axis=2)
+            changed = np.count_nonzero(diff > self.pixel_threshold)
+            if changed <= self.area_ratio * diff.size:
+                self.skipped_frames += 1
+                return False
+        self.reference = thumb
+        return True
+
+    def reset(self):
+        """清除参考帧，下一帧一定会被处理。"""
+        self.reference = None
+
+    def skip_ratio(self):
+        """返回被跳过的帧占检查过的帧的比例。"""
+        return self.skipped_frames / self.checked_frames if self.checked_frames else 0.0
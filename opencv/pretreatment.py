@@ -1,5 +1,16 @@
 import cv2
 import numpy as np
+from hsv_frame import HSVFrame
+from color_lut import ColorLUT
+
+# --- 调试等级定义 ---
+# 用于控制是否复制图像、绘制调试信息以及调用 cv2.imshow 等GUI函数
+DEBUG_OFF = 0      # 生产模式：不做任何额外的复制、绘制和GUI调用，可在无显示器的设备上运行
+DEBUG_RESULT = 1   # 只显示最终结果窗口
+DEBUG_VERBOSE = 2  # 显示所有中间过程窗口（掩码、滤波结果等）
+
+# 透视校正后的标准棋盘图像的边长 (像素)
+RECTIFIED_SIZE = 192
 
 # 图像预处理类
 # 用于处理摄像头捕获的原始图像，将其转换为二值图像，并提取出棋盘和棋格的轮廓。
@@ -13,7 +24,8 @@ class Pretreatment:
     # 类的构造函数，在创建类的新实例时自动调用。
     def __init__(self, x_ratio=0.5, y_ratio=1, 
                  black_threshold=(0, 0, 0, 179, 255, 189), 
-                 red_thresholds=[(0, 100, 100, 10, 255, 255), (170, 100, 100, 180, 255, 255)]):
+                 red_thresholds=[(0, 100, 100, 10, 255, 255), (170, 100, 100, 180, 255, 255)],
+                 debug=DEBUG_VERBOSE):
         # 定义一个3x3的结构元素（或称为核），用于形态学操作。
         # 形态学操作（如腐蚀、膨胀）使用这个核来处理图像的像素。
         self.kernel = np.ones((3, 3), np.uint8)
@@ -23,21 +35,51 @@ class Pretreatment:
         self.y_ratio = y_ratio
         
         # 解析黑色阈值
-        self.lower_black = np.array([black_threshold[0], black_threshold[1], black_threshold[2]])
-        self.upper_black = np.array([black_threshold[3], black_threshold[4], black_threshold[5]])
+        self.set_black_threshold(black_threshold)
         # 存储红色阈值
         self.red_thresholds = red_thresholds
+        # thresholdHsv 使用的查找表。只保留一张 (16MB)，阈值改变时重建
+        self._threshold_lut = ColorLUT()
+        # 调试等级，取值为 DEBUG_OFF / DEBUG_RESULT / DEBUG_VERBOSE
+        self.debug = debug
+        # 最近一次 get_grid 找到的棋盘四个顶点 (裁剪后图像坐标)，没有找到时为 None
+        # 棋盘跟踪 (tracker.py) 以这四个顶点为基准
+        self.board_corners = None
+        # 透视校正: 裁剪后图像 -> 标准棋盘图像的单应矩阵，以及 cv2.remap 使用的映射表
+        # 由 build_rectify_maps() 计算，之后每一帧都直接复用
+        self.rectified_size = RECTIFIED_SIZE
+        self.rectify_homography = None
+        self.rectify_maps = None
         pass
 
+    # 设置识别棋盘所用的黑色阈值 (运行中重新标定时也调用这个方法)。
+    # 参数：
+    #   black_threshold: (H_min, S_min, V_min, H_max, S_max, V_max)。
+    def set_black_threshold(self, black_threshold):
+        self.black_threshold = tuple(black_threshold)
+        self.lower_black = np.array([black_threshold[0], black_threshold[1], black_threshold[2]])
+        self.upper_black = np.array([black_threshold[3], black_threshold[4], black_threshold[5]])
+        # 纯黑像素 (0, 0, 0) 是否落在黑色阈值范围内。
+        # 被掩码遮住的区域相当于纯黑像素，preprocess 在 region 之外直接填这个值，无需重新转换图像
+        self._black_includes_zero = bool(np.all(self.lower_black <= 0))
+
     # 预处理图像，通过一系列操作来清洁图像，突出显示感兴趣的特征。
     # 参数：
     #   image: 需要处理的原始彩色图像。
-    def preprocess(self, image):
-        # 步骤1: 将彩色图像转换为HSV图像。
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    #   frame_hsv: 可选，image 对应的 HSVFrame。传入时复用其中已经转换好的HSV图像和阈值掩码。
+    #   region: 可选，与 image 同尺寸的掩码。结果等价于对 cv2.bitwise_and(image, image, mask=region) 预处理，
+    #           但不需要生成遮罩后的图像副本，也不需要再做一次颜色转换。
+    def preprocess(self, image, frame_hsv=None, region=None):
+        # 步骤1: 将彩色图像转换为HSV图像 (同一帧只转换一次)。
+        if frame_hsv is None:
+            frame_hsv = HSVFrame(image)
 
         # 步骤2: 根据黑色阈值进行颜色过滤，得到二值图像
-        binary = cv2.inRange(hsv, self.lower_black, self.upper_black)
+        binary = frame_hsv.mask(self.black_threshold)
+        if region is not None:
+            # region 之外的像素视为纯黑 (0, 0, 0)。缓存的掩码属于 frame_hsv，不能原地修改
+            binary = binary.copy()
+            binary[region == 0] = 255 if self._black_includes_zero else 0
 
 
         # --- 形态学操作，用于优化二值图像 ---
@@ -93,20 +135,19 @@ class Pretreatment:
         # 使用NumPy的切片功能裁剪图像，并返回裁剪后的部分。
         return image[y_start:y_end, x_start:x_end]
 
-    def thresholdHsv(self, image, thresholds):
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        # 检查传入的是单个阈值元组还是多个阈值元组的列表
-        if isinstance(thresholds[0], int):
-            thresholds = [thresholds]
-        
-        final_mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        for t in thresholds:
-            lower = np.array([t[0], t[1], t[2]])
-            upper = np.array([t[3], t[4], t[5]])
-            mask = cv2.inRange(hsv, lower, upper)
-            final_mask = cv2.bitwise_or(final_mask, mask)
-            
-        return final_mask
+    # 按一个或多个HSV阈值提取掩码，多个阈值的结果取并集。
+    # 多段阈值合并在一张查找表 (color_lut.ColorLUT) 中，一次查表即可得到并集，不需要 HSV 转换和逐段 bitwise_or。
+    # 查找表只有一张，与上一次调用的阈值不同时会重建 (约0.3秒)，不适合每一帧交替使用不同的阈值。
+    # 参数：
+    #   image: 彩色图像。
+    #   thresholds: 单个阈值元组，或多个阈值元组的列表。
+    #   frame_hsv: 可选，image 对应的 HSVFrame，传入时复用其中已经查表得到的标签图。
+    def thresholdHsv(self, image, thresholds, frame_hsv=None):
+        lut = self._threshold_lut
+        lut.configure([("mask", thresholds)])
+        if frame_hsv is None:
+            frame_hsv = HSVFrame(image)
+        return lut.mask(frame_hsv.labels(lut), "mask")
 
     # 在二值图中查找所有轮廓，并返回它们的外接矩形的四个顶点。
     # 参数：
@@ -164,40 +205,96 @@ class Pretreatment:
         # 返回值是 (x, y, w, h)，即左上角坐标和宽度、高度。
         return cv2.boundingRect(contour)
 
+    # 把棋盘的四个顶点按 左上、右上、右下、左下 的顺序排列。
+    # minAreaRect/boxPoints 给出的顶点顺序随棋盘的旋转角度变化，排序后校正出的图像方向才固定。
+    # 参数：
+    #   corners: 四个顶点，形状为 (4, 2) 或 (4, 1, 2)。
+    def order_corners(self, corners):
+        pts = np.asarray(corners, dtype=np.float32).reshape(4, 2)
+        s = pts.sum(axis=1)
+        d = pts[:, 1] - pts[:, 0]
+        # 左上角 x+y 最小，右下角 x+y 最大；右上角 y-x 最小，左下角 y-x 最大
+        return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+    # 计算透视校正的单应矩阵和映射表。
+    # 棋盘被校正成 rectified_size x rectified_size 的标准图像，九个格子在其中的位置固定不变。
+    # 映射表只需在棋盘位置确定 (或改变) 时计算一次，每一帧只需一次 cv2.remap。
+    # 参数：
+    #   corners: 棋盘的四个顶点 (裁剪后图像坐标)，默认使用 board_corners。
+    # 返回：
+    #   单应矩阵 (裁剪后图像 -> 标准图像)，顶点无效时返回 None。
+    def build_rectify_maps(self, corners=None):
+        corners = self.board_corners if corners is None else corners
+        if corners is None or len(corners) != 4:
+            self.rectify_homography = None
+            self.rectify_maps = None
+            return None
+        size = self.rectified_size
+        src = self.order_corners(corners)
+        dst = np.array([[0, 0], [size - 1, 0], [size - 1, size - 1], [0, size - 1]], dtype=np.float32)
+        H = cv2.getPerspectiveTransform(src, dst)
+        # 相机矩阵取单位阵、没有畸变时，initUndistortRectifyMap 对输出的每个像素 p 计算 R^-1 * p，
+        # 把 R 设为单应矩阵就得到了透视变换的逆映射表。
+        # 使用 CV_16SC2 定点格式，remap 时比浮点映射表更快。
+        self.rectify_maps = cv2.initUndistortRectifyMap(
+            np.eye(3), None, H, np.eye(3), (size, size), cv2.CV_16SC2)
+        self.rectify_homography = H
+        return H
+
+    # 把裁剪后的图像校正为标准棋盘图像。
+    # 参数：
+    #   image: 裁剪后的图像 (与 build_rectify_maps 时的坐标系相同)。
+    #   interpolation: 插值方式。二值掩码要用 cv2.INTER_NEAREST，双线性插值会在边缘产生中间灰度，
+    #                  按 > 0 计数时会多算像素。
+    # 返回：
+    #   rectified_size x rectified_size 的图像，还没有计算映射表时返回 None。
+    def rectify(self, image, interpolation=cv2.INTER_LINEAR):
+        if self.rectify_maps is None:
+            return None
+        map1, map2 = self.rectify_maps
+        return cv2.remap(image, map1, map2, interpolation)
+
     # 识别并处理图像中的棋盘和棋格
     # 参数:
     #   frame: 从摄像头捕获的原始视频帧。
 
+    #   precropped: 为 True 时表示 frame 已经是 crop() 裁剪后的图像，不再重复裁剪。
     # 返回:
     #   processed_frame: 经过处理后，绘制了轮廓的帧。
     #   grid_contours: 检测到的棋格轮廓列表。
-    def get_grid(self, frame, draw_visuals=True):
+    # 注意: 只有调试等级为 DEBUG_VERBOSE 时才会绘制和显示调试窗口。
+    def get_grid(self, frame, draw_visuals=True, precropped=False):
+        # 非详细调试模式下不绘制任何调试信息，也就不需要额外的显示帧副本
+        draw_visuals = draw_visuals and self.debug >= DEBUG_VERBOSE
         # -- 识别黑色棋盘  --
-        # 创建原始帧的俩个副本，一个用于棋盘，一个用于棋格
-        # 这样做可以保留原始的、未被修改的 `frame`，以便在最后显示清晰的结果。
-        frame_for_processing_black = frame.copy()
-        frame_for_processing_white = frame.copy()
-        
-        # 裁剪图像副本，以专注于中心区域，减少背景干扰。
-        cropped_image_black = self.crop(frame_for_processing_black, self.x_ratio, self.y_ratio)
-        cropped_image_white = self.crop(frame_for_processing_white, self.x_ratio, self.y_ratio)
+        # 裁剪图像，以专注于中心区域，减少背景干扰。
+        # 后续的处理都不会修改图像本身，所以直接使用裁剪后的视图，不再复制原始帧。
+        cropped_image = frame if precropped else self.crop(frame, self.x_ratio, self.y_ratio)
+        # 棋盘和棋格的识别共用同一次HSV转换和阈值掩码
+        frame_hsv = HSVFrame(cropped_image)
         # 也裁剪原始的显示帧，以确保处理区域和显示区域大小一致。
-        processed_frame = self.crop(frame.copy())
+        # 只有需要绘制调试信息时才创建这个副本。
+        if draw_visuals:
+            processed_frame = frame.copy() if precropped else self.crop(frame.copy())
+        else:
+            processed_frame = None
         
         # 对裁剪后的图像进行预处理，得到一个干净的二值图像。
-        binary_image_black = self.preprocess(cropped_image_black)
+        binary_image_black = self.preprocess(cropped_image, frame_hsv)
 
         # 在预处理后的二值图像上查找所有（黑色）轮廓。
         # 这里我们假设棋盘格是图像中最大的黑色区域。
         list_of_box_points_black = self.get_rect_contour(binary_image_black)
         
         # 创建一个窗口显示所有找到的轮廓（调试用）。
-        cv2.imshow("list_of_box_points_black", binary_image_black)
+        if self.debug >= DEBUG_VERBOSE:
+            cv2.imshow("list_of_box_points_black", binary_image_black)
         
         # 从所有找到的轮廓中，筛选出面积最大的那一个。
         max_contour_black,max_area_black = self.get_max_contour(list_of_box_points_black)
         
         grid_contours = []
+        self.board_corners = max_contour_black
 
         # -- 识别 黑色棋盘中的 白色 棋格  --
         # 只有在成功找到最大轮廓的情况下，才执行后续操作。
@@ -210,7 +307,7 @@ class Pretreatment:
                     cv2.circle(processed_frame, tuple(point), 5, (255, 0, 0), -1) # 蓝色实心圆
 
             # 创建一个与裁剪图像同样大小的黑色掩码
-            mask = np.zeros(cropped_image_white.shape[:2], dtype=np.uint8)
+            mask = np.zeros(cropped_image.shape[:2], dtype=np.uint8)
             # 在掩码上将最大轮廓（棋盘）区域画成白色，并填充
             cv2.drawContours(mask, [max_contour_black], -1, 255, -1)
 
@@ -219,15 +316,12 @@ class Pretreatment:
             erosion_kernel = np.ones((15, 15), np.uint8)
             mask = cv2.erode(mask, erosion_kernel, iterations=1)
 
-            # 使用掩码从原始彩色图像中提取出棋盘的精确区域
-            roi_for_white_grid = cv2.bitwise_and(cropped_image_white, cropped_image_white, mask=mask)
-
-
             # 确保提取的ROI不为空
-            if roi_for_white_grid.size > 0:
-                # 对这个ROI（棋盘区域）进行预处理，以寻找内部的棋格。
+            if mask.size > 0:
+                # 只对掩码内的区域（棋盘区域）进行预处理，以寻找内部的棋格。
                 # 'preprocess'会使黑色背景（棋盘）变白，而白色物体（棋格）变黑。
-                binary_roi_white = self.preprocess(roi_for_white_grid)
+                # 直接复用上面的HSV转换结果，不再生成遮罩后的图像副本
+                binary_roi_white = self.preprocess(cropped_image, frame_hsv, region=mask)
                 
                 # 为了能用findContours找到棋格，我们需要让棋格成为白色物体。
                 # 因此，我们反转二值图像，使棋格变白，背景变黑。
@@ -259,7 +353,8 @@ class Pretreatment:
                                 cv2.circle(processed_frame, tuple(point), 5, (0, 255, 255), -1) # 黄色实心圆
 
                 # 显示提取出的ROI图像（一个小的黑白图像），用于调试。
-                cv2.imshow("ROI Image", binary_roi_white)
+                if self.debug >= DEBUG_VERBOSE:
+                    cv2.imshow("ROI Image", binary_roi_white)
         
         return  grid_contours
 
@@ -268,8 +363,15 @@ class Pretreatment:
 # 当这个脚本被直接运行时，下面的代码块将被执行。
 # 如果这个脚本被其他脚本导入，则不会执行。
 if __name__ == "__main__":
-    # 打开默认的摄像头（索引通常为0或1）。
-    cap = cv2.VideoCapture(1)
+    import argparse
+    import camera
+
+    parser = argparse.ArgumentParser(description="棋盘格子识别预览")
+    parser.add_argument("--source", default="1",
+                        help="画面源: 摄像头索引 (默认1)、视频文件路径或图片文件夹路径")
+    args = parser.parse_args()
+    # 打开画面源: 默认的摄像头（索引通常为0或1），也可以是录制好的视频或图片文件夹。
+    cap = camera.open_source(args.source, threaded=False)
     # 在主循环开始前，只创建一个Pretreatment类的实例。
     # 这样可以避免在每次循环中重复创建对象，提高效率。
     pretreatment = Pretreatment(x_ratio=0.5, y_ratio=1)
@@ -0,0 +1,212 @@
+import math
+import socket
+import threading
+import time
+
+class _NullStage:
+    """关闭统计时 stage() 返回的空计时器，进入和退出都不做任何事。"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _StageTimer:
+    """(内部类) 单个阶段的计时器，每个阶段名只创建一次，反复使用。"""
+    __slots__ = ("stats", "start")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class StageStats:
+    """
+    单个阶段的耗时统计。
+
+    每次耗时记录到固定数量的对数分桶中: 第 k 个桶统计耗时在
+    [GROWTH^k, GROWTH^(k+1)) 纳秒之间的次数，相对误差不超过5%。
+    不论运行多久，内存占用都是固定的，记录一次只需一次对数和一次加法。
+    """
+    GROWTH = 1.05
+    BUCKETS = 500  # 1.05^500 纳秒约为 40 秒，更慢的计入最后一个桶
+    _LOG_GROWTH = math.log(GROWTH)
+
+    __slots__ = ("name", "histogram", "count", "total_ns", "max_ns")
+
+    def __init__(self, name):
+        self.name = name
+        self.histogram = [0] * self.BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        """记录一次耗时 (纳秒)。"""
+        bucket = int(math.log(ns) / self._LOG_GROWTH) if ns > 1 else 0
+        self.histogram[min(bucket, self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, p):
+        """返回第 p 百分位的耗时 (毫秒)，取所在桶的上边界；没有记录时返回 0。"""
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(self.count * p / 100))
+        running = 0
+        for k, n in enumerate(self.histogram):
+            running += n
+            if running >= target:
+                return min(self.GROWTH ** (k + 1), self.max_ns) / 1e6
+        return self.max_ns / 1e6
+
+    def mean(self):
+        """返回平均耗时 (毫秒)。"""
+        return self.total_ns / self.count / 1e6 if self.count else 0.0
+
+    def reset(self):
+        self.histogram = [0] * self.BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+
+class StageProfiler:
+    """
+    视觉流水线的分阶段耗时统计工具。
+
+    功能特性:
+    - 用 time.perf_counter_ns 计时，每个阶段的耗时记录到固定大小的直方图中。
+    - 汇总输出每个阶段的 次数 / 平均 / p50 / p95 / p99 / 最大耗时，以及主循环的帧率。
+    - 关闭统计 (enabled=False) 时 stage() 返回空计时器，几乎没有额外开销。
+    - 可选地在本机端口上提供汇总查询，无显示器运行时用 `nc 127.0.0.1 <端口>` 随时查看。
+
+    快速使用:
+    1. 创建实例: `profiler = StageProfiler()`
+    2. 统计一个阶段: `with profiler.stage("cvtColor"): hsv = cv2.cvtColor(...)`
+    3. 每处理完一帧调用一次: `profiler.tick()`，用于计算帧率
+    4. 输出汇总: `profiler.dump()`
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # 阶段名 -> StageStats，按第一次出现的顺序输出
+        self.stages = {}
+        self._timers = {}
+        # 帧率统计
+        self.frames = 0
+        self._first_tick = None
+        self._last_tick = None
+        self._server = None
+
+    def stage(self, name):
+        """
+        返回阶段 name 的计时器，配合 with 语句使用。
+        同名阶段在一帧中出现多次时，每一次都单独记录。
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        timer = self._timers.get(name)
+        if timer is None:
+            stats = StageStats(name)
+            self.stages[name] = stats
+            timer = self._timers[name] = _StageTimer(stats)
+        return timer
+
+    def tick(self):
+        """标记一帧处理完成。两次 tick 之间的时间记为 "frame" 阶段，并用于计算帧率。"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        if self._last_tick is None:
+            self._first_tick = now
+        else:
+            stats = self.stages.get("frame")
+            if stats is None:
+                stats = self.stages["frame"] = StageStats("frame")
+            stats.record(now - self._last_tick)
+        self._last_tick = now
+        self.frames += 1
+
+    def fps(self):
+        """返回从第一次 tick 到最近一次 tick 之间的平均帧率。"""
+        if self.frames < 2:
+            return 0.0
+        return (self.frames - 1) / ((self._last_tick - self._first_tick) / 1e9)
+
+    def summary(self):
+        """返回多行文本形式的汇总信息 (耗时单位为毫秒)。"""
+        if not self.enabled:
+            return "耗时统计未开启"
+        lines = [f"--- 分阶段耗时统计 (ms)，共 {self.frames} 帧，{self.fps():.1f} FPS ---",
+                 f"{'stage':<26}{'count':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for name, stats in list(self.stages.items()):
+            if stats.count == 0:
+                continue
+            lines.append(f"{name:<26}{stats.count:>8}{stats.mean():>9.3f}"
+                         f"{stats.percentile(50):>9.3f}{stats.percentile(95):>9.3f}"
+                         f"{stats.percentile(99):>9.3f}{stats.max_ns / 1e6:>9.3f}")
+        return "\n".join(lines)
+
+    def dump(self):
+        """把汇总信息打印到控制台。"""
+        print(self.summary())
+
+    def reset(self):
+        """清空所有统计数据。"""
+        for stats in self.stages.values():
+            stats.reset()
+        self.frames = 0
+        self._first_tick = None
+        self._last_tick = None
+
+    # --- 远程查询 ---
+    def serve(self, port, host="127.0.0.1"):
+        """
+        在后台线程中监听 host:port，每有一个连接就发送当前的汇总信息并断开。
+        :return: 成功监听返回 True。
+        """
+        try:
+            server = socket.create_server((host, port))
+        except OSError as e:
+            print(f"耗时统计端口 {port} 监听失败: {e}")
+            return False
+        self._server = server
+        threading.Thread(target=self._serve_loop, args=(server,),
+                         name="StageProfilerServer", daemon=True).start()
+        print(f"耗时统计已在 {host}:{port} 上提供查询")
+        return True
+
+    def _serve_loop(self, server):
+        """(内部方法) 后台线程: 接受连接并发送汇总信息。"""
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                # 服务已关闭
+                return
+            with conn:
+                try:
+                    conn.sendall((self.summary() + "\n").encode("utf-8"))
+                except OSError:
+                    pass
+
+    def close(self):
+        """关闭远程查询服务。"""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
@@ -1,24 +1,136 @@
 import serial
 import serial.tools.list_ports
 import time
+import threading
+import queue
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- 机器人通信协议 ---
+# 每一帧固定4个字节: [0xAA, 参数1, 参数2, 0x55]
+FRAME_HEADER = 0xAA  # 帧头
+FRAME_TAIL = 0x55    # 帧尾
+FRAME_LENGTH = 4     # 帧长度
+# 机器人移动完成的确认帧: [0xAA, 10, 10, 0x55]
+ACK_CODE = 10
+# 握手用的探测帧: [0xAA, 0, 0, 0x55]，下位机回复任意一帧合法数据即视为就绪
+PING_CODE = 0
+# 异步模式下 rx_queue 最多保存的数据批数，满了以后丢弃最早的一批。
+# 只通过回调接收数据时没有人从队列中取数据，不加上限的话队列会在整个运行期间一直增长
+RX_QUEUE_SIZE = 256
+
+# 解析后的帧类型
+# 移动指令: 从 move_from 移动到 move_to (协议中的原始编号，10 代表棋框)
+CommandFrame = namedtuple("CommandFrame", ["move_from", "move_to"])
+# 确认帧: code 为确认码，目前只有 ACK_CODE (机器人移动完成)
+AckFrame = namedtuple("AckFrame", ["code"])
+
+
+def encode_frame(arg1, arg2):
+    """把两个参数打包成一帧协议数据，返回字节整数列表 [0xAA, arg1, arg2, 0x55]。"""
+    return [FRAME_HEADER, arg1, arg2, FRAME_TAIL]
+
+
+class FrameParser:
+    """
+    [0xAA, a, b, 0x55] 协议的流式解析器。
+
+    串口每次读取到的字节与协议帧并不对齐: 一帧可能被拆成两次读取，
+    一次读取也可能包含多帧。本类把收到的字节追加到内部的 bytearray 缓冲区中，
+    按帧头 0xAA 重新同步，校验帧尾 0x55，每次 feed() 返回本次解析出的所有完整帧，
+    不完整的尾部留在缓冲区中等待后续数据。
+
+    统计信息:
+    - bytes_received: 收到的总字节数
+    - frames_parsed: 成功解析的帧数
+    - frames_rejected: 帧尾错误被丢弃的帧数
+    - bytes_discarded: 重新同步时丢弃的字节数
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self.bytes_received = 0
+        self.frames_parsed = 0
+        self.frames_rejected = 0
+        self.bytes_discarded = 0
+
+    def reset(self):
+        """清空缓冲区中尚未解析的数据（统计信息保留）。"""
+        self._buffer.clear()
+
+    def feed(self, data):
+        """
+        输入新收到的数据，返回本次解析出的帧列表。
+
+        :param data: bytes、bytearray 或字节整数列表。
+        :return: 由 CommandFrame / AckFrame 组成的列表，没有完整帧时返回空列表。
+        """
+        buffer = self._buffer
+        buffer.extend(data)
+        self.bytes_received += len(data)
+
+        frames = []
+        pos = 0
+        size = len(buffer)
+        while True:
+            # 查找下一个帧头，帧头之前的字节都是无效数据
+            start = buffer.find(FRAME_HEADER, pos)
+            if start < 0:
+                self.bytes_discarded += size - pos
+                pos = size
+                break
+            self.bytes_discarded += start - pos
+            # 数据还不够一整帧，留到下一次再解析
+            if start + FRAME_LENGTH > size:
+                pos = start
+                break
+            # 帧尾不对，说明这个 0xAA 不是真正的帧头，跳过它继续同步
+            if buffer[start + FRAME_LENGTH - 1] != FRAME_TAIL:
+                self.frames_rejected += 1
+                self.bytes_discarded += 1
+                pos = start + 1
+                continue
+            frames.append(self._decode(buffer[start + 1], buffer[start + 2]))
+            self.frames_parsed += 1
+            pos = start + FRAME_LENGTH
+
+        # 一次性删除已处理的字节
+        if pos:
+            del buffer[:pos]
+        return frames
+
+    @staticmethod
+    def _decode(arg1, arg2):
+        """(内部方法) 根据帧内容生成对应类型的帧对象。"""
+        if arg1 == ACK_CODE and arg2 == ACK_CODE:
+            return AckFrame(ACK_CODE)
+        return CommandFrame(arg1, arg2)
+
 
 class SerialCommunicator:
     """
     一个用于简化与单片机等设备进行串口通信的类。
 
     功能特性:
-    - 自动检测并连接到串口。
+    - 自动检测并连接到串口: 并行探测所有串口，选择能按协议回复的那一个。
+    - 连接后通过握手确认设备就绪，而不是固定等待2秒。
     - 发送单个字节 (0-255范围的整数)。
     - 发送字节数组 (例如: [1, 10, 255])。
     - 数据以原始字节形式发送，符合单片机 uint8_t 类型。
     - 程序结束时自动关闭串口连接。
+    - (可选) 异步模式: 后台线程负责收发，收到的数据立即通过回调或队列交付，
+      发送也不会阻塞调用方。
 
     快速使用:
     1. 创建实例: `comm = SerialCommunicator()` (自动连接)
     2. 发送数据: `comm.send_data(0x41)` 或 `comm.send_data([1, 2, 3])`
     3. (可选) `SerialCommunicator.list_available_ports()` 查看可用串口。
+    4. (可选) 异步模式: `comm.start_async(on_data=callback)`，
+       之后 `callback(data_list)` 会在数据到达时被后台线程调用，
+       也可以用 `comm.wait_data(timeout)` 阻塞等待下一批数据。
+    5. (可选) 按协议帧接收: 异步模式下用 `comm.start_async(on_frame=callback)`，
+       每解析出一帧就调用 `callback(frame)`；轮询模式下调用 `comm.receive_frames()`。
     """
-    def __init__(self, port=None, baud_rate=115200, timeout=2):
+    def __init__(self, port=None, baud_rate=115200, timeout=2, handshake=True, ready_timeout=2):
         """
         初始化串口通信对象。
 
@@ -28,12 +140,34 @@ class SerialCommunicator:
                      如果保留为 None (默认)，程序会自动查找并使用第一个可用的串口。
         :param baud_rate: (可选) 整数，设置通信的波特率。必须与您的单片机设置一致。默认为 115200。
         :param timeout: (可选) 整数或浮点数，设置读取操作的超时时间（秒）。默认为 2。
+        :param handshake: (可选) 布尔值。为 True (默认) 时，连接后发送探测帧并等待下位机回复，
+                          收到回复立即返回；为 False 时沿用旧的做法，固定等待 ready_timeout 秒。
+        :param ready_timeout: (可选) 等待设备就绪的最长时间（秒）。默认为 2。
         """
         self.port = port
         self.baud_rate = baud_rate
         self.timeout = timeout
+        self.handshake = handshake
+        self.ready_timeout = ready_timeout
         self.ser = None
 
+        # --- 异步收发 ---
+        # 后台读线程收到的数据放入此队列，每个元素是一次读取到的字节整数列表。
+        # 队列有上限 (RX_QUEUE_SIZE)，满了以后丢弃最早的数据
+        self.rx_queue = queue.Queue(maxsize=RX_QUEUE_SIZE)
+        # receive_data() 按 expected_bytes 读取后剩下的数据，下一次读取时排在队列中的数据之前
+        self._rx_pending = []
+        # 待发送的数据队列，由后台写线程依次写入串口
+        self._tx_queue = queue.Queue()
+        # 数据到达时调用的回调函数列表
+        self._data_callbacks = []
+        # 协议帧解析器，以及解析出完整帧时调用的回调函数列表
+        self.parser = FrameParser()
+        self._frame_callbacks = []
+        self._async_running = False
+        self._reader_thread = None
+        self._writer_thread = None
+
         try:
             if self.port is None:
                 self._auto_select_port()
@@ -42,13 +176,85 @@ class SerialCommunicator:
             print(f"初始化错误: {e}")
 
     def _auto_select_port(self):
-        """(内部方法) 自动选择第一个可用的串口。"""
+        """
+        (内部方法) 自动选择串口。
+
+        并行地在所有可用串口上发送探测帧，选择第一个按协议回复的串口；
+        如果都没有回复 (或未开启握手)，则退回到第一个可用的串口。
+        """
         ports = self.list_available_ports(print_ports=False)
         if not ports:
             raise serial.SerialException("未找到任何串口设备。请确保设备已连接。")
+
+        if self.handshake:
+            devices = [port_info.device for port_info in ports]
+            # 选中一个串口后通知其余的探测立即结束，不必等它们各自超时
+            stop = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=len(devices))
+            try:
+                futures = {executor.submit(self._probe_port, device, self.baud_rate, self.ready_timeout, stop): device
+                           for device in devices}
+                for future in as_completed(futures):
+                    if future.result():
+                        self.port = futures[future]
+                        print(f"自动选择串口: {self.port} (已应答握手)")
+                        return
+            finally:
+                stop.set()
+                # 不等待其余的探测线程，它们看到 stop 后会自行关闭串口退出
+                executor.shutdown(wait=False, cancel_futures=True)
+            print("没有串口应答握手，退回到第一个可用的串口。")
+
         self.port = ports[0].device
         print(f"自动选择串口: {self.port}")
 
+    @staticmethod
+    def _probe_port(device, baud_rate, timeout, stop=None):
+        """
+        (内部方法) 打开指定串口并进行握手，返回该串口是否按协议应答。串口用完即关闭。
+        :param stop: (可选) threading.Event，被设置后立即放弃握手并返回 False。
+        """
+        if stop is not None and stop.is_set():
+            return False
+        try:
+            with serial.Serial(device, baud_rate, timeout=0.05) as ser:
+                return SerialCommunicator._wait_ready(ser, timeout, stop=stop)
+        except (serial.SerialException, OSError):
+            return False
+
+    @staticmethod
+    def _wait_ready(ser, timeout, retry_interval=0.1, stop=None):
+        """
+        (内部方法) 握手: 发送探测帧，等待下位机回复任意一帧合法的协议数据。
+
+        设备刚上电或复位时可能收不到第一帧，所以每隔 retry_interval 秒重发一次，
+        直到收到回复或超过 timeout 秒。
+
+        :param stop: (可选) threading.Event，被设置后立即放弃等待。
+        :return: 在超时前收到回复返回 True，否则返回 False。
+        """
+        parser = FrameParser()
+        ping = bytes(encode_frame(PING_CODE, PING_CODE))
+        old_timeout = ser.timeout
+        ser.timeout = 0.01
+        try:
+            ser.reset_input_buffer()
+            deadline = time.monotonic() + timeout
+            next_ping = 0.0
+            while time.monotonic() < deadline:
+                if stop is not None and stop.is_set():
+                    return False
+                now = time.monotonic()
+                if now >= next_ping:
+                    ser.write(ping)
+                    next_ping = now + retry_interval
+                raw_bytes = ser.read(ser.in_waiting or 1)
+                if raw_bytes and parser.feed(raw_bytes):
+                    return True
+            return False
+        finally:
+            ser.timeout = old_timeout
+
     @staticmethod
     def list_available_ports(print_ports=True):
         """
@@ -77,7 +283,15 @@ class SerialCommunicator:
         try:
             self.ser = serial.Serial(self.port, self.baud_rate, timeout=self.timeout)
             print(f"成功连接到 {self.port}，波特率 {self.baud_rate}")
-            time.sleep(2)  # 等待设备就绪
+            if self.handshake:
+                # 握手成功即可开始通信，通常只需几毫秒
+                start_time = time.monotonic()
+                if self._wait_ready(self.ser, self.ready_timeout):
+                    print(f"设备已就绪，握手耗时 {(time.monotonic() - start_time) * 1000:.1f} ms")
+                else:
+                    print(f"警告: {self.ready_timeout} 秒内未收到设备的握手回复，继续使用该串口。")
+            else:
+                time.sleep(self.ready_timeout)  # 等待设备就绪
         except serial.SerialException as e:
             self.ser = None
             raise serial.SerialException(f"无法打开串口 {self.port}: {e}")
@@ -89,6 +303,7 @@ class SerialCommunicator:
         通常您不需要调用此方法，因为当程序结束时，连接会自动关闭。
         但如果您想在程序运行中途关闭连接，可以调用此方法。
         """
+        self.stop_async()
         if self.ser and self.ser.is_open:
             self.ser.close()
             print("串口已关闭。")
@@ -110,25 +325,39 @@ class SerialCommunicator:
             print("错误：串口未连接。无法发送数据。")
             return
 
-        bytes_to_send = b''
+        bytes_to_send = self._to_bytes(data)
+        if bytes_to_send is None:
+            return
+
+        # 异步模式下交给后台写线程发送，调用方无需等待
+        if self._async_running:
+            self._tx_queue.put(bytes_to_send)
+            return
+
+        self._write(bytes_to_send)
+
+    def _to_bytes(self, data):
+        """
+        (内部方法) 校验并把待发送的数据转换为字节串。
+        :return: 转换后的字节串；如果数据无效则打印错误并返回 None。
+        """
         # 检查并转换单个整数
         if isinstance(data, int):
             if 0 <= data <= 255:
-                bytes_to_send = data.to_bytes(1, 'little')
-            else:
-                print(f"错误：发送失败。单字节数据 {data} 超出有效范围 (0-255)。")
-                return
+                return data.to_bytes(1, 'little')
+            print(f"错误：发送失败。单字节数据 {data} 超出有效范围 (0-255)。")
+            return None
         # 检查并转换整数列表
-        elif isinstance(data, list):
+        if isinstance(data, list):
             if all(isinstance(i, int) and 0 <= i <= 255 for i in data):
-                bytes_to_send = bytes(data)
-            else:
-                print(f"错误：发送失败。列表中的某些数据无效或超出有效范围 (0-255)。")
-                return
-        else:
-            print(f"错误：发送失败。不支持的数据类型 '{type(data).__name__}'。请提供整数或整数列表。")
-            return
+                return bytes(data)
+            print(f"错误：发送失败。列表中的某些数据无效或超出有效范围 (0-255)。")
+            return None
+        print(f"错误：发送失败。不支持的数据类型 '{type(data).__name__}'。请提供整数或整数列表。")
+        return None
 
+    def _write(self, bytes_to_send):
+        """(内部方法) 把字节串写入串口。"""
         try:
             self.ser.write(bytes_to_send)
             # 使用 .hex(' ') 在每个字节后加空格，提高可读性
@@ -149,6 +378,21 @@ class SerialCommunicator:
         :return: 一个包含接收到的字节的整数列表 (例如: [0x02, 0x05])，
                  如果没有数据可读或发生错误，则返回一个空列表 []。
         """
+        # 异步模式下串口由后台读线程负责读取，这里只取出队列中已收到的数据
+        if self._async_running:
+            data_list = self._rx_pending
+            self._rx_pending = []
+            while True:
+                try:
+                    data_list.extend(self.rx_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if expected_bytes is not None and len(data_list) > expected_bytes:
+                # 多出来的数据留在本地缓冲区，下一次读取时先返回，保持数据的先后顺序
+                self._rx_pending = data_list[expected_bytes:]
+                data_list = data_list[:expected_bytes]
+            return data_list
+
         if not self.ser or not self.ser.is_open:
             # 不打印错误，因为这个方法会被频繁调用
             return []
@@ -179,10 +423,352 @@ class SerialCommunicator:
             self.disconnect() # 如果读取出错，可能连接已断开
             return []
 
+    def receive_frames(self):
+        """
+        (轮询模式) 读取串口中的数据并按协议解析。
+
+        被拆开的帧会在后续调用中拼接完整，一次读到的多帧会全部返回。
+        注意: 异步模式下如果已经注册了 on_frame 回调，数据已由后台线程解析，请不要再调用本方法。
+        :return: 由 CommandFrame / AckFrame 组成的列表。
+        """
+        data_list = self.receive_data()
+        if not data_list:
+            return []
+        return self.parser.feed(data_list)
+
+    def start_async(self, on_data=None, poll_interval=0.05, on_frame=None):
+        """
+        启动异步收发模式。
+
+        启动后，后台读线程会在数据到达时立即读取，并把数据 (整数列表) 放入 `rx_queue`
+        (最多保存 RX_QUEUE_SIZE 批，满了以后丢弃最早的数据)，
+        同时调用所有已注册的回调函数；`send_data` 只把数据放入发送队列，由后台写线程
+        写入串口，不再阻塞调用方。
+
+        注意: 回调函数在后台线程中执行，应尽快返回，不要在其中调用 OpenCV 的窗口函数。
+
+        :param on_data: (可选) 回调函数，形如 `on_data(data_list)`。
+        :param poll_interval: 读线程单次等待数据的最长时间（秒），也决定了停止异步模式时的响应速度。
+        :param on_frame: (可选) 回调函数，形如 `on_frame(frame)`，每解析出一帧协议数据调用一次。
+        """
+        if on_data is not None:
+            self.add_data_callback(on_data)
+        if on_frame is not None:
+            self.add_frame_callback(on_frame)
+        if self._async_running:
+            return
+        if not self.ser or not self.ser.is_open:
+            print("错误：串口未连接。无法启动异步模式。")
+            return
+
+        # 读线程阻塞在 read() 上，缩短读超时以便能及时退出
+        self.ser.timeout = poll_interval
+        self._async_running = True
+        self._reader_thread = threading.Thread(target=self._reader_loop, name="SerialReader", daemon=True)
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="SerialWriter", daemon=True)
+        self._reader_thread.start()
+        self._writer_thread.start()
+
+    def stop_async(self):
+        """停止异步收发模式，等待后台线程退出，并恢复原来的读超时。"""
+        if not self._async_running:
+            return
+        self._async_running = False
+        # 放入一个空元素唤醒写线程
+        self._tx_queue.put(None)
+        current = threading.current_thread()
+        for thread in (self._reader_thread, self._writer_thread):
+            if thread is not None and thread is not current:
+                thread.join(timeout=1.0)
+        self._reader_thread = None
+        self._writer_thread = None
+        if self.ser and self.ser.is_open:
+            self.ser.timeout = self.timeout
+
+    def add_data_callback(self, callback):
+        """注册一个数据到达时调用的回调函数，形如 `callback(data_list)`。"""
+        if callback not in self._data_callbacks:
+            self._data_callbacks.append(callback)
+
+    def add_frame_callback(self, callback):
+        """注册一个解析出协议帧时调用的回调函数，形如 `callback(frame)`。"""
+        if callback not in self._frame_callbacks:
+            self._frame_callbacks.append(callback)
+
+    def wait_data(self, timeout=None):
+        """
+        (异步模式) 阻塞等待下一批收到的数据。
+
+        :param timeout: 最长等待时间（秒），None 表示一直等待。
+        :return: 收到的字节整数列表；超时则返回空列表 []。
+        """
+        # receive_data() 留下的数据比队列中的更早，先返回
+        if self._rx_pending:
+            data_list = self._rx_pending
+            self._rx_pending = []
+            return data_list
+        try:
+            return self.rx_queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+    def _reader_loop(self):
+        """(内部方法) 后台读线程: 数据一到达就读取并交付。"""
+        while self._async_running:
+            try:
+                # 先阻塞读取1个字节（最多等待 poll_interval），再把缓冲区中剩余的字节一次读完
+                raw_bytes = self.ser.read(1)
+                if not raw_bytes:
+                    continue
+                bytes_in_waiting = self.ser.in_waiting
+                if bytes_in_waiting:
+                    raw_bytes += self.ser.read(bytes_in_waiting)
+            except (serial.SerialException, TypeError, AttributeError) as e:
+                # 串口被关闭或断开时，read 可能抛出各种异常，统一视为连接断开
+                if self._async_running:
+                    print(f"接收数据时出错: {e}")
+                    self._async_running = False
+                    self._tx_queue.put(None)
+                break
+
+            data_list = list(raw_bytes)
+            print(f"接收到数据 (hex): {raw_bytes.hex(' ')}")
+            self._enqueue_rx(data_list)
+            for callback in self._data_callbacks:
+                try:
+                    callback(data_list)
+                except Exception as e:
+                    print(f"串口数据回调出错: {e}")
+
+            # 只有注册了帧回调时才解析，避免与 receive_frames() 争用解析器
+            if self._frame_callbacks:
+                for frame in self.parser.feed(raw_bytes):
+                    for callback in self._frame_callbacks:
+                        try:
+                            callback(frame)
+                        except Exception as e:
+                            print(f"串口帧回调出错: {e}")
+
+    def _enqueue_rx(self, data_list):
+        """(内部方法) 把收到的数据放入 rx_queue，队列满时先丢弃最早的一批。"""
+        while True:
+            try:
+                self.rx_queue.put_nowait(data_list)
+                return
+            except queue.Full:
+                try:
+                    self.rx_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _writer_loop(self):
+        """(内部方法) 后台写线程: 依次发送队列中的数据。"""
+        while self._async_running:
+            bytes_to_send = self._tx_queue.get()
+            if bytes_to_send is None:
+                continue
+            self._write(bytes_to_send)
+
     def __del__(self):
         """(内部方法) 对象销毁时自动关闭串口，防止资源泄漏。"""
         self.disconnect()
 
+
+class CommandPipeline:
+    """
+    建立在 SerialCommunicator 之上的机器人指令队列，支持流水线发送。
+
+    原来每发送一条移动指令，都要等到下位机返回确认帧才能发送下一条，
+    多步动作 (例如"先把被移动的棋子放回去，再执行机器人的落子") 每一步都要一个完整的往返。
+    本类给每条指令分配一个递增的序号，最多同时有 window 条指令在途，
+    收到确认帧就立即补发下一条。
+
+    注意: window 大于1的前提是下位机能把收到的指令排队依次执行。目前的固件只回显收到的帧，
+    执行期间收到的新指令会被丢掉，所以默认 window=1 (收到确认后才发送下一条)，
+    确认固件支持指令排队之后再调大。
+
+    协议中的确认帧 [0xAA, 10, 10, 0x55] 不带序号，因此序号只在上位机内部使用，
+    确认帧按发送顺序与最早的在途指令依次匹配 (下位机按顺序执行指令)。
+
+    功能特性:
+    - 可配置的在途窗口大小 (window)。
+    - 超时检测与重传 (max_retries)。注意移动指令不是幂等的，如果确认帧丢失而
+      指令其实已执行，重传会让机械臂再动一次，所以默认不重传。
+    - 记录每条指令从首次发送到收到确认的耗时，stats() 返回统计结果。
+
+    快速使用:
+    1. `pipeline = CommandPipeline(comm, window=1, on_done=callback)`
+    2. `pipeline.submit(10, 1)` 返回该指令的序号；完成或失败时调用 `callback(seq, ok, latency)`。
+    3. `pipeline.is_idle()` 判断是否所有指令都已完成。
+    """
+    def __init__(self, communicator, window=1, timeout=10.0, max_retries=0, on_done=None):
+        """
+        :param communicator: 已连接的 SerialCommunicator 对象，未开启异步模式时会自动开启。
+        :param window: 最多同时在途 (已发送、未确认) 的指令数。下位机不支持指令排队时必须为1。
+        :param timeout: 单条指令等待确认的最长时间（秒）。
+        :param max_retries: 超时后最多重传的次数，0 表示不重传，超时即判定失败。
+        :param on_done: (可选) 指令完成或失败时调用的回调，形如 `on_done(seq, ok, latency)`，
+                        latency 为从首次发送到收到确认的秒数，失败时为 None。
+        """
+        self.communicator = communicator
+        self.window = max(1, window)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.on_done = on_done
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._next_seq = 1
+        # 等待发送的指令: (seq, frame)
+        self._pending = deque()
+        # 已发送、等待确认的指令: [seq, frame, 首次发送时间, 最近发送时间, 已重传次数]
+        self._in_flight = deque()
+
+        # --- 统计信息 ---
+        # 最近完成的指令耗时（秒）
+        self.latencies = deque(maxlen=1000)
+        self.completed = 0
+        self.failed = 0
+        self.retransmissions = 0
+        # 没有在途指令时收到的确认帧数量
+        self.unexpected_acks = 0
+
+        self.communicator.add_frame_callback(self._on_frame)
+        self.communicator.start_async()
+
+        # 超时检测线程
+        self._running = True
+        self._watchdog = threading.Thread(target=self._watchdog_loop, name="CommandPipeline", daemon=True)
+        self._watchdog.start()
+
+    def submit(self, arg1, arg2):
+        """
+        提交一条指令 [0xAA, arg1, arg2, 0x55]。在途窗口未满时立即发送，否则排队等待。
+        :return: 该指令的序号。
+        """
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._pending.append((seq, encode_frame(arg1, arg2)))
+            to_send = self._fill_window()
+        self._send(to_send)
+        return seq
+
+    def is_idle(self):
+        """所有已提交的指令是否都已完成（没有排队和在途的指令）。"""
+        with self._lock:
+            return not self._pending and not self._in_flight
+
+    def stats(self):
+        """
+        返回指令耗时的统计信息。
+        :return: 字典，包含 completed / failed / retransmissions / unexpected_acks，
+                 以及最近指令耗时的 mean / p50 / p95 / max (毫秒)，尚无数据时耗时字段为 None。
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            result = {
+                "completed": self.completed,
+                "failed": self.failed,
+                "retransmissions": self.retransmissions,
+                "unexpected_acks": self.unexpected_acks,
+            }
+        if latencies:
+            count = len(latencies)
+            result["mean_ms"] = sum(latencies) / count * 1000
+            result["p50_ms"] = latencies[int(0.50 * (count - 1))] * 1000
+            result["p95_ms"] = latencies[int(0.95 * (count - 1))] * 1000
+            result["max_ms"] = latencies[-1] * 1000
+        else:
+            result["mean_ms"] = result["p50_ms"] = result["p95_ms"] = result["max_ms"] = None
+        return result
+
+    def close(self):
+        """停止超时检测线程。未完成的指令不再跟踪。"""
+        with self._lock:
+            self._running = False
+            self._wakeup.notify_all()
+        self._watchdog.join(timeout=1.0)
+
+    def _fill_window(self):
+        """(内部方法，需持有锁) 把排队的指令移入在途窗口，返回需要发送的帧列表。"""
+        to_send = []
+        now = time.monotonic()
+        while self._pending and len(self._in_flight) < self.window:
+            seq, frame = self._pending.popleft()
+            self._in_flight.append([seq, frame, now, now, 0])
+            to_send.append(frame)
+        if to_send:
+            self._wakeup.notify_all()
+        return to_send
+
+    def _restart_head_timer(self, now):
+        """
+        (内部方法，需持有锁) 下位机按顺序执行指令，新的队首指令从此刻才开始执行，
+        因此它的超时从此刻重新计算。
+        """
+        if self._in_flight:
+            self._in_flight[0][3] = max(self._in_flight[0][3], now)
+
+    def _send(self, frames):
+        """(内部方法) 在锁外发送帧，避免阻塞串口读线程。"""
+        for frame in frames:
+            self.communicator.send_data(frame)
+
+    def _on_frame(self, frame):
+        """(内部方法) 串口帧回调: 确认帧与最早的在途指令匹配。"""
+        if not isinstance(frame, AckFrame):
+            return
+        with self._lock:
+            if not self._in_flight:
+                self.unexpected_acks += 1
+                return
+            seq, _, first_sent, _, _ = self._in_flight.popleft()
+            now = time.monotonic()
+            latency = now - first_sent
+            self._restart_head_timer(now)
+            self.latencies.append(latency)
+            self.completed += 1
+            to_send = self._fill_window()
+        self._send(to_send)
+        if self.on_done:
+            self.on_done(seq, True, latency)
+
+    def _watchdog_loop(self):
+        """(内部方法) 后台线程: 检查最早的在途指令是否超时，超时则重传或判定失败。"""
+        while True:
+            to_send = []
+            failed_seq = None
+            with self._lock:
+                if not self._running:
+                    return
+                if not self._in_flight:
+                    self._wakeup.wait()
+                    continue
+                entry = self._in_flight[0]
+                remaining = entry[3] + self.timeout - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                if entry[4] < self.max_retries:
+                    # 重传最早的那条指令，并重新开始计时
+                    entry[3] = time.monotonic()
+                    entry[4] += 1
+                    self.retransmissions += 1
+                    to_send.append(entry[1])
+                else:
+                    # 重传次数用完，判定失败，继续发送后面的指令
+                    failed_seq = entry[0]
+                    self._in_flight.popleft()
+                    self._restart_head_timer(time.monotonic())
+                    self.failed += 1
+                    to_send = self._fill_window()
+            if failed_seq is not None:
+                print(f"指令 {failed_seq} 等待确认超时，已放弃。")
+            self._send(to_send)
+            if failed_seq is not None and self.on_done:
+                self.on_done(failed_seq, False, None)
+
 if __name__ == "__main__":
     # ------------------------------------------------------------------
     # ---                     快速使用示例                           ---
@@ -0,0 +1,183 @@
+import cv2
+import numpy as np
+
+# --- update() 的返回值 ---
+TRACK_STEADY = 0  # 棋盘没有移动 (或移动小于 min_shift)，格子几何信息无需更新
+TRACK_MOVED = 1   # 棋盘移动了，应当用 cell_contours() 更新格子几何信息
+TRACK_LOST = 2    # 跟踪置信度不足 (棋盘被遮挡或移动过大)，需要重新调用 get_grid 定位棋盘
+
+class BoardTracker:
+    """
+    棋盘位置的增量跟踪。
+
+    get_grid 从头识别棋盘的代价很高 (两次整帧复制、两次预处理、轮廓搜索和15x15腐蚀)，
+    所以只在初始化时调用。但初始化之后如果棋盘被碰歪，格子几何信息就全部失效了。
+    本类在初始化时记录一张参考灰度图，并在棋盘四个顶点附近及棋盘内部挑选一组角点，
+    之后每一帧用金字塔 LK 光流把这些角点从参考图跟踪到当前图，
+    用 RANSAC 求出参考图到当前图的单应矩阵，再用它变换四个顶点和九个格子的轮廓。
+    每次都与参考图比较，而不是与上一帧比较，所以误差不会逐帧累积。
+    光流只在棋盘周围的搜索窗口 (棋盘边界框向外扩展 search_margin 像素) 内计算，
+    棋盘一次移动超出这个范围时视为跟踪丢失。
+
+    光流假定亮度不变，而参考图是初始化时拍的，天色变化后整体亮度会偏离参考图，
+    即使棋盘没动，估计出的顶点也会漂移。因此参考图和当前图都先把搜索窗口的灰度
+    归一化到相同的均值和标准差，再做光流；并且顶点的位移要连续 confirm_frames 次
+    超过 min_shift 才认为棋盘真的被移动了，个别帧的误差不会触发格子几何的重建。
+
+    快速使用:
+    1. 初始化成功后: `tracker.start(cropped_frame, board_corners, grid_contours)`
+    2. 每一帧: `status = tracker.update(cropped_frame)`
+       - TRACK_MOVED: `tracker.cell_contours()` 得到新的格子轮廓
+       - TRACK_LOST: 重新调用 get_grid，成功后再次 start()
+    """
+    def __init__(self, max_points=80, min_inliers=12, min_inlier_ratio=0.3,
+                 min_shift=1.5, reproj_threshold=3.0, search_margin=64, confirm_frames=3):
+        """
+        :param max_points: 最多跟踪的角点数量。
+        :param min_inliers: RANSAC 内点少于该数量时认为跟踪丢失。
+        :param min_inlier_ratio: 内点占全部参考角点的比例低于该值时认为跟踪丢失 (例如大部分棋盘被手挡住)。
+        :param min_shift: 棋盘顶点移动超过该像素数时才更新格子几何信息，避免每一帧都因为抖动重建缓存。
+        :param reproj_threshold: RANSAC 的重投影误差阈值 (像素)。
+        :param search_margin: 搜索窗口在棋盘边界框基础上向外扩展的像素数。
+        :param confirm_frames: 顶点位移连续多少次超过 min_shift 才返回 TRACK_MOVED。
+        """
+        self.max_points = max_points
+        self.min_inliers = min_inliers
+        self.min_inlier_ratio = min_inlier_ratio
+        self.min_shift = min_shift
+        self.reproj_threshold = reproj_threshold
+        self.search_margin = search_margin
+        self.confirm_frames = confirm_frames
+
+        self.active = False
+        # 搜索窗口在裁剪后图像中的切片和左上角坐标，以下的参考数据都使用窗口坐标系
+        self.window = None
+        self.offset = np.zeros(2, dtype=np.float32)
+        # 参考图和在参考图上选取的角点
+        self.ref_gray = None
+        self.ref_points = None
+        # 参考图上的棋盘顶点和格子轮廓，形状均为 (N, 1, 2) 的 float32
+        self.ref_corners = None
+        self.ref_cells = None
+        # 当前采用的单应矩阵 (参考图 -> 当前图)
+        self.homography = np.eye(3)
+        # 下一帧光流跟踪的初始位置
+        self._guess = None
+        # 最近一次跟踪的置信度 (内点占参考角点的比例)
+        self.confidence = 0.0
+        # 顶点位移已经连续超过 min_shift 的次数
+        self._moved_count = 0
+
+    # 归一化后灰度图的均值和标准差
+    _NORM_MEAN = 128.0
+    _NORM_STD = 48.0
+
+    @classmethod
+    def _gray(cls, frame):
+        """(内部方法) 转换为灰度图，并把灰度归一化到固定的均值和标准差，抵消整体亮度和对比度的变化。"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        mean, std = cv2.meanStdDev(gray)
+        alpha = cls._NORM_STD / max(float(std[0, 0]), 1.0)
+        return cv2.convertScaleAbs(gray, alpha=alpha, beta=cls._NORM_MEAN - alpha * float(mean[0, 0]))
+
+    @property
+    def moving(self):
+        """棋盘疑似被移动、但还没有连续 confirm_frames 次确认时为 True。"""
+        return self._moved_count > 0
+
+    def start(self, frame, corners, cell_contours):
+        """
+        以当前画面为参考开始跟踪。
+        :param frame: 裁剪后的图像。
+        :param corners: 棋盘的四个顶点 (Pretreatment.board_corners)。
+        :param cell_contours: 九个格子的轮廓 (与 corners 在同一坐标系)。
+        :return: 找到足够的角点并开始跟踪时返回 True。
+        """
+        corners = np.asarray(corners, dtype=np.float32).reshape(-1, 1, 2)
+        # 搜索窗口: 棋盘边界框向外扩展 search_margin 像素，并限制在图像范围内
+        h, w = frame.shape[:2]
+        x, y, bw, bh = cv2.boundingRect(corners.reshape(-1, 2).astype(np.int32))
+        x0, y0 = max(x - self.search_margin, 0), max(y - self.search_margin, 0)
+        x1, y1 = min(x + bw + self.search_margin, w), min(y + bh + self.search_margin, h)
+        window = (slice(y0, y1), slice(x0, x1))
+        offset = np.array([x0, y0], dtype=np.float32)
+        gray = self._gray(frame[window])
+        corners = corners - offset
+
+        # 只在棋盘区域内 (向外扩展一些，包含棋盘的四个外角) 选取角点
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        cv2.fillConvexPoly(mask, corners.reshape(-1, 2).astype(np.int32), 255)
+        mask = cv2.dilate(mask, np.ones((15, 15), np.uint8))
+        points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 8, mask=mask)
+        if points is None or len(points) < self.min_inliers:
+            self.active = False
+            return False
+
+        self.window = window
+        self.offset = offset
+        self.ref_gray = gray
+        self.ref_points = points.astype(np.float32)
+        self.ref_corners = corners
+        self.ref_cells = [np.asarray(c, dtype=np.float32).reshape(-1, 1, 2) - offset for c in cell_contours]
+        self.homography = np.eye(3)
+        self._guess = self.ref_points.copy()
+        self.confidence = 1.0
+        self._moved_count = 0
+        self.active = True
+        return True
+
+    def update(self, frame):
+        """
+        在新的一帧中跟踪棋盘。
+        :param frame: 裁剪后的图像 (与 start() 时尺寸相同)。
+        :return: TRACK_STEADY / TRACK_MOVED / TRACK_LOST。
+        """
+        if not self.active:
+            return TRACK_LOST
+        gray = self._gray(frame[self.window])
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.ref_gray, gray, self.ref_points, self._guess.copy(),
+            winSize=(21, 21), maxLevel=3, flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+        good = status.ravel() == 1
+        if np.count_nonzero(good) < self.min_inliers:
+            self.confidence = 0.0
+            self._moved_count = 0
+            return TRACK_LOST
+
+        H, inliers = cv2.findHomography(self.ref_points[good], next_points[good],
+                                        cv2.RANSAC, self.reproj_threshold)
+        if H is None:
+            self.confidence = 0.0
+            self._moved_count = 0
+            return TRACK_LOST
+        inlier_count = int(inliers.sum())
+        self.confidence = inlier_count / len(self.ref_points)
+        if inlier_count < self.min_inliers or self.confidence < self.min_inlier_ratio:
+            self._moved_count = 0
+            return TRACK_LOST
+
+        # 被遮挡的角点也用单应矩阵预测位置，作为下一帧光流的初始值
+        self._guess = cv2.perspectiveTransform(self.ref_points, H).astype(np.float32)
+
+        # 顶点移动足够大、并且连续 confirm_frames 次如此时才采用新的单应矩阵
+        old_corners = cv2.perspectiveTransform(self.ref_corners, self.homography)
+        new_corners = cv2.perspectiveTransform(self.ref_corners, H)
+        if np.max(np.linalg.norm(new_corners - old_corners, axis=2)) < self.min_shift:
+            self._moved_count = 0
+            return TRACK_STEADY
+        self._moved_count += 1
+        if self._moved_count < self.confirm_frames:
+            return TRACK_STEADY
+        self._moved_count = 0
+        self.homography = H
+        return TRACK_MOVED
+
+    def corners(self):
+        """返回当前的棋盘四个顶点 (int32，形状为 (4, 2))。"""
+        corners = cv2.perspectiveTransform(self.ref_corners, self.homography) + self.offset
+        return np.round(corners).astype(np.int32).reshape(-1, 2)
+
+    def cell_contours(self):
+        """返回按当前单应矩阵变换后的九个格子轮廓 (int32，形状为 (N, 2))，顺序与 start() 时相同。"""
+        return [np.round(cv2.perspectiveTransform(cell, self.homography) + self.offset).astype(np.int32).reshape(-1, 2)
+                for cell in self.ref_cells]
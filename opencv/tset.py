@@ -1,7 +1,13 @@
 import cv2
 import numpy as np
+import os
+import sys
 import pretreatment
 
+# 三子棋的规则和完美对弈引擎位于仓库的 "三子棋测试" 目录中
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "三子棋测试", "三子棋测试"))
+import tictactoe
+
 # --- 状态常量定义 ---
 # 用于表示棋盘格子的不同状态
 EMPTY = 0   # 格子为空
@@ -341,25 +347,41 @@ class ChessDetector:
 
         return frame
 
-# 以下函数需要您根据实际情况实现
-def get_robot_move():
+def get_robot_move(board_state):
     """
     机器人决策函数，决定下一步棋应该走在哪里。
 
-    【注意】: 这是一个占位符实现。在实际应用中，这里应该被替换为
-    一个真正的游戏AI，例如基于Minimax算法或更高级的策略。
+    使用 tictactoe.get_perfect_move 完美对弈引擎: 整棵博弈树在第一次调用时
+    解完并缓存，之后每一步都只是一次查表，机器人不会输棋。
+
+    Args:
+        board_state (list): 长度为9的棋盘状态列表 (EMPTY / HUMAN / ROBOT / MOVED)。
 
     Returns:
-        int: 机器人选择的落子位置索引 (0-8)。
+        int: 机器人选择的落子位置索引 (0-8)；棋局已结束时返回 None。
     """
-    # 示例: 总是返回棋盘的中心位置(4)。
-    return 4  # 返回中间位置
+    # 把检测器的状态转换为 tictactoe 的 3x3 棋盘: 人类为 PLAYER，机器人为 COMPUTER
+    # 被移动的棋子颜色未知，按人类棋子处理
+    symbols = {EMPTY: tictactoe.EMPTY, HUMAN: tictactoe.PLAYER,
+               ROBOT: tictactoe.COMPUTER, MOVED: tictactoe.PLAYER}
+    board = [[symbols[board_state[r * 3 + c]] for c in range(3)] for r in range(3)]
+    move = tictactoe.get_perfect_move(board, tictactoe.COMPUTER)
+    if move is None:
+        return None
+    return move[0] * 3 + move[1]
 
 # 主循环使用示例
 # --- 主程序入口 ---
 if __name__ == "__main__":
-    # 打开默认的摄像头
-    cap = cv2.VideoCapture(0)
+    import argparse
+    import camera
+
+    parser = argparse.ArgumentParser(description="井字棋棋盘状态检测示例")
+    parser.add_argument("--source", default="0",
+                        help="画面源: 摄像头索引 (默认0)、视频文件路径或图片文件夹路径")
+    args = parser.parse_args()
+    # 打开画面源，默认为默认的摄像头
+    cap = camera.open_source(args.source, threaded=False)
     
     # 初始化棋盘预处理对象，用于寻找棋盘格
     pretreatment_obj = pretreatment.Pretreatment(cap, x_ratio=0.5, y_ratio=1)
@@ -414,9 +436,10 @@ if __name__ == "__main__":
                     # 在此添加犯规处理逻辑
                 else:
                     # 如果人类正常落子，则轮到机器人决策
-                    robot_move = get_robot_move()  # 调用AI决策函数
-                    target_pos = detector.get_grid_center(robot_move)
-                    print(f"机械臂决策落子于: {robot_move}, 坐标: {target_pos}")
+                    robot_move = get_robot_move(detector.current_state)  # 调用AI决策函数
+                    if robot_move is not None:
+                        target_pos = detector.get_grid_center(robot_move)
+                        print(f"机械臂决策落子于: {robot_move}, 坐标: {target_pos}")
                     # 在这里添加代码，将目标坐标发送给机械臂的控制程序
             
             # 将所有检测信息可视化到当前帧上
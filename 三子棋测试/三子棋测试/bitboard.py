@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# 三子棋的位棋盘 (bitboard) 表示。
+# 每一方的棋子用一个9位整数表示，格子 (r, c) 对应第 r*3+c 位:
+#   第0位 | 第1位 | 第2位
+#   第3位 | 第4位 | 第5位
+#   第6位 | 第7位 | 第8位
+# 胜负判断只需要8次按位与，合法着法就是两方棋子按位或之后取反，
+# 落子/撤销只是一次异或，不需要复制棋盘。
+
+# 两方在 BitBoard.bits 中的下标
+SIDE_PLAYER = 0    # 玩家 / 人类
+SIDE_COMPUTER = 1  # 电脑 / 机器人
+
+# 9个格子全部占满时的掩码
+FULL_MASK = 0b111111111
+
+# 8条能连成一线的掩码 (3行、3列、2条对角线)
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # 行
+    0b001001001, 0b010010010, 0b100100100,  # 列
+    0b100010001, 0b001010100,               # 对角线
+)
+
+# 0-511 每个数中1的个数，用于快速统计棋子数
+POPCOUNT = tuple(bin(i).count("1") for i in range(FULL_MASK + 1))
+
+
+def has_line(bits):
+    """判断一方的棋子 (9位整数) 是否已经连成一线。"""
+    for mask in WIN_MASKS:
+        if bits & mask == mask:
+            return True
+    return False
+
+
+def iter_bits(mask):
+    """按从低到高的顺序依次返回 mask 中为1的位的编号 (0-8)。"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitBoard:
+    """
+    位棋盘: 用两个9位整数分别记录玩家和电脑的棋子。
+
+    快速使用:
+    1. `bb = BitBoard.from_board(board)` 从 tictactoe 的 board[r][c] 棋盘转换
+       或 `bb = BitBoard.from_state(detector.current_state)` 从 ChessDetector 的状态列表转换
+    2. `bb.make(4, SIDE_COMPUTER)` 落子，`bb.unmake(4, SIDE_COMPUTER)` 撤销
+    3. `bb.is_win(SIDE_PLAYER)`、`bb.is_full()`、`bb.legal_moves()` 判断局面
+    """
+    __slots__ = ("bits",)
+
+    def __init__(self, player_bits=0, computer_bits=0):
+        # bits[SIDE_PLAYER] 为玩家的棋子，bits[SIDE_COMPUTER] 为电脑的棋子
+        self.bits = [player_bits, computer_bits]
+
+    # --- 基本操作 ---
+    def make(self, idx, side):
+        """在格子 idx (0-8) 上为 side 落子。调用方需保证该格子为空。"""
+        self.bits[side] ^= 1 << idx
+
+    def unmake(self, idx, side):
+        """撤销 side 在格子 idx 上的落子。"""
+        self.bits[side] ^= 1 << idx
+
+    def occupied(self):
+        """返回所有已被占据的格子的掩码。"""
+        return self.bits[0] | self.bits[1]
+
+    def legal_moves(self):
+        """返回所有空格子的掩码，每一位代表一个可落子的位置。"""
+        return ~(self.bits[0] | self.bits[1]) & FULL_MASK
+
+    def is_win(self, side):
+        """判断 side 是否已经连成一线。"""
+        return has_line(self.bits[side])
+
+    def is_full(self):
+        """判断棋盘是否已满。"""
+        return (self.bits[0] | self.bits[1]) == FULL_MASK
+
+    def empty_count(self):
+        """返回空格子的数量。"""
+        return 9 - POPCOUNT[self.bits[0] | self.bits[1]]
+
+    def key(self):
+        """返回唯一标识该局面的18位整数: 低9位为玩家，高9位为电脑。"""
+        return self.bits[0] | (self.bits[1] << 9)
+
+    def copy(self):
+        return BitBoard(self.bits[0], self.bits[1])
+
+    def __eq__(self, other):
+        return isinstance(other, BitBoard) and self.bits == other.bits
+
+    def __hash__(self):
+        return self.key()
+
+    def __repr__(self):
+        return f"BitBoard(player={self.bits[0]:09b}, computer={self.bits[1]:09b})"
+
+    # --- 与其他棋盘表示之间的转换 ---
+    @classmethod
+    def from_board(cls, board, player='X', computer='O'):
+        """
+        从 tictactoe.py 的 3x3 列表棋盘 board[r][c] 转换。
+        :param player: 玩家棋子的字符，默认与 tictactoe.PLAYER 相同。
+        :param computer: 电脑棋子的字符，默认与 tictactoe.COMPUTER 相同。
+        """
+        player_bits = computer_bits = 0
+        for r in range(3):
+            for c in range(3):
+                if board[r][c] == player:
+                    player_bits |= 1 << (r * 3 + c)
+                elif board[r][c] == computer:
+                    computer_bits |= 1 << (r * 3 + c)
+        return cls(player_bits, computer_bits)
+
+    def to_board(self, player='X', computer='O', empty=' '):
+        """转换为 tictactoe.py 的 3x3 列表棋盘。"""
+        board = [[empty] * 3 for _ in range(3)]
+        for idx in iter_bits(self.bits[0]):
+            board[idx // 3][idx % 3] = player
+        for idx in iter_bits(self.bits[1]):
+            board[idx // 3][idx % 3] = computer
+        return board
+
+    @classmethod
+    def from_state(cls, state, human=2, robot=3):
+        """
+        从 ChessDetector 的长度为9的状态列表转换。
+        人类棋子记为玩家，机器人棋子记为电脑；其他状态 (空、颜色未知的 OCCUPIED 等) 视为空格。
+        :param human: 状态列表中表示人类棋子的值，默认与 ChessDetector.HUMAN 相同。
+        :param robot: 状态列表中表示机器人棋子的值，默认与 ChessDetector.ROBOT 相同。
+        """
+        player_bits = computer_bits = 0
+        for idx, value in enumerate(state):
+            if value == human:
+                player_bits |= 1 << idx
+            elif value == robot:
+                computer_bits |= 1 << idx
+        return cls(player_bits, computer_bits)
+
+    def to_state(self, empty=0, human=2, robot=3):
+        """转换为 ChessDetector 的长度为9的状态列表。"""
+        state = [empty] * 9
+        for idx in iter_bits(self.bits[0]):
+            state[idx] = human
+        for idx in iter_bits(self.bits[1]):
+            state[idx] = robot
+        return state
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+# 三子棋开局库 (着法表)
+#
+# 把 tictactoe.py 完美对弈引擎解出的"每个局面的最佳着法"按棋盘的8种对称
+# (4种旋转 × 是否镜像) 归并到规范形式，只保存规范局面的最佳着法，
+# 写成一个紧凑的二进制文件。运行时用 mmap 映射该文件，
+# 查询只需: 求规范形式 (8次查表) + 在几百个条目中二分查找，不做任何搜索。
+#
+# 文件格式 (小端序):
+#   4字节  魔数 b"TTTB"
+#   2字节  版本号
+#   2字节  条目数 N
+#   N × 4字节 条目，按局面键从小到大排序
+#       每个条目 = (规范局面键 << 4) | 最佳着法 (0-8)
+#       局面键 = (轮到下棋一方的棋子 << 9) | 对手的棋子，见 tictactoe.encode_board
+
+import mmap
+import os
+import struct
+
+from bitboard import FULL_MASK, SIDE_COMPUTER, SIDE_PLAYER, BitBoard, has_line
+import tictactoe
+
+BOOK_MAGIC = b"TTTB"
+BOOK_VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+_ENTRY = struct.Struct("<I")
+
+# 默认的开局库文件，与本模块放在同一目录下
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+# --- 棋盘的8种对称变换 ---
+# 每种变换用一个排列表示: 变换后第 i 个格子的内容来自变换前的第 perm[i] 个格子
+def _rotate(perm):
+    """顺时针旋转90度。"""
+    return tuple(perm[(2 - c) * 3 + r] for r in range(3) for c in range(3))
+
+def _mirror(perm):
+    """左右镜像。"""
+    return tuple(perm[r * 3 + (2 - c)] for r in range(3) for c in range(3))
+
+def _build_symmetries():
+    symmetries = []
+    perm = tuple(range(9))
+    for _ in range(4):
+        symmetries.append(perm)
+        symmetries.append(_mirror(perm))
+        perm = _rotate(perm)
+    return symmetries
+
+SYMMETRIES = _build_symmetries()
+
+# 每种变换对所有 512 种9位棋子掩码的变换结果，变换一方的棋子只需一次查表
+_BIT_TABLES = []
+for _perm in SYMMETRIES:
+    _table = []
+    for _bits in range(FULL_MASK + 1):
+        _out = 0
+        for _dst, _src in enumerate(_perm):
+            if _bits & (1 << _src):
+                _out |= 1 << _dst
+        _table.append(_out)
+    _BIT_TABLES.append(tuple(_table))
+del _perm, _table, _bits, _out, _dst, _src
+
+
+def canonicalize(me, opp):
+    """
+    求局面在8种对称变换下的规范形式 (局面键最小的那一个)。
+    参数:
+        me: 轮到下棋一方的棋子 (9位整数)。
+        opp: 对手的棋子 (9位整数)。
+    返回:
+        tuple: (规范局面键, 所用变换的编号)。
+    """
+    best_key, best_sym = None, 0
+    for sym, table in enumerate(_BIT_TABLES):
+        key = (table[me] << 9) | table[opp]
+        if best_key is None or key < best_key:
+            best_key, best_sym = key, sym
+    return best_key, best_sym
+
+
+def build_entries():
+    """
+    使用完美对弈引擎生成开局库的全部条目。
+    返回:
+        list: 按局面键排序的条目列表，每个条目为 (规范局面键 << 4) | 最佳着法。
+    """
+    tictactoe.solve_all()
+    book = {}
+    for key, move in tictactoe._best_move_table.items():
+        me, opp = key >> 9, key & FULL_MASK
+        canonical_key, sym = canonicalize(me, opp)
+        if canonical_key in book:
+            continue
+        # 把着法从原局面变换到规范局面: 规范局面的第 i 格来自原局面的第 perm[i] 格
+        book[canonical_key] = SYMMETRIES[sym].index(move)
+    return [(key << 4) | move for key, move in sorted(book.items())]
+
+
+def build_book(path=DEFAULT_BOOK_PATH):
+    """
+    生成开局库并写入二进制文件。
+    返回:
+        int: 写入的条目数量。
+    """
+    entries = build_entries()
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, len(entries)))
+        for entry in entries:
+            f.write(_ENTRY.pack(entry))
+    return len(entries)
+
+
+def export_c_header(path, entries=None):
+    """
+    把开局库导出为C头文件，供 STM32 端 (32/System/tictactoe) 直接查表使用。
+    数组按局面键排序，C 端求出规范局面键后做二分查找即可，编码方式与本文件开头的说明相同。
+    """
+    if entries is None:
+        entries = build_entries()
+    lines = [
+        "// 由 opening_book.py 自动生成，请勿手动修改",
+        "// 每个条目 = (规范局面键 << 4) | 最佳着法(0-8)，按局面键从小到大排序",
+        "// 局面键 = (轮到下棋一方的棋子掩码 << 9) | 对手的棋子掩码，格子(r, c)对应第 r*3+c 位",
+        "#pragma once",
+        "#include <stdint.h>",
+        "",
+        f"#define TTT_BOOK_SIZE {len(entries)}",
+        "static const uint32_t TTT_BOOK[TTT_BOOK_SIZE] = {",
+    ]
+    for i in range(0, len(entries), 8):
+        lines.append("    " + ", ".join(f"0x{entry:06X}" for entry in entries[i:i + 8]) + ",")
+    lines.append("};")
+    lines.append("")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+class OpeningBook:
+    """
+    用 mmap 映射开局库文件并提供查询。
+
+    快速使用:
+    1. `book = OpeningBook.load_or_build()` (文件不存在时自动生成)
+    2. `book.best_move(me, opp)` 位棋盘查询，或
+       `book.best_move_for_state(detector.board_colors)` 直接用 ChessDetector 的状态列表查询
+    """
+    def __init__(self, path=DEFAULT_BOOK_PATH):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._map, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f"开局库文件格式不正确: {path}")
+        self.size = count
+
+    @classmethod
+    def load_or_build(cls, path=DEFAULT_BOOK_PATH):
+        """加载开局库；文件不存在或格式不正确时重新生成。"""
+        try:
+            return cls(path)
+        except (OSError, ValueError):
+            build_book(path)
+            return cls(path)
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._map, _HEADER.size + i * _ENTRY.size)[0]
+
+    def best_move(self, me, opp):
+        """
+        查询最佳着法。
+        参数:
+            me: 轮到下棋一方的棋子 (9位整数)。
+            opp: 对手的棋子 (9位整数)。
+        返回:
+            int: 最佳落子的格子编号 (0-8)；只有棋局已结束 (一方连成一线或棋盘已满) 时返回 None。
+                 局面不在库中 (例如漏识别了一颗棋子，或同一方连续落子) 时用完美对弈引擎现场求解。
+        """
+        if has_line(me) or has_line(opp) or (me | opp) == FULL_MASK:
+            return None
+        canonical_key, sym = canonicalize(me, opp)
+        # 在排序好的条目中二分查找
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            key = entry >> 4
+            if key < canonical_key:
+                lo = mid + 1
+            elif key > canonical_key:
+                hi = mid
+            else:
+                # 把规范局面中的着法变换回原局面
+                return SYMMETRIES[sym][entry & 0xF]
+        # 开局库只包含从空棋盘正常轮流落子能到达的局面
+        return tictactoe.best_move_bits(me, opp)
+
+    def best_move_for_state(self, state, human=2, robot=3):
+        """
+        用 ChessDetector 的长度为9的状态列表查询机器人的最佳着法。
+        :param human: 状态列表中表示人类棋子的值，默认与 ChessDetector.HUMAN 相同。
+        :param robot: 状态列表中表示机器人棋子的值，默认与 ChessDetector.ROBOT 相同。
+        :return: 机器人最佳落子的格子编号 (0-8)，棋局已结束时返回 None。
+        """
+        bb = BitBoard.from_state(state, human=human, robot=robot)
+        return self.best_move(bb.bits[SIDE_COMPUTER], bb.bits[SIDE_PLAYER])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+if __name__ == "__main__":
+    count = build_book()
+    print(f"开局库已生成: {DEFAULT_BOOK_PATH}，共 {count} 个规范局面，"
+          f"文件大小 {os.path.getsize(DEFAULT_BOOK_PATH)} 字节")
+    header_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.h")
+    export_c_header(header_path)
+    print(f"C头文件已导出: {header_path}")
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+# 三子棋批量自对弈与吞吐量测试
+#
+# 让不同的下棋策略 (tictactoe.get_computer_move 的启发式策略、随机落子、完美对弈引擎、
+# 开局库等) 两两对弈大量棋局，统计:
+#   - 每组对局的 胜/平/负 表 (先手方视角)
+#   - 对弈速度 (局/秒)
+#   - 每个策略单步决策耗时的分位数 (p50 / p95 / p99 / max)
+# 对局分块后交给 multiprocessing 进程池并行执行。
+# 用于在修改策略后做回归测试，并确认走棋引擎不会成为机器人运行时的瓶颈。
+#
+# 用法示例:
+#   python selfplay.py --games 1000000
+#   python selfplay.py --players heuristic perfect --games 200000 --workers 4
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import time
+
+from bitboard import BitBoard, SIDE_PLAYER, SIDE_COMPUTER, has_line
+import tictactoe
+from tictactoe import PLAYER, COMPUTER, EMPTY
+
+# --- 下棋策略 ---
+# 每个策略都是一个函数 move(board, me, rng)，返回落子坐标 (row, col)
+#   board: tictactoe 的 3x3 列表棋盘 (不要修改它)
+#   me: 本方的棋子字符 (PLAYER 或 COMPUTER)
+#   rng: 本进程的 random.Random 实例，需要随机性的策略使用它，保证结果可复现
+
+def _swap_sides(board):
+    """交换棋盘上 PLAYER 与 COMPUTER 的棋子，用于让只会下 COMPUTER 一方的策略执 PLAYER。"""
+    swap = {PLAYER: COMPUTER, COMPUTER: PLAYER, EMPTY: EMPTY}
+    return [[swap[cell] for cell in row] for row in board]
+
+def heuristic_move(board, me, rng):
+    """tictactoe.get_computer_move 的启发式策略。"""
+    if me == COMPUTER:
+        return tictactoe.get_computer_move(board)
+    return tictactoe.get_computer_move(_swap_sides(board))
+
+def random_move(board, me, rng):
+    """在所有空格中随机选择一个。"""
+    empties = [(r, c) for r in range(3) for c in range(3) if board[r][c] == EMPTY]
+    return rng.choice(empties)
+
+def perfect_move(board, me, rng):
+    """tictactoe 的完美对弈引擎 (negamax 解出的着法表)。"""
+    return tictactoe.get_perfect_move(board, me)
+
+# 开局库在每个进程中第一次使用时才映射，避免在进程间传递 mmap 对象
+_opening_book = None
+
+def book_move(board, me, rng):
+    """opening_book 开局库查表。"""
+    global _opening_book
+    if _opening_book is None:
+        import opening_book
+        _opening_book = opening_book.OpeningBook.load_or_build()
+    bb = BitBoard.from_board(board, PLAYER, COMPUTER)
+    if me == COMPUTER:
+        move = _opening_book.best_move(bb.bits[SIDE_COMPUTER], bb.bits[SIDE_PLAYER])
+    else:
+        move = _opening_book.best_move(bb.bits[SIDE_PLAYER], bb.bits[SIDE_COMPUTER])
+    return divmod(move, 3)
+
+# 所有可参与对弈的策略，新的引擎只需在这里注册一个名字
+PLAYERS = {
+    "heuristic": heuristic_move,
+    "random": random_move,
+    "perfect": perfect_move,
+    "book": book_move,
+}
+
+# --- 决策耗时直方图 ---
+# 几百万步的耗时不能逐个保存，改为记录到固定的对数分桶中:
+# 第 k 个桶统计耗时在 [GROWTH^k, GROWTH^(k+1)) 纳秒之间的步数，相对误差不超过5%。
+LATENCY_GROWTH = 1.05
+LATENCY_BUCKETS = 450  # 1.05^450 纳秒约为 3.5 秒，更慢的步数计入最后一个桶
+_LOG_GROWTH = math.log(LATENCY_GROWTH)
+
+def _latency_bucket(ns):
+    if ns <= 1:
+        return 0
+    return min(int(math.log(ns) / _LOG_GROWTH), LATENCY_BUCKETS - 1)
+
+def latency_percentiles(histogram, percents=(50, 95, 99)):
+    """
+    根据直方图计算耗时分位数。
+    返回:
+        dict: 分位数 -> 耗时 (微秒)，取所在桶的上边界；没有数据时返回空字典。
+    """
+    total = sum(histogram)
+    if total == 0:
+        return {}
+    result = {}
+    for p in percents:
+        target = math.ceil(total * p / 100)
+        running = 0
+        for k, count in enumerate(histogram):
+            running += count
+            if running >= target:
+                result[p] = LATENCY_GROWTH ** (k + 1) / 1000.0
+                break
+    return result
+
+# --- 对局 ---
+def play_game(first, second, rng, histograms=None):
+    """
+    下一整局棋，先手执 PLAYER，后手执 COMPUTER。
+    参数:
+        first / second: 先手和后手的策略名称 (PLAYERS 中的键)。
+        rng: random.Random 实例。
+        histograms: 可选，{策略名称: 直方图列表}，用于记录每一步的决策耗时。
+    返回:
+        int: 1 表示先手胜，0 表示平局，-1 表示后手胜。
+    异常:
+        ValueError: 策略给出了不合法的落子 (越界、落在已有棋子的格子上或没有返回着法)。
+    """
+    board = tictactoe.init_board()
+    bb = BitBoard()
+    seats = ((first, PLAYERS[first], PLAYER, SIDE_PLAYER),
+             (second, PLAYERS[second], COMPUTER, SIDE_COMPUTER))
+    for turn in range(9):
+        name, move_fn, mark, side = seats[turn & 1]
+        start = time.perf_counter_ns()
+        move = move_fn(board, mark, rng)
+        elapsed = time.perf_counter_ns() - start
+        if histograms is not None:
+            histograms[name][_latency_bucket(elapsed)] += 1
+
+        if move is None or not tictactoe.is_move_valid(board, move[0], move[1]):
+            raise ValueError(f"策略 {name} 给出了不合法的落子: {move}")
+        board[move[0]][move[1]] = mark
+        bb.make(move[0] * 3 + move[1], side)
+        if has_line(bb.bits[side]):
+            return 1 if side == SIDE_PLAYER else -1
+    return 0
+
+def _run_batch(task):
+    """
+    (进程池任务) 连续下 games 局 first 对 second 的棋。
+    返回:
+        tuple: (first, second, [先手胜, 平局, 后手胜], {策略名称: 直方图}, 用时秒数)
+    """
+    first, second, games, seed = task
+    rng = random.Random(seed)
+    histograms = {first: [0] * LATENCY_BUCKETS, second: [0] * LATENCY_BUCKETS}
+    results = [0, 0, 0]
+    start = time.perf_counter()
+    for _ in range(games):
+        outcome = play_game(first, second, rng, histograms)
+        results[1 - outcome] += 1
+    return first, second, results, histograms, time.perf_counter() - start
+
+def _worker_init():
+    # 在每个进程中预先解完博弈树，避免把建表时间算进第一批对局的决策耗时
+    tictactoe.solve_all()
+
+def run_selfplay(players, games, workers=None, chunk_size=2000, seed=0):
+    """
+    让 players 中的策略两两对弈 (包括与自己对弈，两种先后手都下)。
+    参数:
+        players: 策略名称列表。
+        games: 每组对局 (有序的一对策略) 的局数。
+        workers: 进程数，默认为 CPU 核数。
+        chunk_size: 每个进程池任务包含的局数。
+        seed: 随机种子，相同的种子得到相同的 胜/平/负 结果。
+    返回:
+        dict: 汇总结果，见 print_report。
+    """
+    tasks = []
+    task_seed = seed
+    for first in players:
+        for second in players:
+            remaining = games
+            while remaining > 0:
+                n = min(chunk_size, remaining)
+                tasks.append((first, second, n, task_seed))
+                task_seed += 1
+                remaining -= n
+
+    results = {}
+    histograms = {name: [0] * LATENCY_BUCKETS for name in players}
+    cpu_seconds = 0.0
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_worker_init) as pool:
+        for first, second, counts, hists, elapsed in pool.imap_unordered(_run_batch, tasks):
+            total = results.setdefault((first, second), [0, 0, 0])
+            for i in range(3):
+                total[i] += counts[i]
+            for name, hist in hists.items():
+                merged = histograms[name]
+                for k, count in enumerate(hist):
+                    merged[k] += count
+            cpu_seconds += elapsed
+    wall_seconds = time.perf_counter() - start
+
+    return {
+        "players": list(players),
+        "results": results,
+        "histograms": histograms,
+        "games": games * len(players) ** 2,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": cpu_seconds,
+    }
+
+def print_report(report):
+    """打印 胜/平/负 表、对弈速度和决策耗时分位数。"""
+    players = report["players"]
+    width = max(len(name) for name in players) + 2
+
+    print("\n--- 胜/平/负 (行为先手，列为后手，先手视角) ---")
+    print(" " * width + "".join(f"{name:>24}" for name in players))
+    for first in players:
+        row = f"{first:<{width}}"
+        for second in players:
+            win, draw, loss = report["results"][(first, second)]
+            row += f"{f'{win}/{draw}/{loss}':>24}"
+        print(row)
+
+    games = report["games"]
+    wall = report["wall_seconds"]
+    print(f"\n共 {games} 局，用时 {wall:.2f} 秒，{games / wall:.0f} 局/秒"
+          f" (单进程 {games / report['cpu_seconds']:.0f} 局/秒)")
+
+    print("\n--- 单步决策耗时 (微秒) ---")
+    print(f"{'策略':<{width}}{'步数':>12}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in players:
+        hist = report["histograms"][name]
+        pct = latency_percentiles(hist, (50, 95, 99, 100))
+        if not pct:
+            continue
+        print(f"{name:<{width}}{sum(hist):>12}{pct[50]:>10.1f}{pct[95]:>10.1f}"
+              f"{pct[99]:>10.1f}{pct[100]:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="三子棋批量自对弈与吞吐量测试")
+    parser.add_argument("--players", nargs="+", choices=sorted(PLAYERS),
+                        default=["heuristic", "random", "perfect"],
+                        help="参与对弈的策略")
+    parser.add_argument("--games", type=int, default=100000, help="每组对局的局数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="每个进程池任务的局数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"策略: {', '.join(args.players)}，每组 {args.games} 局，{args.workers} 个进程")
+    report = run_selfplay(args.players, args.games, args.workers, args.chunk_size, args.seed)
+    print_report(report)
+
+# 使用 multiprocessing 时 (尤其是在 Windows 上) 必须放在 __main__ 保护之下
+if __name__ == "__main__":
+    main()
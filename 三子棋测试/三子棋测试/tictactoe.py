@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from bitboard import (BitBoard, SIDE_PLAYER, SIDE_COMPUTER, FULL_MASK, POPCOUNT,
+                      has_line, iter_bits)
+
 # 定义棋子常量
 PLAYER = 'X'
 COMPUTER = 'O'
@@ -135,6 +138,171 @@ def get_computer_move(board):
     
     return None # 在正常游戏中不应该到达这里
 
+# --- 完美对弈引擎 ---
+# 三子棋的全部可达局面不到6000个，可以在第一次使用时把整棵博弈树一次性解完并缓存，
+# 之后每一步只需查表，不再有任何搜索耗时。
+# 引擎内部使用 bitboard.py 中的位棋盘表示: 每一方的棋子是一个9位整数。
+# 局面的价值只取决于"轮到下棋的一方"和"对手"各自的棋子，与谁是玩家、谁是电脑无关，
+# 所以置换表和着法表都以 (己方 << 9) | 对方 为键，两种先后手共用同一张表。
+
+# 置换表中记录的分数类型
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+# 置换表: 局面键 -> (分数, 分数类型)
+_transposition_table = {}
+# 最佳着法表: 局面键 -> 最佳落子的格子编号 (0-8)，由 solve_all() 一次性填好
+_best_move_table = {}
+
+# 落子顺序: 优先搜索中心和角，能更早产生剪枝；分数相同时也按这个顺序选择着法
+_MOVE_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+_MOVE_BITS = tuple((idx, 1 << idx) for idx in _MOVE_ORDER)
+
+def encode_board(board, player=COMPUTER):
+    """
+    把 3x3 棋盘编码为一个18位整数，作为置换表和着法表的键。
+    参数:
+        player: 轮到下棋的一方，其棋子在高9位，对手的棋子在低9位。
+    返回:
+        int: 局面键。
+    """
+    bb = BitBoard.from_board(board, PLAYER, COMPUTER)
+    if player == COMPUTER:
+        return (bb.bits[SIDE_COMPUTER] << 9) | bb.bits[SIDE_PLAYER]
+    return (bb.bits[SIDE_PLAYER] << 9) | bb.bits[SIDE_COMPUTER]
+
+def _negamax(me, opp, alpha, beta):
+    """
+    带 alpha-beta 剪枝和置换表的 negamax 搜索。
+    分数站在轮到下棋的一方 (me) 来看: 赢为正、输为负、平局为0，
+    越早获胜分数越高，越晚输棋分数越高 (分数 = ±(剩余空格数 + 1))。
+    参数:
+        me: 轮到下棋一方的棋子 (9位整数)。
+        opp: 对手的棋子 (9位整数)。
+    返回:
+        int: 局面分数。以全窗口 (-100, 100) 调用时为精确值。
+    """
+    occupied = me | opp
+    empties = 9 - POPCOUNT[occupied]
+    # 上一步落子的是对手，如果对手已经连成一线，当前方已经输了
+    if has_line(opp):
+        return -(empties + 1)
+    if empties == 0:
+        return 0
+
+    key = (me << 9) | opp
+    alpha_orig = alpha
+    entry = _transposition_table.get(key)
+    if entry is not None:
+        score, flag = entry
+        if flag == _EXACT:
+            return score
+        if flag == _LOWER:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
+        if alpha >= beta:
+            return score
+
+    best_score = -100
+    for _, bit in _MOVE_BITS:
+        if occupied & bit:
+            continue
+        # 落子后轮到对手，双方角色互换
+        score = -_negamax(opp, me | bit, -beta, -alpha)
+        best_score = max(best_score, score)
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+
+    # 按照本次搜索窗口记录分数的类型
+    if best_score <= alpha_orig:
+        flag = _UPPER
+    elif best_score >= beta:
+        flag = _LOWER
+    else:
+        flag = _EXACT
+    _transposition_table[key] = (best_score, flag)
+    return best_score
+
+def _search_best_move(me, opp):
+    """
+    对每个可落子的位置做全窗口搜索，得到精确分数后选出最佳着法。
+    (剪枝得到的只是分数的上下界，不能直接用来比较着法的好坏。)
+    返回:
+        int: 最佳落子的格子编号 (0-8)。
+    """
+    occupied = me | opp
+    best_score, best_move = -100, None
+    for idx, bit in _MOVE_BITS:
+        if occupied & bit:
+            continue
+        score = -_negamax(opp, me | bit, -100, 100)
+        if score > best_score:
+            best_score, best_move = score, idx
+    return best_move
+
+def solve_all():
+    """
+    从空棋盘出发遍历所有可达局面，求出每个局面的最佳着法并存入缓存。
+    由于表以"轮到下棋的一方"为视角，玩家先手和电脑先手的局面都包含在内。
+    只需调用一次，重复调用不会重复计算。
+    返回:
+        int: 已缓存最佳着法的局面数量。
+    """
+    if _best_move_table:
+        return len(_best_move_table)
+
+    def visit(me, opp):
+        key = (me << 9) | opp
+        if key in _best_move_table:
+            return
+        if has_line(opp) or (me | opp) == FULL_MASK:
+            return
+        _best_move_table[key] = _search_best_move(me, opp)
+        free = ~(me | opp) & FULL_MASK
+        for idx in iter_bits(free):
+            visit(opp, me | (1 << idx))
+
+    visit(0, 0)
+    return len(_best_move_table)
+
+def best_move_bits(me, opp):
+    """
+    位棋盘版本的查表接口。
+    参数:
+        me: 轮到下棋一方的棋子 (9位整数)。
+        opp: 对手的棋子 (9位整数)。
+    返回:
+        int: 最佳落子的格子编号 (0-8)；棋局已结束时返回 None。
+    """
+    solve_all()
+    move = _best_move_table.get((me << 9) | opp)
+    if move is None:
+        # 不可达的局面 (例如棋盘是人为摆出来的) 不在表中，现场搜索一次
+        if has_line(me) or has_line(opp) or (me | opp) == FULL_MASK:
+            return None
+        move = _search_best_move(me, opp)
+    return move
+
+def get_perfect_move(board, player=COMPUTER):
+    """
+    使用完美对弈引擎返回 player 的最佳移动。
+    第一次调用时会解完整棵博弈树，之后每次只是一次查表。
+    参数:
+        board: 3x3 棋盘。
+        player: 要落子的一方，默认为电脑。
+    返回:
+        tuple: 最佳移动坐标 (row, col)；棋局已结束时返回 None。
+    """
+    bb = BitBoard.from_board(board, PLAYER, COMPUTER)
+    if player == COMPUTER:
+        move = best_move_bits(bb.bits[SIDE_COMPUTER], bb.bits[SIDE_PLAYER])
+    else:
+        move = best_move_bits(bb.bits[SIDE_PLAYER], bb.bits[SIDE_COMPUTER])
+    if move is None:
+        return None
+    return divmod(move, 3)
+
 def main():
     """
     游戏的主函数，运行游戏循环。
@@ -157,7 +325,7 @@ def main():
             break
 
         print("轮到电脑了...")
-        move = get_computer_move(board)
+        move = get_perfect_move(board, COMPUTER)
         if move:
             board[move[0]][move[1]] = COMPUTER
             print(f"电脑下在了 ({move[0] + 1}, {move[1] + 1})")